@@ -1,30 +1,111 @@
-from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Depends, status
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Depends, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from typing import Optional, List, Dict
-from io import BytesIO
-from PIL import Image
 from datetime import datetime
-import os, json
+from PIL import UnidentifiedImageError
+import numpy as np
+import os, asyncio, itertools, threading
 
 # --- DB layer ---
 from db.queries import (
-    get_pests, get_pest_detail,
-    get_drugs, get_drugs_for_pest,
     create_user, check_login,
-    get_user, is_admin,
+    get_user,
     create_pest, add_pest_photo, create_drug, link_drug_to_pest,
+    page_pests, page_drugs, iter_pest_batches, iter_drug_batches,
+    pool_stats, warm_pool,
+)
+# đọc catalog qua cache trong RAM (tự load lại khi /admin ghi hoặc hết CATALOG_TTL)
+from db.catalog import (
+    get_pests, get_pest_detail,
+    get_drugs, get_drugs_for_pest,
+    get_catalog_for_codes, catalog_stats, catalog_version,
 )
+from db.pool import PoolTimeout
+# bản sao catalog SQLite cạnh API (CATALOG_REPLICA_PATH), ghi vẫn vào SQL Server
+from db.replica import REPLICA, replica_stats
+from db.bulk import BulkFormatError, parse_rows, bulk_import
 
 # --- ML inference ---
 from ml_infer import (
-    classify_image,
-    MODEL_PATH, LABELS_PATH,
-    reindex_static, index_info,
+    classify_arrays, IMG_SIZE,
+    LABELS_PATH, reindex_static, reindex_status, index_info,
+    switch_model, rollback_cnn, cnn_info, job_status,
+    start_warmup, is_ready, readiness, model_version,
+)
+from ml_batcher import MicroBatcher, MAX_BATCH
+from ml_workers import ML_WORKERS, InferencePool
+import ml_registry
+from pools import DECODE_POOL, DB_POOL, Saturated
+from pred_cache import PredictionCache, content_key, dhash
+from http_cache import RenderedCache, ndjson_chunks
+from sessions import (
+    AUTH_ALLOW_X_USER, AUTH_TOKEN_TTL, USERS,
+    issue_token, verify_token, revoke, revoke_user, bearer,
 )
+import metrics
+from metrics import MetricsMiddleware
+from ingest import UploadLimitMiddleware, UploadTooLarge, read_upload, decode_for_model
+
+# gom các request /classify đồng thời thành batch (CLASSIFY_MAX_BATCH / CLASSIFY_MAX_WAIT_MS)
+if ML_WORKERS > 0:
+    # ML_WORKERS process suy luận, ảnh chuyển qua shared memory; process API chỉ decode + JSON
+    infer_pool: Optional[InferencePool] = InferencePool(ML_WORKERS, max_batch=MAX_BATCH, img_size=IMG_SIZE)
+    classifier = MicroBatcher(infer_pool.run_batch, concurrency=ML_WORKERS)
+else:
+    infer_pool = None
+    classifier = MicroBatcher(lambda arrs, topks: classify_arrays(np.stack(arrs), topk=topks))
+
+def _models_ready() -> bool:
+    return infer_pool.is_ready() if infer_pool else is_ready()
+
+_last_version: List[Optional[str]] = [None]
+
+def _model_version() -> str:
+    v = infer_pool.model_version if infer_pool else model_version()
+    if v != _last_version[0]:
+        if _last_version[0] is not None:
+            metrics.VERSION_CHANGES.inc()
+        _last_version[0] = v
+    return v
+
+# cache kết quả theo sha256 ảnh upload (ảnh chuyển tiếp / app retry)
+pred_cache = PredictionCache()
 
 app = FastAPI(title="Durian Pest API")
 
+@app.on_event("startup")
+def _warm_models() -> None:
+    # load + warm model ở nền, API catalog phục vụ ngay
+    if infer_pool:
+        infer_pool.start_background()
+    else:
+        start_warmup()
+
+@app.on_event("startup")
+def _warm_db_pool() -> None:
+    # mở sẵn DB_POOL_MIN connection ở nền: request đầu không phải chờ connect, DB chậm không chặn startup
+    def run():
+        try:
+            warm_pool()
+        except Exception as e:
+            print("[db] warm pool failed:", e, flush=True)
+    threading.Thread(target=run, name="db-pool-warm", daemon=True).start()
+
+@app.on_event("startup")
+def _start_replica() -> None:
+    # đồng bộ lần đầu + định kỳ ở nền; file đã có thì phục vụ ngay
+    if REPLICA is not None:
+        REPLICA.start()
+
+@app.on_event("shutdown")
+def _stop_workers() -> None:
+    if infer_pool:
+        infer_pool.close()
+    if REPLICA is not None:
+        REPLICA.stop()
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -34,67 +115,191 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# chặn upload quá lớn ngay khi đang stream body (MAX_UPLOAD_BYTES)
+app.add_middleware(UploadLimitMiddleware)
+# ngoài cùng: đo cả request bị chặn ở các middleware trong
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(UploadTooLarge)
+def _too_large(_request, exc: UploadTooLarge) -> JSONResponse:
+    metrics.ERRORS.inc("upload_too_large")
+    return JSONResponse({"error": "upload_too_large", "limit": exc.limit},
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+@app.exception_handler(Saturated)
+def _saturated(_request, exc: Saturated) -> JSONResponse:
+    metrics.ERRORS.inc(f"{exc.stage}_saturated")
+    # hàng đợi đầy: báo client thử lại sau thay vì xếp hàng vô hạn
+    return JSONResponse(
+        {"error": "busy", "stage": exc.stage},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(PoolTimeout)
+def _db_pool_timeout(_request, exc: PoolTimeout) -> JSONResponse:
+    metrics.ERRORS.inc("db_pool_timeout")
+    # hết connection DB trong DB_POOL_TIMEOUT_S giây
+    return JSONResponse(
+        {"error": "busy", "stage": "db_conn"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
 # Static (để /static/xxx.jpg truy cập được)
 if os.path.isdir("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 # ---------- Helpers: auth qua header X-User ----------
-def current_user(x_user: Optional[str] = Header(default=None, alias="X-User")) -> Optional[str]:
-    return x_user
-
-def require_admin(x_user: Optional[str] = Header(default=None, alias="X-User")) -> str:
-    if not x_user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="X-User required")
-    if not is_admin(x_user):
+def _cached_user(username: str) -> Optional[Dict]:
+    return USERS.get(username, get_user)
+
+def _claims(authorization: Optional[str]) -> Optional[Dict]:
+    """Authorization: Bearer <token> → claims; thiếu → None, sai/hết hạn → 401"""
+    token = bearer(authorization)
+    if token is None:
+        return None
+    claims = verify_token(token)
+    if claims is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+    return claims
+
+def require_admin(
+    authorization: Optional[str] = Header(default=None),
+    x_user: Optional[str] = Header(default=None, alias="X-User"),
+) -> str:
+    # token đã ký mang sẵn quyền admin → không cần hỏi DB
+    claims = _claims(authorization)
+    if claims is not None:
+        if not claims.get("adm"):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin required")
+        return claims["sub"]
+    if not x_user or not AUTH_ALLOW_X_USER:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Bearer token or X-User required")
+    u = _cached_user(x_user)
+    if not (u and u.get("IsAdmin")):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin required")
     return x_user
 
 
 # ===================== PUBLIC APIs =====================
 
+# JSON + gzip/br render sẵn 1 lần mỗi version catalog, ETag/304 cho app poll
+catalog_responses = RenderedCache(catalog_version)
+# kết quả tìm kiếm: mỗi q 1 key, ít lặp lại → cache riêng nhỏ, nén nhanh, không đẩy danh sách chung ra khỏi cache
+search_responses = RenderedCache(catalog_version, max_items=64, gzip_level=1, br_quality=1)
+
+def _listing(rows_page, batches, limit: Optional[int], cursor: Optional[str], format: Optional[str]):
+    """?format=ndjson → stream từng dòng; ?limit/&cursor → 1 trang keyset; không có → None"""
+    if format == "ndjson":
+        # lấy connection + lô đầu trước khi gửi header: PoolTimeout → 503 thay vì body bị cụt
+        it = batches()
+        first = next(it, [])
+        return StreamingResponse(ndjson_chunks(itertools.chain([first], it)), media_type="application/x-ndjson")
+    if limit is None and not cursor:
+        return None
+    try:
+        items, next_cursor = rows_page(limit or 50, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
+
 @app.get("/pests")
-def list_pests(q: Optional[str] = None) -> Dict[str, List[Dict]]:
-    return {"items": get_pests(q)}
+def list_pests(request: Request, q: Optional[str] = None, limit: Optional[int] = None,
+               cursor: Optional[str] = None, format: Optional[str] = None):
+    if q:
+        return search_responses.respond(request, ("pests", q), lambda: {"items": get_pests(q)})
+    resp = _listing(page_pests, iter_pest_batches, limit, cursor, format)
+    if resp is not None:
+        return resp
+    return catalog_responses.respond(request, ("pests", None), lambda: {"items": get_pests()})
 
 @app.get("/pests/{code}")
-def pest_detail(code: str) -> Dict[str, object]:
-    pest = get_pest_detail(code)
-    return {"pest": pest} if pest else {"error": "not_found"}
+def pest_detail(request: Request, code: str) -> Response:
+    def build():
+        pest = get_pest_detail(code)
+        return {"pest": pest} if pest else {"error": "not_found"}
+    return catalog_responses.respond(request, ("pest", code), build)
 
 @app.get("/drugs")
-def list_drugs() -> Dict[str, List[Dict]]:
-    return {"items": get_drugs()}
+def list_drugs(request: Request, limit: Optional[int] = None,
+               cursor: Optional[str] = None, format: Optional[str] = None):
+    resp = _listing(page_drugs, iter_drug_batches, limit, cursor, format)
+    if resp is not None:
+        return resp
+    return catalog_responses.respond(request, ("drugs",), lambda: {"items": get_drugs()})
 
 @app.get("/pests/{code}/drugs")
-def pest_drugs(code: str) -> Dict[str, List[Dict]]:
-    return {"items": get_drugs_for_pest(code)}
-
-
-@app.post("/classify")
-async def classify(file: UploadFile = File(...)) -> Dict[str, List[Dict]]:
-    """
-    1) đọc ảnh từ client
-    2) đưa vào ml_infer.classify_image (ảnh static + CNN)
-    3) với mỗi dự đoán -> trả thêm detail + thuốc
-    """
-    img = Image.open(BytesIO(await file.read())).convert("RGB")
-    preds = classify_image(img, topk=3)   # [{code, prob}, ...]
-
+def pest_drugs(request: Request, code: str) -> Response:
+    return catalog_responses.respond(request, ("pest_drugs", code), lambda: {"items": get_drugs_for_pest(code)})
+
+
+def _decode_image(raw: bytes) -> np.ndarray:
+    # decode ở độ phân giải giảm (JPEG draft) + xoay EXIF + resize 1 lần
+    # ra mảng uint8 (S,S,3) dùng chung cho static + CNN
+    return decode_for_model(raw, IMG_SIZE)
+
+async def _predict(raw: bytes) -> List[Dict]:
+    """cache (sha256 → dHash) rồi mới tới decode + suy luận"""
+    version = _model_version()
+    with metrics.stage("cache"):
+        key = content_key(raw)
+        preds = pred_cache.get(key, version)
+    if preds is not None:
+        return preds
+    with metrics.stage("decode"):
+        arr = await DECODE_POOL.run(_decode_image, raw)
+    ph = None
+    if pred_cache.phash_enabled:
+        ph = dhash(arr)
+        preds = pred_cache.get_similar(ph, version)
+        if preds is not None:
+            return preds
+    pred_cache.miss()
+    with metrics.stage("infer"):
+        preds = await asyncio.wrap_future(classifier.submit(arr, topk=3))   # [{code, prob}, ...]
+    pred_cache.put(key, version, preds, ph)
+    return preds
+
+def _attach_details(preds: List[Dict]) -> List[Dict]:
+    # chi tiết + thuốc cho cả top-k trong 1 lượt truy vấn
+    catalog = get_catalog_for_codes([p["code"] for p in preds])
     results = []
     for p in preds:
         code = p["code"]
         prob = p["prob"]               # 0..1
-        detail = get_pest_detail(code)
-        drugs = get_drugs_for_pest(code)
+        entry = catalog.get(code) or {"detail": None, "drugs": []}
         results.append({
             "prediction": {
                 "code": code,
                 "prob": prob,          # Flutter tự nhân 100 và clamp 0..100
             },
-            "detail": detail,
-            "drugs": drugs,
+            "detail": entry["detail"],
+            "drugs": entry["drugs"],
         })
+    return results
+
+@app.post("/classify")
+async def classify(file: UploadFile = File(...)) -> Dict[str, List[Dict]]:
+    """
+    1) đọc ảnh từ client, giải mã trên DECODE_POOL
+    2) đưa vào hàng đợi batch -> ml_infer.classify_batch (ảnh static + CNN)
+    3) với mỗi dự đoán -> trả thêm detail + thuốc (pyodbc trên DB_POOL)
+    Không có bước nào chạy blocking trên event loop.
+    """
+    if not _models_ready():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="model warming up", headers={"Retry-After": "5"})
+    try:
+        with metrics.stage("upload_read"):
+            raw = await read_upload(file)
+        preds = await _predict(raw)
+    except UnidentifiedImageError:
+        metrics.ERRORS.inc("decode")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="not an image")
+    with metrics.stage("db"):
+        results = await DB_POOL.run(_attach_details, preds)
     return {"results": results}
 
 
@@ -106,29 +311,55 @@ def register(username: str = Form(...), password: str = Form(...)) -> Dict[str,
     return {"ok": ok}
 
 @app.post("/auth/login")
-def login(username: str = Form(...), password: str = Form(...)) -> Dict[str, bool]:
+def login(username: str = Form(...), password: str = Form(...)) -> Dict[str, object]:
     ok = check_login(username, password)
-    return {"ok": ok}
+    if not ok:
+        return {"ok": False}
+    u = _cached_user(username)
+    admin = bool(u and u.get("IsAdmin"))
+    token, _ = issue_token(username, admin)
+    return {"ok": True, "token": token, "token_type": "bearer",
+            "expires_in": AUTH_TOKEN_TTL, "is_admin": admin}
+
+@app.post("/auth/logout")
+def logout(authorization: Optional[str] = Header(default=None)) -> Dict[str, bool]:
+    claims = _claims(authorization)
+    if claims is not None:
+        revoke(claims)
+    return {"ok": True}
 
 @app.get("/auth/me")
-def me(user: Optional[str] = Depends(current_user)) -> Dict[str, object]:
+def me(authorization: Optional[str] = Header(default=None),
+       x_user: Optional[str] = Header(default=None, alias="X-User")) -> Dict[str, object]:
+    claims = _claims(authorization)
+    if claims is not None:
+        return {"username": claims["sub"], "is_admin": bool(claims.get("adm"))}
+    user = x_user if AUTH_ALLOW_X_USER else None
     if not user:
         return {"username": None, "is_admin": False}
-    u = get_user(user)
+    u = _cached_user(user)
     if not u:
         return {"username": user, "is_admin": False}
     return {"username": u["Username"], "is_admin": bool(u["IsAdmin"])}
 
 @app.get("/health")
 def health() -> Dict[str, bool]:
+    # liveness: process còn sống
     return {"ok": True}
 
+@app.get("/ready")
+def ready() -> JSONResponse:
+    # readiness: chỉ 200 khi model đã load + warm xong
+    info = infer_pool.readiness() if infer_pool else readiness()
+    code = status.HTTP_200_OK if info["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(info, status_code=code)
+
 
 # ===================== ML INFO / DEBUG =====================
 
 @app.get("/ml/info")
 def ml_info() -> Dict[str, object]:
-    def stat(path: str):
+    def stat(path: Optional[str]):
         try:
             s = os.stat(path)
             return {
@@ -139,26 +370,107 @@ def ml_info() -> Dict[str, object]:
         except Exception:
             return None
 
-    num_classes = 0
-    try:
-        with open(LABELS_PATH, "r", encoding="utf-8") as f:
-            num_classes = len(json.load(f))
-    except Exception:
-        pass
-
+    # model đang phục vụ (theo kho phiên bản nếu có, không thì models/*.h5)
+    active = (infer_pool.call("cnn_info") if infer_pool else cnn_info())["active"] or {}
+    src = None
+    if active.get("registry_version"):
+        try:
+            src = ml_registry.get_version(active["registry_version"])
+        except (KeyError, ValueError):
+            pass
     return {
-        "model": stat(MODEL_PATH),
-        "labels": stat(LABELS_PATH),
-        "num_classes": num_classes
+        "model": stat(src.model_path if src else active.get("source")),
+        "labels": stat(src.labels_path if src else (LABELS_PATH if active.get("source") else None)),
+        "num_classes": active.get("classes", 0),
+        "version": active.get("registry_version"),
+        "registry_current": ml_registry.current_version(),
     }
 
 @app.get("/ml/index")
 def ml_index() -> Dict[str, object]:
-    return index_info()
+    return infer_pool.call("index_info") if infer_pool else index_info()
+
+@app.get("/ml/batch")
+def ml_batch() -> Dict[str, object]:
+    return classifier.stats()
+
+@app.get("/ml/cache")
+def ml_cache() -> Dict[str, object]:
+    return pred_cache.stats()
+
+# ---- giá trị đọc lúc scrape /metrics ----
+metrics.Gauge("saurieng_model_info", "model_version đang phục vụ (index_id/CNN_VERSION)", ("model_version",),
+              fn=lambda: [((_model_version(),), 1)])
+metrics.Gauge("saurieng_ready", "1 khi model đã load + warm xong",
+              fn=lambda: [((), int(_models_ready()))])
+metrics.Gauge("saurieng_queue_depth", "Số việc đang chờ theo stage", ("stage",),
+              fn=lambda: [(("decode",), DECODE_POOL.stats()["pending"]),
+                          (("infer",), classifier.stats()["queue_depth"]),
+                          (("db",), DB_POOL.stats()["pending"])])
+metrics.CounterFunc("saurieng_pred_cache_total", "Tra cache kết quả /classify", ("result",),
+                    fn=lambda: [((k,), v) for k, v in pred_cache.stats().items()
+                                if k in ("hits", "phash_hits", "misses")])
+metrics.Gauge("saurieng_db_connections", "Connection SQL Server trong pool", ("state",),
+              fn=lambda: [((k,), pool_stats()[k]) for k in ("in_use", "idle")])
+metrics.Gauge("saurieng_catalog_version", "Version cache catalog (tăng mỗi lần load lại)",
+              fn=lambda: [((), catalog_stats()["version"] or 0)])
+
+@app.get("/metrics")
+def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/ml/pools")
+def ml_pools() -> Dict[str, object]:
+    # thời gian chờ queue theo từng stage của /classify
+    return {
+        "decode": DECODE_POOL.stats(),
+        "infer": classifier.stats(),
+        "db": DB_POOL.stats(),
+        "db_conn": pool_stats(),
+    }
+
+@app.get("/db/pool")
+def db_pool() -> Dict[str, object]:
+    # pool connection SQL Server: size / idle / in_use / checkouts / health check
+    return pool_stats()
 
-@app.post("/ml/reindex")
+@app.get("/db/catalog")
+def db_catalog() -> Dict[str, object]:
+    return {**catalog_stats(), "responses": catalog_responses.stats(), "search_responses": search_responses.stats()}
+
+@app.get("/db/replica")
+def db_replica() -> Dict[str, object]:
+    # bản sao catalog: đang phục vụ chưa, tuổi, số dòng đổi lần sync gần nhất
+    return replica_stats()
+
+@app.post("/ml/reindex", status_code=status.HTTP_202_ACCEPTED)
 def ml_reindex() -> Dict[str, object]:
-    return reindex_static()
+    # chạy nền: chỉ embed ảnh mới/đổi rồi thay index 1 lượt
+    return reindex_static(runner=infer_pool.reindex_all if infer_pool else None)
+
+@app.get("/ml/reindex/{job_id}")
+def ml_reindex_status(job_id: str) -> Dict[str, object]:
+    job = reindex_status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+@app.get("/ml/models")
+def ml_models() -> Dict[str, object]:
+    # kho model: các phiên bản, CURRENT, bản đang phục vụ / bản trước (rollback) / bản đang load
+    return {
+        "current": ml_registry.current_version(),
+        "active": infer_pool.call("cnn_info") if infer_pool else cnn_info(),
+        "versions": ml_registry.list_versions(),
+        "history": ml_registry.history(),
+    }
+
+@app.get("/ml/models/jobs/{job_id}")
+def ml_models_job(job_id: str) -> Dict[str, object]:
+    job = job_status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
 
 # ===================== ADMIN APIs =====================
@@ -220,3 +532,57 @@ def admin_link_drug(code: str, drug_id: int = Form(...)) -> Dict[str, bool]:
     if not ok:
         raise HTTPException(status_code=400, detail="link failed (code không tồn tại hoặc đã gắn)")
     return {"ok": True}
+
+@app.post("/admin/users/{username}/revoke", dependencies=[Depends(require_admin)])
+def admin_revoke_user(username: str) -> Dict[str, object]:
+    # sau khi đổi quyền / khoá tài khoản trong DB: mọi token đã cấp cho user hết hiệu lực ngay
+    # (thu hồi lưu trong RAM của process này, xem sessions.py)
+    revoke_user(username)
+    return {"ok": True, "username": username}
+
+@app.post("/admin/replica/sync", dependencies=[Depends(require_admin)])
+def admin_replica_sync(full: bool = False) -> Dict[str, object]:
+    if REPLICA is None:
+        raise HTTPException(status_code=404, detail="CATALOG_REPLICA_PATH not set")
+    try:
+        changes = REPLICA.sync(full=full)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"replica sync failed: {e}")
+    return {"changes": changes, **replica_stats()}
+
+@app.post("/admin/models/{version}/activate", status_code=status.HTTP_202_ACCEPTED,
+          dependencies=[Depends(require_admin)])
+def admin_model_activate(version: str) -> Dict[str, object]:
+    # load + warm bản mới ở nền, /classify vẫn dùng bản cũ tới lúc đổi tham chiếu
+    try:
+        return switch_model(version, runner=infer_pool.activate_all if infer_pool else None)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail=f"model version {version} not found")
+
+@app.post("/admin/models/rollback", dependencies=[Depends(require_admin)])
+def admin_model_rollback() -> Dict[str, object]:
+    # bản trước vẫn còn trong RAM -> quay lại tức thì
+    try:
+        return infer_pool.rollback_all() if infer_pool else rollback_cnn()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/import", dependencies=[Depends(require_admin)])
+def admin_import(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),        # csv | json | ndjson (mặc định đoán theo tên file / nội dung)
+    kind: Optional[str] = Form(None),          # kind cho các dòng không có cột kind
+    dry_run: bool = Form(False),
+    skip_invalid: bool = Form(False),
+) -> Dict[str, object]:
+    # nạp catalog từ bảng tính: 1 transaction, executemany, báo lỗi theo từng dòng
+    try:
+        rows = parse_rows(file.file.read(), fmt=format, filename=file.filename or "", default_kind=kind)
+    except BulkFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    report = bulk_import(rows, dry_run=dry_run, skip_invalid=skip_invalid)
+    if "fatal" in report:
+        raise HTTPException(status_code=400, detail=report)
+    return report
@@ -0,0 +1,429 @@
+"""
+Benchmark đầu-cuối cho API: /classify + các API catalog, DB thay bằng SQLite.
+
+Chạy từ thư mục backend:
+    python -m bench.run                                   # uvicorn process riêng, đo RSS của server
+    python -m bench.run --concurrency 16 --requests 300
+    python -m bench.run --endpoints pests,pest_detail,drugs --inprocess
+    python -m bench.run --compare latest                  # so với lần chạy trước (commit khác)
+
+Kết quả: bench/results/<thời gian>_<commit>.json (kèm commit, cấu hình, máy).
+"""
+import os
+import io
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import secrets
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+sys.path.insert(0, BACKEND_DIR)
+
+from db.sqlite_standin import seed, load_codes   # noqa: E402
+from db.search import fold                       # noqa: E402
+
+ENDPOINTS = ("classify", "pests", "pests_search", "pest_detail", "pest_drugs", "drugs", "drugs_page")
+
+
+# =========================
+#  ẢNH GIẢ LẬP
+# =========================
+def make_jpegs(n: int, width: int, height: int, quality: int = 90, seed_: int = 0) -> List[bytes]:
+    """ảnh cỡ điện thoại (mặc định 12 MP): nền gradient + nhiễu + vài mảng màu"""
+    rng = np.random.default_rng(seed_)
+    out = []
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    for _ in range(n):
+        base = np.stack([
+            (xx / width) * rng.uniform(80, 200),
+            (yy / height) * rng.uniform(80, 200),
+            np.full_like(xx, rng.uniform(30, 120)),
+        ], axis=-1)
+        base += rng.normal(0, 12, size=(height, width, 1)).astype(np.float32)
+        for _ in range(6):
+            x0, y0 = int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))
+            base[y0:y0 + height // 4, x0:x0 + width // 4] = rng.uniform(0, 255, size=3)
+        buf = io.BytesIO()
+        Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=quality)
+        out.append(buf.getvalue())
+    return out
+
+
+def unique_variant(jpeg: bytes, tag: int) -> bytes:
+    """
+    chèn 1 segment COM ngay sau SOI: ảnh vẫn hợp lệ, pixel giữ nguyên
+    nhưng sha256 khác → không trúng cache kết quả /classify
+    """
+    payload = f"bench-{tag}".encode("ascii")
+    seg = b"\xff\xfe" + (len(payload) + 2).to_bytes(2, "big") + payload
+    return jpeg[:2] + seg + jpeg[2:]
+
+
+# =========================
+#  RSS
+# =========================
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+# =========================
+#  GIT / MÁY
+# =========================
+def git_info() -> Dict[str, Any]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=30).stdout.strip()
+    try:
+        return {
+            "commit": git("rev-parse", "HEAD"),
+            "subject": git("log", "-1", "--format=%s"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        }
+    except Exception:
+        return {"commit": "unknown", "subject": "", "dirty": None}
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "processor": platform.processor(),
+    }
+
+
+# =========================
+#  SERVER
+# =========================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """uvicorn app:app trong process riêng (mặc định) hoặc ASGI trong cùng process (--inprocess)"""
+
+    def __init__(self, env: Dict[str, str], inprocess: bool):
+        self.env = env
+        self.inprocess = inprocess
+        self.proc: Optional[subprocess.Popen] = None
+        self.pid = os.getpid()
+        self.base_url = "http://bench"
+        self._lifespan = None
+        self.app = None
+
+    async def start(self) -> None:
+        if self.inprocess:
+            os.environ.update(self.env)
+            import app as app_module
+            self.app = app_module.app
+            self._lifespan = self.app.router.lifespan_context(self.app)
+            await self._lifespan.__aenter__()
+            return
+        port = _free_port()
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env={**os.environ, **self.env},
+        )
+        self.pid = self.proc.pid
+
+    def client(self, concurrency: int):
+        import httpx
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        kw: Dict[str, Any] = {"base_url": self.base_url, "timeout": 120.0, "limits": limits}
+        if self.inprocess:
+            kw["transport"] = httpx.ASGITransport(app=self.app)
+        return httpx.AsyncClient(**kw)
+
+    async def wait(self, path: str, timeout: float) -> bool:
+        deadline = time.time() + timeout
+        async with self.client(1) as c:
+            while time.time() < deadline:
+                if self.proc is not None and self.proc.poll() is not None:
+                    raise RuntimeError(f"server exited with code {self.proc.returncode}")
+                try:
+                    if (await c.get(path)).status_code == 200:
+                        return True
+                except Exception:
+                    pass
+                await asyncio.sleep(0.5)
+        return False
+
+    async def stop(self) -> None:
+        if self._lifespan is not None:
+            await self._lifespan.__aexit__(None, None, None)
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+# =========================
+#  TẢI
+# =========================
+def _percentiles(lat_s: List[float]) -> Dict[str, float]:
+    if not lat_s:
+        return {}
+    a = np.asarray(lat_s) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "p99_ms": float(np.percentile(a, 99)),
+        "mean_ms": float(a.mean()),
+        "max_ms": float(a.max()),
+    }
+
+
+async def run_endpoint(server: Server, name: str, make_request: Callable[[Any, int], Any],
+                       n: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    rss_samples: List[float] = []
+    counter = iter(range(n))
+
+    async with server.client(concurrency) as client:
+        for i in range(warmup):
+            await make_request(client, -1 - i)
+
+        async def worker():
+            for i in counter:
+                t0 = time.perf_counter()
+                try:
+                    r = await make_request(client, i)
+                    code = str(r.status_code)
+                except Exception as e:
+                    code = type(e).__name__
+                latencies.append(time.perf_counter() - t0)
+                statuses[code] = statuses.get(code, 0) + 1
+
+        async def sample_rss():
+            while True:
+                v = rss_mb(server.pid)
+                if v is not None:
+                    rss_samples.append(v)
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_rss())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+        sampler.cancel()
+
+    ok = sum(v for k, v in statuses.items() if k.startswith("2") or k == "304")
+    res = {
+        "requests": n,
+        "concurrency": concurrency,
+        "ok": ok,
+        "errors": n - ok,
+        "status": statuses,
+        "wall_s": wall,
+        "throughput_rps": n / wall if wall > 0 else 0.0,
+        **_percentiles(latencies),
+        "rss_peak_mb": max(rss_samples) if rss_samples else rss_mb(server.pid),
+        "rss_end_mb": rss_mb(server.pid),
+    }
+    print(f"[bench] {name:13s} {res['throughput_rps']:8.1f} req/s  p50 {res.get('p50_ms', 0):8.1f} ms  "
+          f"p95 {res.get('p95_ms', 0):8.1f} ms  p99 {res.get('p99_ms', 0):8.1f} ms  "
+          f"errors {res['errors']}  rss {res['rss_peak_mb'] or 0:.0f} MB", flush=True)
+    return res
+
+
+def request_makers(codes: List[str], jpegs: List[bytes]) -> Dict[str, Callable]:
+    rng = random.Random(0)
+    names = [fold(c.replace("_", " ")) for c in codes]
+
+    def pick(seq, i):
+        return seq[i % len(seq)]
+
+    async def classify(c, i):
+        img = unique_variant(pick(jpegs, i), i)
+        return await c.post("/classify", files={"file": ("phone.jpg", img, "image/jpeg")})
+
+    async def search(c, i):
+        name = pick(names, i)
+        return await c.get("/pests", params={"q": name[:rng.randint(2, max(2, len(name)))]})
+
+    return {
+        "classify": classify,
+        "pests": lambda c, i: c.get("/pests"),
+        "pests_search": search,
+        "pest_detail": lambda c, i: c.get(f"/pests/{pick(codes, i)}"),
+        "pest_drugs": lambda c, i: c.get(f"/pests/{pick(codes, i)}/drugs"),
+        "drugs": lambda c, i: c.get("/drugs"),
+        "drugs_page": lambda c, i: c.get("/drugs", params={"limit": 50}),
+    }
+
+
+# =========================
+#  SO SÁNH
+# =========================
+def _latest_result(exclude: Optional[str] = None) -> Optional[str]:
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json"))
+    files = [os.path.join(RESULTS_DIR, f) for f in files]
+    files = [f for f in files if f != exclude]
+    return files[-1] if files else None
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"\n[bench] so với {os.path.basename(baseline_path)} "
+          f"({base.get('git', {}).get('commit', '?')[:10]})")
+    for name, cur in current["endpoints"].items():
+        old = base.get("endpoints", {}).get(name)
+        if not old:
+            continue
+        parts = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "rss_peak_mb"):
+            a, b = old.get(key), cur.get(key)
+            if a and b:
+                parts.append(f"{key} {b:.1f} ({(b - a) / a * 100:+.1f}%)")
+        print(f"  {name:13s} " + "  ".join(parts))
+
+
+# =========================
+#  MAIN
+# =========================
+async def main_async(args) -> Dict[str, Any]:
+    labels = args.labels or os.path.join(BACKEND_DIR, "models", "labels.json")
+    codes = load_codes(labels)
+    workdir = tempfile.mkdtemp(prefix="saurieng-bench-")
+    db_path = os.path.join(workdir, "catalog.sqlite3")
+    seed(db_path, codes, n_drugs=args.drugs)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"unknown endpoints: {sorted(unknown)} (có: {', '.join(ENDPOINTS)})")
+
+    jpegs: List[bytes] = []
+    if "classify" in endpoints:
+        w, h = (int(x) for x in args.image_size.lower().split("x"))
+        jpegs = make_jpegs(args.images, w, h)
+        print(f"[bench] {len(jpegs)} JPEG {w}x{h}, ~{np.mean([len(j) for j in jpegs]) / 1024:.0f} KB", flush=True)
+
+    env = {
+        "DB_BACKEND": "sqlite",
+        "DB_SQLITE_PATH": db_path,
+        # khoá ký token chỉ dùng cho lần chạy này (sessions bắt buộc AUTH_SECRET ngoài APP_ENV=dev)
+        "AUTH_SECRET": os.environ.get("AUTH_SECRET") or secrets.token_urlsafe(32),
+        # mặc định tắt cache kết quả để đo suy luận thật
+        "PRED_CACHE_SIZE": os.environ.get("PRED_CACHE_SIZE", "0" if not args.pred_cache else "2048"),
+    }
+    server = Server(env, inprocess=args.inprocess)
+    t_start = time.perf_counter()
+    await server.start()
+    results: Dict[str, Any] = {}
+    try:
+        if not await server.wait("/health", 120):
+            raise SystemExit("server did not start")
+        startup = {"health_s": time.perf_counter() - t_start}
+        if "classify" in endpoints:
+            if not await server.wait("/ready", args.ready_timeout):
+                raise SystemExit("model not ready")
+            startup["ready_s"] = time.perf_counter() - t_start
+        startup["rss_mb"] = rss_mb(server.pid)
+
+        makers = request_makers(codes, jpegs)
+        for name in endpoints:
+            n = args.classify_requests if name == "classify" else args.requests
+            results[name] = await run_endpoint(server, name, makers[name], n, args.concurrency, args.warmup)
+    finally:
+        await server.stop()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_info(),
+        "machine": machine_info(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "classify_requests": args.classify_requests,
+            "warmup": args.warmup,
+            "image_size": args.image_size,
+            "images": args.images,
+            "drugs": args.drugs,
+            "pests": len(codes),
+            "inprocess": args.inprocess,
+            "pred_cache": env["PRED_CACHE_SIZE"] != "0",
+            "env": {k: v for k, v in os.environ.items()
+                    if k.startswith(("ML_", "CLASSIFY_", "PRED_", "DB_", "STATIC_", "CATALOG_"))},
+        },
+        "startup": startup,
+        "endpoints": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="SauRieng API benchmark (SQLite stand-in)")
+    ap.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=500, help="số request mỗi API catalog")
+    ap.add_argument("--classify-requests", type=int, default=100)
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--image-size", default="3024x4032", help="WxH ảnh giả lập (mặc định 12 MP)")
+    ap.add_argument("--images", type=int, default=8, help="số ảnh gốc khác nhau")
+    ap.add_argument("--drugs", type=int, default=2000, help="số thuốc seed vào SQLite")
+    ap.add_argument("--labels", default=None, help="labels.json (mặc định models/labels.json)")
+    ap.add_argument("--ready-timeout", type=float, default=600)
+    ap.add_argument("--pred-cache", action="store_true", help="bật cache kết quả /classify")
+    ap.add_argument("--inprocess", action="store_true", help="chạy app trong cùng process (không cần uvicorn)")
+    ap.add_argument("--out", default=None, help="file JSON kết quả (mặc định bench/results/...)")
+    ap.add_argument("--compare", default=None, help="file kết quả cũ, hoặc 'latest'")
+    args = ap.parse_args(argv)
+
+    result = asyncio.run(main_async(args))
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        sha = (result["git"]["commit"] or "unknown")[:10] + ("-dirty" if result["git"]["dirty"] else "")
+        out = os.path.join(RESULTS_DIR, f"{stamp}_{sha}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"[bench] saved {out}")
+
+    if args.compare:
+        base = _latest_result(exclude=os.path.abspath(out)) if args.compare == "latest" else args.compare
+        if base:
+            compare(result, base)
+        else:
+            print("[bench] no previous result to compare")
+
+
+if __name__ == "__main__":
+    main()
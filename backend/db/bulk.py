@@ -0,0 +1,375 @@
+# backend/db/bulk.py
+import io
+import csv
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .queries import get_conn, _chunks, _placeholders, _unique, _catalog_changed
+
+# =========================
+#  ĐỊNH DẠNG DÒNG
+# =========================
+# mỗi dòng có cột "kind": pest | photo | drug | link
+PEST_COLS = ("Code", "TenThuong", "TenKhoaHoc", "MoTaNgan", "NhanBiet", "BienPhapIPM", "TacHai")
+DRUG_COLS = ("Ten", "HoatChat", "Nhom", "Hang", "HuongDan", "GhiChu")
+
+_KINDS = {
+    "pest": "pest", "pests": "pest",
+    "photo": "photo", "photos": "photo",
+    "drug": "drug", "drugs": "drug",
+    "link": "link", "links": "link",
+}
+
+
+# vị trí dòng trong file: số dòng, hoặc (section, thứ tự trong section) với JSON dạng object
+RowRef = Union[int, Tuple[str, int]]
+
+
+class BulkFormatError(ValueError):
+    """file không đọc được (sai định dạng) → 400"""
+
+
+def _clean(v: Any) -> Any:
+    if isinstance(v, str):
+        v = v.strip()
+        return v or None
+    return v
+
+
+def _row_label(n: RowRef) -> str:
+    return f"{n[0]}[{n[1]}]" if isinstance(n, tuple) else str(n)
+
+
+def _row_fields(n: RowRef) -> Dict[str, Any]:
+    """vị trí dòng trong báo cáo lỗi: {"row": n} hoặc {"section": ..., "row": i}"""
+    return {"section": n[0], "row": n[1]} if isinstance(n, tuple) else {"row": n}
+
+
+def _sniff(raw: bytes, filename: str) -> str:
+    name = (filename or "").lower()
+    for ext, fmt in ((".csv", "csv"), (".ndjson", "ndjson"), (".jsonl", "ndjson"), (".json", "json")):
+        if name.endswith(ext):
+            return fmt
+    head = raw.lstrip()[:1]
+    if head == b"[":
+        return "json"
+    if head == b"{":
+        # nhiều dòng bắt đầu bằng "{" → NDJSON
+        lines = [l for l in raw.splitlines() if l.strip()]
+        return "ndjson" if len(lines) > 1 and all(l.lstrip().startswith(b"{") for l in lines) else "json"
+    return "csv"
+
+
+def parse_rows(raw: bytes, fmt: Optional[str] = None, filename: str = "",
+               default_kind: Optional[str] = None) -> List[Tuple[RowRef, Dict[str, Any]]]:
+    """
+    CSV (UTF-8, có/không BOM) / JSON / NDJSON → [(số dòng, row)].
+    JSON có thể là list các row, hoặc {"pests": [...], "photos": [...], "drugs": [...], "links": [...]}
+    (khi đó vị trí là (section, thứ tự trong section), đếm từ 1).
+    """
+    fmt = (fmt or _sniff(raw, filename)).lower()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise BulkFormatError(f"file must be UTF-8: {e}") from None
+
+    rows: List[Tuple[RowRef, Dict[str, Any]]] = []
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(io.StringIO(text))
+            for i, r in enumerate(reader, start=2):               # dòng 1 là header
+                rows.append((i, {(k or "").strip(): v for k, v in r.items()}))
+        elif fmt == "ndjson":
+            for i, line in enumerate(text.splitlines(), start=1):
+                if line.strip():
+                    rows.append((i, json.loads(line)))
+        elif fmt == "json":
+            data = json.loads(text)
+            if isinstance(data, dict):
+                for section, items in data.items():
+                    if section not in _KINDS:
+                        raise BulkFormatError(f"unknown section '{section}'")
+                    if not isinstance(items, list):
+                        raise BulkFormatError(f"section '{section}' must be a list")
+                    for i, r in enumerate(items, start=1):
+                        if not isinstance(r, dict):
+                            raise BulkFormatError(f"row {section}[{i}]: expected an object")
+                        rows.append(((section, i), dict(r, kind=r.get("kind") or section)))
+            elif isinstance(data, list):
+                rows = [(i, r) for i, r in enumerate(data, start=1)]
+            else:
+                raise BulkFormatError("JSON must be a list or an object of sections")
+        else:
+            raise BulkFormatError(f"unknown format '{fmt}'")
+    except (ValueError, csv.Error) as e:
+        if isinstance(e, BulkFormatError):
+            raise
+        raise BulkFormatError(f"cannot parse {fmt}: {e}") from None
+
+    out = []
+    for n, r in rows:
+        if not isinstance(r, dict):
+            raise BulkFormatError(f"row {_row_label(n)}: expected an object")
+        r = {k: _clean(v) for k, v in r.items()}
+        if r.get("kind") is None and default_kind:
+            r["kind"] = default_kind
+        out.append((n, r))
+    return out
+
+
+def _json_text(v: Any) -> Optional[str]:
+    # NhanBiet / BienPhapIPM: cho phép list/dict trong JSON, lưu dạng chuỗi JSON như cũ
+    if v is None or isinstance(v, str):
+        return v
+    return json.dumps(v, ensure_ascii=False)
+
+
+# cột làm khoá (dict/set, IN (...)) phải là chuỗi; cột còn lại chỉ nhận giá trị đơn
+_KEY_COLS = {"pest": ("Code",), "drug": ("Ten",), "photo": ("Code", "Url"), "link": ("Code", "DrugTen")}
+_JSON_COLS = ("NhanBiet", "BienPhapIPM")
+_SCALARS = (str, int, float, bool)
+
+
+def _type_error(kind: str, r: Dict[str, Any]) -> Optional[str]:
+    """JSON có thể gửi object/list vào bất kỳ cột nào → lỗi theo dòng thay vì 500"""
+    for c in _KEY_COLS[kind]:
+        v = r.get(c)
+        if v is not None and not isinstance(v, str):
+            return f"{c} must be a string"
+    for c, v in r.items():
+        if c == "kind" or v is None or isinstance(v, _SCALARS):
+            continue
+        if kind == "pest" and c in _JSON_COLS:
+            continue
+        return f"{c} must be a string or number"
+    return None
+
+
+def _validate(rows: List[Tuple[RowRef, Dict[str, Any]]]):
+    """tách theo kind + kiểm tra cột bắt buộc / trùng khoá trong file"""
+    pests: Dict[str, Tuple[RowRef, tuple]] = {}
+    drugs: Dict[str, Tuple[RowRef, tuple]] = {}
+    photos: List[Tuple[RowRef, str, str]] = []
+    links: List[Tuple[RowRef, str, Optional[int], Optional[str]]] = []
+    errors: List[Dict[str, Any]] = []
+
+    def err(n, kind, msg):
+        errors.append({**_row_fields(n), "kind": kind, "error": msg})
+
+    for n, r in rows:
+        kind = _KINDS.get(str(r.get("kind") or "").lower())
+        bad = _type_error(kind, r) if kind is not None else None
+        if kind is None:
+            err(n, r.get("kind") if isinstance(r.get("kind"), (str, type(None))) else None,
+                "kind must be pest | photo | drug | link")
+        elif bad:
+            err(n, kind, bad)
+        elif kind == "pest":
+            code = r.get("Code")
+            if not code:
+                err(n, kind, "Code required")
+            elif code in pests:
+                err(n, kind, f"duplicate Code '{code}' (row {_row_label(pests[code][0])})")
+            else:
+                vals = tuple(_json_text(r.get(c)) if c in ("NhanBiet", "BienPhapIPM") else r.get(c)
+                             for c in PEST_COLS)
+                pests[code] = (n, vals)
+        elif kind == "drug":
+            ten = r.get("Ten")
+            if not ten:
+                err(n, kind, "Ten required")
+            elif ten in drugs:
+                err(n, kind, f"duplicate Ten '{ten}' (row {_row_label(drugs[ten][0])})")
+            else:
+                drugs[ten] = (n, tuple(r.get(c) for c in DRUG_COLS))
+        elif kind == "photo":
+            if not r.get("Code") or not r.get("Url"):
+                err(n, kind, "Code and Url required")
+            else:
+                photos.append((n, r["Code"], r["Url"]))
+        else:
+            drug_id = r.get("DrugId")
+            if not r.get("Code") or (drug_id is None and not r.get("DrugTen")):
+                err(n, kind, "Code and DrugId or DrugTen required")
+                continue
+            try:
+                drug_id = int(drug_id) if drug_id is not None else None
+            except (TypeError, ValueError):
+                err(n, kind, "DrugId must be an integer")
+                continue
+            links.append((n, r["Code"], drug_id, r.get("DrugTen")))
+    return pests, drugs, photos, links, errors
+
+
+def _fast(cur) -> None:
+    # pyodbc: gửi cả lô tham số 1 lượt thay vì 1 round-trip / dòng
+    try:
+        cur.fast_executemany = True
+    except AttributeError:
+        pass
+
+
+def _ids(cur, table: str, key: str, values: List[Any]) -> Dict[Any, int]:
+    out: Dict[Any, int] = {}
+    for part in _chunks(_unique(values)):
+        cur.execute(f"SELECT {key}, Id FROM {table} WHERE {key} IN ({_placeholders(len(part))})", *part)
+        for k, i in cur.fetchall():
+            out.setdefault(k, int(i))
+    return out
+
+
+def _existing_pairs(cur, table: str, a: str, b: str, ids: List[int]) -> set:
+    out = set()
+    for part in _chunks(_unique(ids)):
+        cur.execute(f"SELECT {a}, {b} FROM {table} WHERE {a} IN ({_placeholders(len(part))})", *part)
+        out.update((int(x), y) for x, y in cur.fetchall())
+    return out
+
+
+class _RowFailed(Exception):
+    def __init__(self, n: RowRef, kind: str, error: Exception):
+        super().__init__(str(error))
+        self.n, self.kind, self.error = n, kind, error
+
+
+def _executemany(cur, sql: str, rows: List[Tuple[RowRef, tuple]], kind: str, per_row: bool) -> None:
+    """
+    rows = [(vị trí dòng, tham số)]. Bình thường 1 lần executemany;
+    per_row=True (chạy lại sau khi lô lỗi) thì từng câu để biết dòng nào vi phạm ràng buộc.
+    """
+    if not per_row:
+        cur.executemany(sql, [params for _, params in rows])
+        return
+    for n, params in rows:
+        try:
+            cur.execute(sql, *params)
+        except Exception as e:
+            raise _RowFailed(n, kind, e) from e
+
+
+def _apply(cur, pests, drugs, photos, links, report: Dict[str, Any], errors: List[Dict[str, Any]],
+           per_row: bool = False) -> None:
+    # ---- pests ----
+    pest_ids = _ids(cur, "dbo.Pests", "Code", list(pests))
+    # TenThuong NOT NULL (cột sắp xếp phân trang): sâu mới thiếu tên → ''
+    ins = [(n, (vals[0], vals[1] or "") + vals[2:]) for code, (n, vals) in pests.items() if code not in pest_ids]
+    upd = [(n, vals[1:] + (code,)) for code, (n, vals) in pests.items() if code in pest_ids]
+    if ins:
+        _executemany(cur, f"INSERT INTO dbo.Pests ({', '.join(PEST_COLS)}) "
+                          f"VALUES ({_placeholders(len(PEST_COLS))})", ins, "pest", per_row)
+    if upd:
+        # ô trống giữ nguyên giá trị cũ
+        sets = ", ".join(f"{c} = COALESCE(?, {c})" for c in PEST_COLS[1:])
+        _executemany(cur, f"UPDATE dbo.Pests SET {sets} WHERE Code = ?", upd, "pest", per_row)
+    report["pests"] = {"inserted": len(ins), "updated": len(upd)}
+
+    # ---- drugs ----
+    drug_ids = _ids(cur, "dbo.Drugs", "Ten", list(drugs))
+    ins = [(n, vals) for ten, (n, vals) in drugs.items() if ten not in drug_ids]
+    upd = [(n, vals[1:] + (ten,)) for ten, (n, vals) in drugs.items() if ten in drug_ids]
+    if ins:
+        _executemany(cur, f"INSERT INTO dbo.Drugs ({', '.join(DRUG_COLS)}) "
+                          f"VALUES ({_placeholders(len(DRUG_COLS))})", ins, "drug", per_row)
+    if upd:
+        sets = ", ".join(f"{c} = COALESCE(?, {c})" for c in DRUG_COLS[1:])
+        _executemany(cur, f"UPDATE dbo.Drugs SET {sets} WHERE Ten = ?", upd, "drug", per_row)
+    report["drugs"] = {"inserted": len(ins), "updated": len(upd)}
+
+    # Id mới sinh + mã được tham chiếu bởi photo/link
+    pest_ids = _ids(cur, "dbo.Pests", "Code",
+                    list(pests) + [c for _, c, _ in photos] + [c for _, c, _, _ in links])
+    drug_ids = _ids(cur, "dbo.Drugs", "Ten", list(drugs) + [t for *_, t in links if t])
+
+    # ---- photos ----
+    have = _existing_pairs(cur, "dbo.PestPhotos", "PestId", "Url",
+                           [pest_ids[c] for _, c, _ in photos if c in pest_ids])
+    new_photos = []
+    for n, code, url in photos:
+        pid = pest_ids.get(code)
+        if pid is None:
+            errors.append({**_row_fields(n), "kind": "photo", "error": f"unknown Code '{code}'"})
+        elif (pid, url) in have:
+            report["photos"]["skipped"] += 1
+        else:
+            have.add((pid, url))
+            new_photos.append((n, (pid, url)))
+    if new_photos:
+        _executemany(cur, "INSERT INTO dbo.PestPhotos (PestId, Url) VALUES (?, ?)", new_photos, "photo", per_row)
+    report["photos"]["inserted"] = len(new_photos)
+
+    # ---- links (thay MERGE từng dòng bằng 1 lần đọc + executemany) ----
+    known_drugs = set(_ids(cur, "dbo.Drugs", "Id", [d for _, _, d, _ in links if d is not None]))
+    have = _existing_pairs(cur, "dbo.PestDrugs", "PestId", "DrugId",
+                           [pest_ids[c] for _, c, _, _ in links if c in pest_ids])
+    new_links = []
+    for n, code, drug_id, drug_ten in links:
+        pid = pest_ids.get(code)
+        did = drug_id if drug_id is not None else drug_ids.get(drug_ten)
+        if pid is None:
+            errors.append({**_row_fields(n), "kind": "link", "error": f"unknown Code '{code}'"})
+        elif did is None or (drug_id is not None and drug_id not in known_drugs):
+            errors.append({**_row_fields(n), "kind": "link", "error": f"unknown drug '{drug_ten or drug_id}'"})
+        elif (pid, int(did)) in have:
+            report["links"]["skipped"] += 1
+        else:
+            have.add((pid, int(did)))
+            new_links.append((n, (pid, int(did))))
+    if new_links:
+        _executemany(cur, "INSERT INTO dbo.PestDrugs (PestId, DrugId) VALUES (?, ?)", new_links, "link", per_row)
+    report["links"]["inserted"] = len(new_links)
+
+
+def _new_report(rows, dry_run: bool, errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "rows": len(rows),
+        "dry_run": dry_run,
+        "committed": False,
+        "pests": {"inserted": 0, "updated": 0},
+        "drugs": {"inserted": 0, "updated": 0},
+        "photos": {"inserted": 0, "skipped": 0},
+        "links": {"inserted": 0, "skipped": 0},
+        "errors": errors,
+    }
+
+
+def bulk_import(rows: List[Tuple[RowRef, Dict[str, Any]]], dry_run: bool = False,
+                skip_invalid: bool = False) -> Dict[str, object]:
+    """
+    Upsert pests / drugs (theo Code / Ten), thêm photos / links còn thiếu,
+    tất cả trong 1 transaction với executemany.
+    - dòng lỗi: mặc định không ghi gì (skip_invalid=True → bỏ qua dòng lỗi, ghi phần còn lại)
+    - dry_run: chạy hết câu lệnh rồi rollback (bắt được cả lỗi ràng buộc của DB)
+    - DB báo lỗi giữa chừng: rollback, chạy lại từng câu để chỉ ra dòng vi phạm ("fatal" kèm row)
+    """
+    pests, drugs, photos, links, errors = _validate(rows)
+    report = _new_report(rows, dry_run, list(errors))
+
+    with get_conn() as cn:
+        cur = cn.cursor()
+        _fast(cur)
+        try:
+            _apply(cur, pests, drugs, photos, links, report, report["errors"])
+        except Exception as e:
+            cn.rollback()
+            fatal: Dict[str, Any] = {"error": str(e)}
+            # lô executemany không cho biết dòng nào lỗi → chạy lại từng câu (rồi rollback) để tìm
+            try:
+                _apply(cur, pests, drugs, photos, links, _new_report(rows, dry_run, []), [], per_row=True)
+            except _RowFailed as rf:
+                fatal = {**_row_fields(rf.n), "kind": rf.kind, "error": str(rf.error)}
+            except Exception:
+                pass
+            finally:
+                cn.rollback()
+            report["fatal"] = fatal
+            return report
+
+        report["errors"].sort(key=lambda e: (e.get("section", ""), e["row"]))
+        if dry_run or (report["errors"] and not skip_invalid):
+            cn.rollback()
+            return report
+        cn.commit()
+        report["committed"] = True
+
+    _catalog_changed("bulk")
+    return report
@@ -0,0 +1,163 @@
+# backend/db/catalog.py
+import os
+import time
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import queries
+from .search import SearchIndex
+from .replica import REPLICA
+
+# =========================
+#  CẤU HÌNH
+# =========================
+# ghi trực tiếp vào DB (không qua /admin) sẽ được thấy sau tối đa CATALOG_TTL giây;
+# <= 0: không hết hạn theo thời gian, chỉ load lại khi có ghi qua API
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", "300"))
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int                                   # tăng mỗi lần load
+    gen: int                                       # thế hệ ghi lúc bắt đầu load
+    loaded_at: float
+    pests: List[Dict[str, Any]]                    # như get_pests(): 1 ảnh đại diện
+    details: Dict[str, Dict[str, Any]]             # Code -> như get_pest_detail()
+    drugs: List[Dict[str, Any]]
+    drugs_by_code: Dict[str, List[Dict[str, Any]]]
+
+
+class CatalogCache:
+    """
+    Catalog sâu/thuốc giữ trong RAM, đọc qua (read-through):
+    - load 1 lần (vài câu SQL theo lô), NhanBiet/BienPhapIPM đã decode sẵn
+    - ghi qua db.queries (create_pest, add_pest_photo, ...) → sau commit đánh dấu cũ,
+      lần đọc kế tiếp load lại
+    - TTL cho các thay đổi ngoài API
+    Dữ liệu trả ra dùng chung giữa các request: chỉ đọc, không sửa.
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = float(ttl)
+        self._snap: Optional[CatalogSnapshot] = None
+        self._gen = 0                      # tăng mỗi lần có ghi
+        self._lock = threading.Lock()      # chỉ 1 luồng load cùng lúc
+        self._version = 0
+        self.search = SearchIndex()        # cập nhật theo từng lần load (chỉ bản ghi đổi)
+
+        self.loads = 0
+        self.load_errors = 0
+        self.invalidations = 0
+        self.last_load_ms = 0.0
+
+    # ---------- nội bộ ----------
+    def _fresh(self, snap: Optional[CatalogSnapshot]) -> bool:
+        if snap is None or snap.gen != self._gen:
+            return False
+        return self.ttl <= 0 or time.time() - snap.loaded_at < self.ttl
+
+    def _load(self) -> CatalogSnapshot:
+        gen = self._gen
+        t0 = time.perf_counter()
+        pests = queries.get_pests()
+        codes = [p["Code"] for p in pests]
+        details = queries.get_pest_details(codes)
+        drugs = queries.get_drugs()
+        drugs_by_code = queries.get_drugs_for_pests(codes)
+        self.search.update(pests)
+        self._version += 1
+        self.loads += 1
+        self.last_load_ms = (time.perf_counter() - t0) * 1000.0
+        return CatalogSnapshot(self._version, gen, time.time(), pests, details, drugs, drugs_by_code)
+
+    # ---------- API ----------
+    def snapshot(self) -> CatalogSnapshot:
+        snap = self._snap
+        if self._fresh(snap):
+            return snap
+        with self._lock:
+            snap = self._snap
+            if self._fresh(snap):
+                return snap
+            try:
+                self._snap = self._load()
+            except Exception as e:
+                self.load_errors += 1
+                if snap is None:
+                    raise
+                # DB lỗi: dùng tạm bản cũ, lần sau thử lại
+                print("[catalog] reload failed, serving stale:", e, flush=True)
+                return snap
+            return self._snap
+
+    def invalidate(self, _table: str = "") -> None:
+        # ghi xong → bản đang có (và bản đang load dở) đều thành cũ
+        self._gen += 1
+        self.invalidations += 1
+
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def stats(self) -> Dict[str, object]:
+        snap = self._snap
+        return {
+            "version": snap.version if snap else None,
+            "fresh": self._fresh(snap),
+            "age_s": (time.time() - snap.loaded_at) if snap else None,
+            "ttl_s": self.ttl,
+            "pests": len(snap.pests) if snap else 0,
+            "drugs": len(snap.drugs) if snap else 0,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "last_load_ms": self.last_load_ms,
+            "invalidations": self.invalidations,
+            "search": self.search.stats(),
+        }
+
+
+CATALOG = CatalogCache()
+if REPLICA is not None:
+    # đọc từ bản sao: load lại khi bản sao đổi (ghi qua API được sync ngay, rồi mới báo)
+    REPLICA.on_change(CATALOG.invalidate)
+else:
+    queries.on_catalog_write(CATALOG.invalidate)
+
+
+# =========================
+#  HÀM ĐỌC (cùng chữ ký với db.queries)
+# =========================
+def get_pests(search: Optional[str] = None) -> List[Dict[str, Any]]:
+    pests = CATALOG.snapshot().pests
+    if not search:
+        return pests
+    # bỏ dấu + token/tiền tố/trigram, xếp theo độ khớp
+    return CATALOG.search.search(search)
+
+
+def get_pest_detail(code: str) -> Optional[Dict[str, Any]]:
+    return CATALOG.snapshot().details.get(code)
+
+
+def get_pest_details(codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    details = CATALOG.snapshot().details
+    return {c: details[c] for c in codes if c in details}
+
+
+def get_drugs() -> List[Dict[str, Any]]:
+    return CATALOG.snapshot().drugs
+
+
+def get_drugs_for_pest(code: str) -> List[Dict[str, Any]]:
+    return CATALOG.snapshot().drugs_by_code.get(code, [])
+
+
+def get_catalog_for_codes(codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    snap = CATALOG.snapshot()
+    return {c: {"detail": snap.details.get(c), "drugs": snap.drugs_by_code.get(c, [])} for c in codes}
+
+
+def catalog_version() -> int:
+    return CATALOG.version()
+
+
+def catalog_stats() -> Dict[str, object]:
+    return CATALOG.stats()
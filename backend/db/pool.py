@@ -0,0 +1,270 @@
+# backend/db/pool.py
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+class PoolTimeout(Exception):
+    """hết connection trong pool và chờ quá timeout"""
+
+
+class PooledConnection:
+    """
+    Bọc connection DB-API: dùng y như connection thường (cursor/commit/rollback),
+    nhưng close() trả connection về pool thay vì đóng thật.
+    Dùng được với `with`: ra khỏi khối là trả về pool.
+    """
+
+    __slots__ = ("_pool", "_raw", "_closed")
+
+    def __init__(self, pool: "ConnectionPool", raw: Any):
+        self._pool = pool
+        self._raw = raw
+        self._closed = False
+
+    def cursor(self):
+        return self._raw.cursor()
+
+    def commit(self) -> None:
+        self._raw.commit()
+
+    def rollback(self) -> None:
+        self._raw.rollback()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._raw)
+
+    def __getattr__(self, name: str):
+        return getattr(self._raw, name)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __del__(self):
+        # quên close() → vẫn trả về pool khi bị GC
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool connection thread-safe cho driver DB-API bất kỳ (pyodbc, sqlite3, ...):
+    - min_size / max_size; hết chỗ thì chờ tối đa timeout giây rồi PoolTimeout
+    - health check khi checkout nếu connection rảnh quá check_interval giây
+    - fill() mở sẵn min_size connection (gọi lúc khởi động, request đầu không phải chờ connect)
+    - connection rảnh quá idle_timeout (ngoài min_size) bị đóng: khi acquire/release và
+      bởi thread nền mỗi reap_interval giây (server vắng request vẫn trả connection thừa)
+    - release luôn rollback để không mang transaction dở sang request sau
+    """
+
+    def __init__(self,
+                 connect: Callable[[], Any],
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 idle_timeout: float = 300.0,
+                 timeout: float = 10.0,
+                 check_interval: float = 30.0,
+                 health_query: str = "SELECT 1",
+                 reap_interval: Optional[float] = None):
+        self._connect = connect
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size), self.min_size)
+        self.idle_timeout = float(idle_timeout)
+        self.timeout = float(timeout)
+        self.check_interval = float(check_interval)
+        self.health_query = health_query
+
+        self._cond = threading.Condition()
+        self._idle: Deque[Tuple[Any, float]] = deque()   # (conn, last_used)
+        self._size = 0                                     # idle + đang dùng
+        self._closed = False
+
+        # thống kê
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._timeouts = 0
+        self._health_failures = 0
+
+        # None: idle_timeout / 2; <= 0: không chạy thread dọn
+        self.reap_interval = self.idle_timeout / 2 if reap_interval is None else float(reap_interval)
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+        if self.reap_interval > 0:
+            self._reaper = threading.Thread(target=self._reap_loop, name="db-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    # ---------- nội bộ ----------
+    def _open(self) -> Any:
+        raw = self._connect()
+        with self._cond:
+            self._created += 1
+        return raw
+
+    def _discard(self, raw: Any) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def _healthy(self, raw: Any) -> bool:
+        try:
+            cur = raw.cursor()
+            cur.execute(self.health_query)
+            cur.fetchall()
+            cur.close()
+            return True
+        except Exception:
+            with self._cond:
+                self._health_failures += 1
+            return False
+
+    def _evict_idle(self, now: float) -> None:
+        """gọi khi đang giữ _cond: đóng connection rảnh lâu, giữ lại min_size"""
+        drop = []
+        while (self._idle and self._size > self.min_size
+               and now - self._idle[0][1] > self.idle_timeout):
+            drop.append(self._idle.popleft()[0])
+            self._size -= 1
+            self._discarded += 1
+        for raw in drop:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    def _reap_loop(self) -> None:
+        # Event riêng: không chờ trên _cond để khỏi "ăn" notify dành cho acquire đang chờ
+        while not self._stop.wait(self.reap_interval):
+            with self._cond:
+                self._evict_idle(time.time())
+
+    # ---------- API ----------
+    def fill(self) -> int:
+        """mở thêm connection tới đủ min_size; trả về số connection vừa mở"""
+        opened = 0
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return opened
+                self._size += 1
+            try:
+                raw = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((raw, time.time()))
+                self._cond.notify()
+            opened += 1
+
+    def acquire(self) -> PooledConnection:
+        t0 = time.perf_counter()
+        deadline = t0 + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("pool closed")
+                now = time.time()
+                self._evict_idle(now)
+                if self._idle:
+                    # LIFO: connection vừa dùng xong thường còn "nóng"
+                    raw, last_used = self._idle.pop()
+                    reserved = False
+                elif self._size < self.max_size:
+                    self._size += 1
+                    raw, last_used, reserved = None, now, True
+                else:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"no connection available after {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                    continue
+
+            if reserved:
+                try:
+                    raw = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif now - last_used > self.check_interval and not self._healthy(raw):
+                self._discard(raw)
+                continue
+
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                    self._wait_total += time.perf_counter() - t0
+            return PooledConnection(self, raw)
+
+    def release(self, raw: Any) -> None:
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+                return
+            now = time.time()
+            self._idle.append((raw, now))
+            self._evict_idle(now)
+            self._cond.notify()
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                raw = self._idle.pop()[0]
+                self._size -= 1
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "avg_wait_ms": (self._wait_total / self._waits * 1000.0) if self._waits else 0.0,
+                "timeouts": self._timeouts,
+                "health_failures": self._health_failures,
+            }
@@ -1,8 +1,13 @@
 # backend/db/queries.py
-import pyodbc
+import os
+import argparse
+import base64
 import hashlib
 import json
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+
+from .pool import ConnectionPool, PooledConnection
 
 # ====== KẾT NỐI SQL SERVER (LocalDB) ======
 CONN_STR = (
@@ -13,10 +18,132 @@ CONN_STR = (
 )
 
 
-def get_conn():
+# ====== POOL KẾT NỐI ======
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+DB_POOL_IDLE_S = float(os.environ.get("DB_POOL_IDLE_S", "300"))       # rảnh quá lâu → đóng
+DB_POOL_TIMEOUT_S = float(os.environ.get("DB_POOL_TIMEOUT_S", "10"))  # chờ connection rảnh
+DB_POOL_CHECK_S = float(os.environ.get("DB_POOL_CHECK_S", "30"))      # rảnh quá → SELECT 1 trước khi dùng
+
+
+# DB_BACKEND=sqlite: chạy trên file SQLite DB_SQLITE_PATH (benchmark / máy không có SQL Server)
+DB_BACKEND = os.environ.get("DB_BACKEND", "mssql")
+DB_SQLITE_PATH = os.environ.get("DB_SQLITE_PATH", "saurieng.sqlite3")
+
+
+def _pyodbc_connect():
+    import pyodbc
     return pyodbc.connect(CONN_STR)
 
 
+def _sqlite_connect():
+    from .sqlite_standin import connect
+    return connect(DB_SQLITE_PATH)
+
+
+_connect: Callable[[], Any] = _sqlite_connect if DB_BACKEND == "sqlite" else _pyodbc_connect
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ConnectionPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConnectionPool(
+                    _connect,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    idle_timeout=DB_POOL_IDLE_S,
+                    timeout=DB_POOL_TIMEOUT_S,
+                    check_interval=DB_POOL_CHECK_S,
+                )
+    return _POOL
+
+
+def set_connect_factory(factory: Callable[[], Any]) -> None:
+    """
+    Đổi hàm tạo connection (vd. sqlite3 / driver giả khi test, benchmark).
+    Pool cũ bị đóng, pool mới tạo lại ở lần get_conn() kế tiếp.
+    """
+    global _connect, _POOL
+    with _POOL_LOCK:
+        old, _POOL = _POOL, None
+        _connect = factory
+    if old is not None:
+        old.close()
+
+
+def get_conn() -> PooledConnection:
+    """lấy connection từ pool; close() / ra khỏi `with` là trả về pool"""
+    return _pool().acquire()
+
+
+def warm_pool() -> int:
+    """mở sẵn DB_POOL_MIN connection (gọi lúc khởi động)"""
+    return _pool().fill()
+
+
+def pool_stats() -> Dict[str, object]:
+    return _pool().stats()
+
+
+# ====== ĐỌC CATALOG TỪ BẢN SAO (db/replica.py) ======
+# có bản sao → các hàm đọc Pests/PestPhotos/Drugs/PestDrugs dùng pool riêng trên file đó,
+# ghi + Users vẫn đi thẳng DB chính
+_READ_POOL: Optional[ConnectionPool] = None
+# bản sao chưa kịp kéo lần ghi mới nhất → đọc tạm từ DB chính (đọc lại thấy ngay dữ liệu vừa ghi)
+_READ_STALE = threading.Event()
+
+
+def set_read_connect_factory(factory: Optional[Callable[[], Any]]) -> None:
+    """None → đọc lại từ DB chính"""
+    global _READ_POOL
+    new = ConnectionPool(factory, min_size=0, max_size=DB_POOL_MAX, idle_timeout=DB_POOL_IDLE_S,
+                         timeout=DB_POOL_TIMEOUT_S, check_interval=DB_POOL_CHECK_S) if factory else None
+    with _POOL_LOCK:
+        old, _READ_POOL = _READ_POOL, new
+    if old is not None:
+        old.close()
+
+
+def set_read_stale(stale: bool) -> None:
+    if stale:
+        _READ_STALE.set()
+    else:
+        _READ_STALE.clear()
+
+
+def get_read_conn() -> PooledConnection:
+    """connection cho truy vấn đọc catalog: bản sao nếu có (và đã bắt kịp), không thì DB chính"""
+    pool = _READ_POOL
+    return pool.acquire() if pool is not None and not _READ_STALE.is_set() else get_conn()
+
+
+def read_pool_stats() -> Optional[Dict[str, object]]:
+    pool = _READ_POOL
+    return pool.stats() if pool is not None else None
+
+
+# ====== BÁO THAY ĐỔI CATALOG ======
+# gọi sau khi commit ghi vào Pests / PestPhotos / Drugs / PestDrugs (vd. để xoá cache)
+_WRITE_LISTENERS: List[Callable[[str], None]] = []
+
+
+def on_catalog_write(fn: Callable[[str], None]) -> Callable[[str], None]:
+    _WRITE_LISTENERS.append(fn)
+    return fn
+
+
+def _catalog_changed(table: str) -> None:
+    for fn in list(_WRITE_LISTENERS):
+        try:
+            fn(table)
+        except Exception as e:
+            print("[db] catalog listener failed:", e, flush=True)
+
+
 def rows_to_dicts(cursor, rows):
     cols = [c[0] for c in cursor.description]
     return [dict(zip(cols, r)) for r in rows]
@@ -33,148 +160,369 @@ def _maybe_json(value: Any):
         return None
 
 
-# ===================== PESTS =====================
+# ===================== TRUY VẤN THEO LÔ =====================
+# SQL Server giới hạn 2100 tham số / câu lệnh → chia IN (...) thành từng đoạn
+_IN_CHUNK = 1000
 
-def get_pests(search: Optional[str] = None) -> List[Dict[str, Any]]:
-    cn = get_conn()
-    cur = cn.cursor()
-    if search:
-        cur.execute(
-            """
-            SELECT Id, Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai
-            FROM dbo.Pests
-            WHERE TenThuong LIKE ? OR TenKhoaHoc LIKE ? OR Code LIKE ?
-            ORDER BY TenThuong
-            """,
-            f"%{search}%", f"%{search}%", f"%{search}%"
-        )
-    else:
+
+def _chunks(items: List[Any], n: int = _IN_CHUNK):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+def _placeholders(n: int) -> str:
+    return ", ".join("?" * n)
+
+
+def _unique(items) -> List[Any]:
+    return list(dict.fromkeys(x for x in items if x is not None))
+
+
+def _decode_pest(p: Dict[str, Any]) -> Dict[str, Any]:
+    p["NhanBietDecoded"] = _maybe_json(p.get("NhanBiet"))
+    p["BienPhapIPMDecoded"] = _maybe_json(p.get("BienPhapIPM"))
+    return p
+
+
+def _photos_by_pest(cur, pest_ids: List[int]) -> Dict[int, List[str]]:
+    """PestId -> [Url] (theo Id tăng dần), 1 câu / đoạn; bảng ảnh lỗi → {}"""
+    out: Dict[int, List[str]] = {}
+    try:
+        for part in _chunks(_unique(pest_ids)):
+            cur.execute(
+                f"""
+                SELECT PestId, Url
+                FROM dbo.PestPhotos
+                WHERE PestId IN ({_placeholders(len(part))})
+                ORDER BY PestId, Id
+                """,
+                *part
+            )
+            for pest_id, url in cur.fetchall():
+                out.setdefault(int(pest_id), []).append(url)
+    except Exception:
+        # bảng ảnh chưa đúng cấu trúc -> cứ để rỗng
+        return {}
+    return out
+
+
+def _pests_by_code(cur, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for part in _chunks(codes):
         cur.execute(
-            """
-            SELECT Id, Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai
-            FROM dbo.Pests
-            ORDER BY TenThuong
-            """
+            f"SELECT * FROM dbo.Pests WHERE Code IN ({_placeholders(len(part))})",
+            *part
         )
+        for p in rows_to_dicts(cur, cur.fetchall()):
+            out.setdefault(p["Code"], p)
+    return out
 
-    pests = rows_to_dicts(cur, cur.fetchall())
 
-    # lấy 1 ảnh nếu bảng ảnh đúng, nếu không thì bỏ qua
-    for p in pests:
-        try:
+def _drugs_by_code(cur, codes: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    out: Dict[str, List[Dict[str, Any]]] = {c: [] for c in codes}
+    try:
+        for part in _chunks(codes):
             cur.execute(
-                "SELECT TOP 1 Url FROM dbo.PestPhotos WHERE PestId = ? ORDER BY Id ASC",
-                p["Id"]
+                f"""
+                SELECT p.Code AS PestCode, d.*
+                FROM dbo.Drugs d
+                JOIN dbo.PestDrugs pd ON pd.DrugId = d.Id
+                JOIN dbo.Pests p ON p.Id = pd.PestId
+                WHERE p.Code IN ({_placeholders(len(part))})
+                ORDER BY p.Code, d.Ten
+                """,
+                *part
             )
-            r = cur.fetchone()
-            p["Photos"] = [r[0]] if r else []
-        except Exception:
-            # bảng ảnh chưa đúng cấu trúc -> cứ để rỗng
-            p["Photos"] = []
+            for d in rows_to_dicts(cur, cur.fetchall()):
+                out.setdefault(d.pop("PestCode"), []).append(d)
+    except Exception:
+        # bảng hoặc cột không đúng -> [] để API không 500
+        return {c: [] for c in codes}
+    return out
 
-        p["NhanBietDecoded"] = _maybe_json(p.get("NhanBiet"))
-        p["BienPhapIPMDecoded"] = _maybe_json(p.get("BienPhapIPM"))
 
-    cn.close()
+def get_pest_details(codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Code -> chi tiết sâu (kèm Photos, *Decoded) cho cả danh sách mã,
+    chỉ 2 câu SQL (Pests + PestPhotos) trên 1 connection. Mã không có → không có key.
+    """
+    codes = _unique(codes)
+    if not codes:
+        return {}
+    with get_read_conn() as cn:
+        cur = cn.cursor()
+        pests = _pests_by_code(cur, codes)
+        photos = _photos_by_pest(cur, [p["Id"] for p in pests.values()])
+    for p in pests.values():
+        p["Photos"] = photos.get(int(p["Id"]), [])
+        _decode_pest(p)
     return pests
 
 
-def get_pest_detail(code: str) -> Optional[Dict[str, Any]]:
-    cn = get_conn()
-    cur = cn.cursor()
+def get_drugs_for_pests(codes: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Code -> [thuốc] cho cả danh sách mã trong 1 câu JOIN"""
+    codes = _unique(codes)
+    if not codes:
+        return {}
+    with get_read_conn() as cn:
+        return _drugs_by_code(cn.cursor(), codes)
+
+
+def get_catalog_for_codes(codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Code -> {"detail", "drugs"} cho kết quả /classify: 1 connection, 3 câu SQL
+    bất kể top-k bao nhiêu.
+    """
+    codes = _unique(codes)
+    if not codes:
+        return {}
+    with get_read_conn() as cn:
+        cur = cn.cursor()
+        pests = _pests_by_code(cur, codes)
+        photos = _photos_by_pest(cur, [p["Id"] for p in pests.values()])
+        drugs = _drugs_by_code(cur, codes)
+    out = {}
+    for c in codes:
+        p = pests.get(c)
+        if p is not None:
+            p["Photos"] = photos.get(int(p["Id"]), [])
+            _decode_pest(p)
+        out[c] = {"detail": p, "drugs": drugs.get(c, [])}
+    return out
+
+
+# ===================== PHÂN TRANG / STREAM =====================
+# keyset: (cột sắp xếp, Id) của dòng cuối trang → trang sau bắt đầu ngay sau đó,
+# không OFFSET nên trang 100 cũng nhanh như trang 1
+PAGE_MAX = int(os.environ.get("PAGE_MAX", "500"))
+STREAM_BATCH = int(os.environ.get("STREAM_BATCH", "500"))
+
+_PEST_LIST_SELECT = (
+    "SELECT Id, Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai FROM dbo.Pests"
+)
+_DRUG_LIST_SELECT = "SELECT * FROM dbo.Drugs"
+
+# cột sắp xếp của keyset: phải NOT NULL + có index (cột, Id); DB SQL Server cũ chạy
+# `python -m db.queries --migrate` 1 lần (NULL → N'', ALTER ... NOT NULL, tạo index)
+SORT_COLUMNS = {"Pests": "TenThuong", "Drugs": "Ten"}
+
+_SORT_DDL = """
+UPDATE dbo.{tbl} SET {col} = N'' WHERE {col} IS NULL;
+IF COLUMNPROPERTY(OBJECT_ID('dbo.{tbl}'), '{col}', 'AllowsNull') = 1
+BEGIN
+    DECLARE @len smallint = (SELECT max_length FROM sys.columns
+                             WHERE object_id = OBJECT_ID('dbo.{tbl}') AND name = '{col}');
+    DECLARE @sql nvarchar(400) = N'ALTER TABLE dbo.{tbl} ALTER COLUMN {col} nvarchar('
+        + CASE WHEN @len = -1 THEN N'max' ELSE CAST(@len / 2 AS nvarchar(10)) END + N') NOT NULL';
+    EXEC (@sql);
+END;
+IF OBJECT_ID('DF_{tbl}_{col}') IS NULL
+    ALTER TABLE dbo.{tbl} ADD CONSTRAINT DF_{tbl}_{col} DEFAULT N'' FOR {col};
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{tbl}_{col}' AND object_id = OBJECT_ID('dbo.{tbl}'))
+    CREATE INDEX IX_{tbl}_{col} ON dbo.{tbl} ({col}, Id);
+"""
+
+
+def migrate_sort_columns() -> None:
+    """SQL Server: cột sắp xếp keyset → NOT NULL DEFAULT N'' + index (cột, Id); chạy lại không sao"""
+    with get_conn() as cn:
+        cur = cn.cursor()
+        for tbl, col in SORT_COLUMNS.items():
+            cur.execute(_SORT_DDL.format(tbl=tbl, col=col))
+            print(f"[queries] {tbl}.{col}: NOT NULL + IX_{tbl}_{col}")
+        cn.commit()
 
-    cur.execute("SELECT TOP 1 * FROM dbo.Pests WHERE Code = ?", code)
-    row = cur.fetchone()
-    if not row:
-        cn.close()
-        return None
 
-    cols = [c[0] for c in cur.description]
-    pest = dict(zip(cols, row))
+def encode_cursor(sort_value: Optional[str], row_id: int) -> str:
+    raw = json.dumps([sort_value or "", int(row_id)], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-    # ảnh
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """cursor hỏng → ValueError"""
     try:
-        cur.execute(
-            """
-            SELECT Url
-            FROM dbo.PestPhotos
-            WHERE PestId = ?
-            ORDER BY Id ASC
-            """,
-            pest["Id"]
-        )
-        pest["Photos"] = [r[0] for r in cur.fetchall()]
-    except Exception:
-        pest["Photos"] = []
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw.decode("utf-8"))
+        return str(sort_value), int(row_id)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {e}") from None
+
+
+def _keyset_sql(select: str, sort_col: str, after: Optional[Tuple[str, int]]) -> Tuple[str, tuple]:
+    # cột sắp xếp NOT NULL (xem SORT_COLUMNS) → so/ORDER BY trên cột gốc, seek được index (cột, Id)
+    where, params = "", ()
+    if after is not None:
+        # "col >= ?" đứng riêng để optimizer seek index, phần OR chỉ lọc dòng trùng giá trị
+        where = f" WHERE {sort_col} >= ? AND ({sort_col} > ? OR Id > ?)"
+        params = (after[0], after[0], after[1])
+    return f"{select}{where} ORDER BY {sort_col}, Id", params
+
+
+def _page(select: str, sort_col: str, limit: int, cursor: Optional[str],
+          enrich: Optional[Callable[[Any, List[Dict[str, Any]]], None]] = None
+          ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    limit = max(1, min(int(limit), PAGE_MAX))
+    sql, params = _keyset_sql(select, sort_col, decode_cursor(cursor) if cursor else None)
+    with get_read_conn() as cn:
+        cur = cn.cursor()
+        cur.execute(sql, *params)
+        # chỉ kéo limit + 1 dòng (dòng thừa để biết còn trang sau), phần còn lại bỏ
+        rows = rows_to_dicts(cur, cur.fetchmany(limit + 1))
+        cur.close()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if enrich is not None and rows:
+            enrich(cn.cursor(), rows)
+    nxt = encode_cursor(rows[-1][sort_col], rows[-1]["Id"]) if more and rows else None
+    return rows, nxt
+
+
+def _iter_batches(select: str, sort_col: str, batch: int,
+                  enrich: Optional[Callable[[Any, List[Dict[str, Any]]], None]] = None
+                  ) -> Iterator[List[Dict[str, Any]]]:
+    """
+    đọc dần theo keyset: mỗi lô 1 câu TOP n đọc hết rồi mới tra thêm (ảnh) trên cùng connection
+    (không MARS thì không chạy câu thứ 2 khi kết quả còn dở) → cả stream chỉ giữ 1 connection
+    """
+    top = select.replace("SELECT ", f"SELECT TOP {int(batch)} ", 1)
+    after: Optional[Tuple[str, int]] = None
+    with get_read_conn() as cn:
+        cur = cn.cursor()
+        while True:
+            sql, params = _keyset_sql(top, sort_col, after)
+            cur.execute(sql, *params)
+            rows = rows_to_dicts(cur, cur.fetchall())
+            if not rows:
+                break
+            if enrich is not None:
+                enrich(cur, rows)
+            yield rows
+            if len(rows) < batch:
+                break
+            after = (rows[-1][sort_col], rows[-1]["Id"])
+
+
+def _first_photo(cur, pests: List[Dict[str, Any]]) -> None:
+    photos = _photos_by_pest(cur, [p["Id"] for p in pests])
+    for p in pests:
+        p["Photos"] = photos.get(int(p["Id"]), [])[:1]
+        _decode_pest(p)
+
+
+def page_pests(limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """1 trang sâu theo TenThuong, Id → (items, next_cursor | None)"""
+    return _page(_PEST_LIST_SELECT, "TenThuong", limit, cursor, _first_photo)
+
+
+def page_drugs(limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """1 trang thuốc theo Ten, Id → (items, next_cursor | None)"""
+    return _page(_DRUG_LIST_SELECT, "Ten", limit, cursor)
+
 
-    pest["NhanBietDecoded"] = _maybe_json(pest.get("NhanBiet"))
-    pest["BienPhapIPMDecoded"] = _maybe_json(pest.get("BienPhapIPM"))
+def iter_pest_batches(batch: int = STREAM_BATCH) -> Iterator[List[Dict[str, Any]]]:
+    return _iter_batches(_PEST_LIST_SELECT, "TenThuong", batch, _first_photo)
 
-    cn.close()
-    return pest
+
+def iter_drug_batches(batch: int = STREAM_BATCH) -> Iterator[List[Dict[str, Any]]]:
+    return _iter_batches(_DRUG_LIST_SELECT, "Ten", batch)
+
+
+# ===================== PESTS =====================
+
+def get_pests(search: Optional[str] = None) -> List[Dict[str, Any]]:
+    with get_read_conn() as cn:
+        cur = cn.cursor()
+        if search:
+            cur.execute(
+                """
+                SELECT Id, Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai
+                FROM dbo.Pests
+                WHERE TenThuong LIKE ? OR TenKhoaHoc LIKE ? OR Code LIKE ?
+                ORDER BY TenThuong
+                """,
+                f"%{search}%", f"%{search}%", f"%{search}%"
+            )
+        else:
+            cur.execute(
+                """
+                SELECT Id, Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai
+                FROM dbo.Pests
+                ORDER BY TenThuong
+                """
+            )
+
+        pests = rows_to_dicts(cur, cur.fetchall())
+        # ảnh của mọi sâu trong 1 câu thay vì 1 câu / sâu
+        photos = _photos_by_pest(cur, [p["Id"] for p in pests])
+
+    for p in pests:
+        # danh sách chỉ cần 1 ảnh đại diện
+        p["Photos"] = photos.get(int(p["Id"]), [])[:1]
+        _decode_pest(p)
+    return pests
+
+
+def get_pest_detail(code: str) -> Optional[Dict[str, Any]]:
+    return get_pest_details([code]).get(code)
 
 
 def create_pest(data: Dict[str, Any]) -> Tuple[bool, Optional[int], Optional[str]]:
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute(
-            """
-            INSERT INTO dbo.Pests (Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai)
-            OUTPUT INSERTED.Id
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            data.get("Code"),
-            data.get("TenThuong"),
-            data.get("TenKhoaHoc"),
-            data.get("MoTaNgan"),
-            data.get("NhanBiet"),
-            data.get("BienPhapIPM"),
-            data.get("TacHai"),
-        )
-        new_id = int(cur.fetchone()[0])
-        cn.commit()
-        return True, new_id, None
-    except Exception as e:
-        cn.rollback()
-        return False, None, str(e)
-    finally:
-        cn.close()
+    with get_conn() as cn:
+        cur = cn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO dbo.Pests (Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai)
+                OUTPUT INSERTED.Id
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                data.get("Code"),
+                data.get("TenThuong") or "",
+                data.get("TenKhoaHoc"),
+                data.get("MoTaNgan"),
+                data.get("NhanBiet"),
+                data.get("BienPhapIPM"),
+                data.get("TacHai"),
+            )
+            new_id = int(cur.fetchone()[0])
+            cn.commit()
+            _catalog_changed("Pests")
+            return True, new_id, None
+        except Exception as e:
+            cn.rollback()
+            return False, None, str(e)
 
 
 def add_pest_photo(code: str, url: str) -> bool:
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute("SELECT Id FROM dbo.Pests WHERE Code = ?", code)
-        r = cur.fetchone()
-        if not r:
-            cn.close()
+    with get_conn() as cn:
+        cur = cn.cursor()
+        try:
+            cur.execute("SELECT Id FROM dbo.Pests WHERE Code = ?", code)
+            r = cur.fetchone()
+            if not r:
+                return False
+            pest_id = int(r[0])
+
+            # nếu bảng đúng cột
+            cur.execute("INSERT INTO dbo.PestPhotos (PestId, Url) VALUES(?, ?)", pest_id, url)
+            cn.commit()
+            _catalog_changed("PestPhotos")
+            return True
+        except Exception:
+            cn.rollback()
             return False
-        pest_id = int(r[0])
-
-        # nếu bảng đúng cột
-        cur.execute("INSERT INTO dbo.PestPhotos (PestId, Url) VALUES(?, ?)", pest_id, url)
-        cn.commit()
-        return True
-    except Exception:
-        cn.rollback()
-        return False
-    finally:
-        cn.close()
 
 
 # ===================== DRUGS =====================
 
 def get_drugs() -> List[Dict[str, Any]]:
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute("SELECT * FROM dbo.Drugs ORDER BY Ten")
-        rows = rows_to_dicts(cur, cur.fetchall())
-    except Exception:
-        rows = []
-    cn.close()
+    with get_read_conn() as cn:
+        cur = cn.cursor()
+        try:
+            cur.execute("SELECT * FROM dbo.Drugs ORDER BY Ten")
+            rows = rows_to_dicts(cur, cur.fetchall())
+        except Exception:
+            rows = []
     return rows
 
 
@@ -182,84 +530,63 @@ def get_drugs_for_pest(code: str) -> List[Dict[str, Any]]:
     """
     Trường hợp bảng hoặc cột không đúng -> trả [] để API không 500.
     """
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute(
-            """
-            SELECT d.*
-            FROM dbo.Drugs d
-            JOIN dbo.PestDrugs pd ON pd.DrugId = d.Id
-            JOIN dbo.Pests p ON p.Id = pd.PestId
-            WHERE p.Code = ?
-            ORDER BY d.Ten
-            """,
-            code
-        )
-        rows = rows_to_dicts(cur, cur.fetchall())
-    except Exception:
-        rows = []
-    cn.close()
-    return rows
+    return get_drugs_for_pests([code]).get(code, [])
 
 
 def create_drug(data: Dict[str, Any]) -> Tuple[bool, Optional[int], Optional[str]]:
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute(
-            """
-            INSERT INTO dbo.Drugs (Ten, HoatChat, Nhom, Hang, HuongDan, GhiChu)
-            OUTPUT INSERTED.Id
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            data.get("Ten"),
-            data.get("HoatChat"),
-            data.get("Nhom"),
-            data.get("Hang"),
-            data.get("HuongDan"),
-            data.get("GhiChu"),
-        )
-        new_id = int(cur.fetchone()[0])
-        cn.commit()
-        return True, new_id, None
-    except Exception as e:
-        cn.rollback()
-        return False, None, str(e)
-    finally:
-        cn.close()
+    with get_conn() as cn:
+        cur = cn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO dbo.Drugs (Ten, HoatChat, Nhom, Hang, HuongDan, GhiChu)
+                OUTPUT INSERTED.Id
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                data.get("Ten"),
+                data.get("HoatChat"),
+                data.get("Nhom"),
+                data.get("Hang"),
+                data.get("HuongDan"),
+                data.get("GhiChu"),
+            )
+            new_id = int(cur.fetchone()[0])
+            cn.commit()
+            _catalog_changed("Drugs")
+            return True, new_id, None
+        except Exception as e:
+            cn.rollback()
+            return False, None, str(e)
 
 
 def link_drug_to_pest(code: str, drug_id: int) -> bool:
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute("SELECT Id FROM dbo.Pests WHERE Code = ?", code)
-        r = cur.fetchone()
-        if not r:
-            cn.close()
-            return False
-        pest_id = int(r[0])
+    with get_conn() as cn:
+        cur = cn.cursor()
+        try:
+            cur.execute("SELECT Id FROM dbo.Pests WHERE Code = ?", code)
+            r = cur.fetchone()
+            if not r:
+                return False
+            pest_id = int(r[0])
 
-        # nếu bảng mapping chưa đúng sẽ rơi vào except → False
-        cur.execute(
-            """
-            MERGE dbo.PestDrugs AS t
-            USING (SELECT ? AS PestId, ? AS DrugId) AS s
-            ON (t.PestId = s.PestId AND t.DrugId = s.DrugId)
-            WHEN NOT MATCHED THEN
-            INSERT (PestId, DrugId) VALUES (s.PestId, s.DrugId);
-            """,
-            pest_id,
-            int(drug_id),
-        )
-        cn.commit()
-        return True
-    except Exception:
-        cn.rollback()
-        return False
-    finally:
-        cn.close()
+            # nếu bảng mapping chưa đúng sẽ rơi vào except → False
+            cur.execute(
+                """
+                MERGE dbo.PestDrugs AS t
+                USING (SELECT ? AS PestId, ? AS DrugId) AS s
+                ON (t.PestId = s.PestId AND t.DrugId = s.DrugId)
+                WHEN NOT MATCHED THEN
+                INSERT (PestId, DrugId) VALUES (s.PestId, s.DrugId);
+                """,
+                pest_id,
+                int(drug_id),
+            )
+            cn.commit()
+            _catalog_changed("PestDrugs")
+            return True
+        except Exception:
+            cn.rollback()
+            return False
 
 
 # ===================== AUTH =====================
@@ -269,46 +596,51 @@ def sha256_hex(s: str) -> str:
 
 
 def create_user(username: str, password: str) -> bool:
-    cn = get_conn()
-    cur = cn.cursor()
-    try:
-        cur.execute(
-            "INSERT INTO dbo.Users (Username, PasswordHash) VALUES (?, ?)",
-            username,
-            sha256_hex(password),
-        )
-        cn.commit()
-        return True
-    except Exception:
-        cn.rollback()
-        return False
-    finally:
-        cn.close()
+    with get_conn() as cn:
+        cur = cn.cursor()
+        try:
+            cur.execute(
+                "INSERT INTO dbo.Users (Username, PasswordHash) VALUES (?, ?)",
+                username,
+                sha256_hex(password),
+            )
+            cn.commit()
+            return True
+        except Exception:
+            cn.rollback()
+            return False
 
 
 def check_login(username: str, password: str) -> bool:
-    cn = get_conn()
-    cur = cn.cursor()
-    cur.execute("SELECT PasswordHash FROM dbo.Users WHERE Username = ?", username)
-    row = cur.fetchone()
-    cn.close()
+    with get_conn() as cn:
+        cur = cn.cursor()
+        cur.execute("SELECT PasswordHash FROM dbo.Users WHERE Username = ?", username)
+        row = cur.fetchone()
     return bool(row and row[0] == sha256_hex(password))
 
 
 def get_user(username: str) -> Optional[Dict[str, Any]]:
-    cn = get_conn()
-    cur = cn.cursor()
-    cur.execute("SELECT TOP 1 * FROM dbo.Users WHERE Username = ?", username)
-    row = cur.fetchone()
-    if not row:
-        cn.close()
-        return None
-    cols = [c[0] for c in cur.description]
-    u = dict(zip(cols, row))
-    cn.close()
-    return u
+    with get_conn() as cn:
+        cur = cn.cursor()
+        cur.execute("SELECT TOP 1 * FROM dbo.Users WHERE Username = ?", username)
+        row = cur.fetchone()
+        if not row:
+            return None
+        cols = [c[0] for c in cur.description]
+    return dict(zip(cols, row))
 
 
 def is_admin(username: str) -> bool:
     u = get_user(username)
     return bool(u and u.get("IsAdmin"))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Tiện ích DB chính")
+    ap.add_argument("--migrate", action="store_true",
+                    help="cột sắp xếp phân trang → NOT NULL + index (SQL Server)")
+    args = ap.parse_args()
+    if args.migrate:
+        migrate_sort_columns()
+    else:
+        ap.print_help()
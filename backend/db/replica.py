@@ -0,0 +1,287 @@
+# backend/db/replica.py
+"""
+Bản sao catalog chỉ-đọc trong 1 file SQLite cạnh API (máy ở văn phòng xa, WAN chậm).
+
+- Pests / PestPhotos / Drugs / PestDrugs chép về file CATALOG_REPLICA_PATH
+  (schema của db/sqlite_standin.py)
+- đồng bộ tăng dần: so (Id, SHA-256 nội dung dòng) với DB chính, chỉ kéo dòng đổi,
+  xoá dòng đã mất; chạy mỗi CATALOG_REPLICA_SYNC_S giây và ở nền ngay sau mỗi lần ghi qua API
+  (trong lúc chờ, các hàm đọc tạm đi DB chính)
+- có bản sao → get_pests / get_pest_detail / get_drugs / get_drugs_for_pest (+ phân trang)
+  đọc từ file; ghi và Users vẫn đi DB chính
+- DB chính mất kết nối: vẫn phục vụ bản đã chép (kể cả sau khi restart)
+
+Tạo / làm mới bằng tay:
+    python -m db.replica            # tăng dần
+    python -m db.replica --full     # chép lại toàn bộ
+"""
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import queries
+from .sqlite_standin import LOB_EMPTY, SCHEMA, connect
+
+# =========================
+#  CẤU HÌNH
+# =========================
+# rỗng: tắt, đọc thẳng DB chính
+CATALOG_REPLICA_PATH = os.environ.get("CATALOG_REPLICA_PATH", "")
+# <= 0: chỉ đồng bộ lúc khởi động và sau khi ghi qua API
+CATALOG_REPLICA_SYNC_S = float(os.environ.get("CATALOG_REPLICA_SYNC_S", "300"))
+
+# bảng có Id -> các cột chép (đúng như SCHEMA)
+TABLES: Dict[str, Tuple[str, ...]] = {
+    "Pests": ("Code", "TenThuong", "TenKhoaHoc", "MoTaNgan", "NhanBiet", "BienPhapIPM", "TacHai"),
+    "PestPhotos": ("PestId", "Url"),
+    "Drugs": ("Ten", "HoatChat", "Nhom", "Hang", "HuongDan", "GhiChu"),
+}
+
+_STATE = """
+CREATE TABLE IF NOT EXISTS _ReplicaRows (
+    Tbl TEXT NOT NULL,
+    Id INTEGER NOT NULL,
+    Chk BLOB,
+    PRIMARY KEY (Tbl, Id)
+);
+CREATE TABLE IF NOT EXISTS _ReplicaMeta (K TEXT PRIMARY KEY, V TEXT);
+"""
+
+
+def _row_hash(cols: Tuple[str, ...]) -> str:
+    """
+    HASHBYTES('SHA2_256') trên các cột nối lại; BINARY_CHECKSUM bỏ sót thay đổi (nhất là nvarchar dài).
+    Mỗi cột mã hoá "độ dài:giá trị" (NULL → "-") để không nhập nhằng khi nối.
+    """
+    parts = ", ".join(f"CASE WHEN {c} IS NULL THEN N'-' ELSE CONCAT(DATALENGTH({c}), N':', {c}) END"
+                      for c in cols)
+    return f"HASHBYTES('SHA2_256', CONCAT({LOB_EMPTY}, {parts}))"
+
+
+class CatalogReplica:
+    def __init__(self, path: str, interval: float = CATALOG_REPLICA_SYNC_S):
+        self.path = path
+        self.interval = float(interval)
+        self.serving = False               # hàm đọc của db.queries đang dùng file này
+        self._sync_lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()     # có ghi qua API → sync ngay, không đợi hết interval
+        self._thread: Optional[threading.Thread] = None
+        self._writes = 0                   # số lần ghi qua API (so trước/sau sync)
+
+        self.syncs = 0
+        self.sync_errors = 0
+        self.last_error: Optional[str] = None
+        self.last_sync_at: Optional[float] = None
+        self.last_sync_ms = 0.0
+        self.last_changes: Dict[str, Dict[str, int]] = {}
+
+    # ---------- file ----------
+    def _local(self) -> sqlite3.Connection:
+        # không bật foreign_keys: thứ tự chép theo bảng, tính nhất quán do DB chính đảm bảo
+        raw = sqlite3.connect(self.path, timeout=30)
+        raw.execute("PRAGMA journal_mode = WAL")
+        return raw
+
+    def _reader(self):
+        return connect(self.path)
+
+    def _serve(self) -> None:
+        if not self.serving:
+            queries.set_read_connect_factory(self._reader)
+            self.serving = True
+            print(f"[replica] serving catalog reads from {self.path}", flush=True)
+
+    def open(self) -> None:
+        """tạo schema; file đã có bản chép → phục vụ ngay (không chờ DB chính)"""
+        raw = self._local()
+        try:
+            raw.executescript(SCHEMA + _STATE)
+            row = raw.execute("SELECT V FROM _ReplicaMeta WHERE K = 'last_sync'").fetchone()
+        finally:
+            raw.close()
+        if row:
+            self.last_sync_at = float(row[0])
+            self._serve()
+
+    # ---------- đồng bộ ----------
+    def _fetch_remote(self, full: bool, local: Dict[str, Dict[int, bytes]]):
+        """
+        đọc từ DB chính: hash mọi dòng, nội dung dòng đổi, toàn bộ cặp PestDrugs.
+        Các câu chạy lần lượt (không snapshot chung): ghi chen giữa sẽ được lần sync sau bắt kịp.
+        """
+        upserts: Dict[str, List[tuple]] = {}
+        deletes: Dict[str, List[int]] = {}
+        with queries.get_conn() as cn:
+            cur = cn.cursor()
+            for tbl, cols in TABLES.items():
+                cur.execute(f"SELECT Id, {_row_hash(cols)} FROM dbo.{tbl}")
+                remote = {int(i): bytes(c) for i, c in cur.fetchall()}
+                have = local.get(tbl, {})
+                changed = [i for i, c in remote.items() if full or have.get(i) != c]
+                deletes[tbl] = [i for i in have if i not in remote]
+                rows = []
+                for part in queries._chunks(changed):
+                    cur.execute(
+                        f"SELECT Id, {', '.join(cols)} FROM dbo.{tbl} "
+                        f"WHERE Id IN ({queries._placeholders(len(part))})",
+                        *part
+                    )
+                    rows.extend((tuple(r), remote[int(r[0])]) for r in cur.fetchall())
+                upserts[tbl] = rows
+            cur.execute("SELECT PestId, DrugId FROM dbo.PestDrugs")
+            links = {(int(p), int(d)) for p, d in cur.fetchall()}
+        return upserts, deletes, links
+
+    def sync(self, full: bool = False) -> Dict[str, Dict[str, int]]:
+        """1 lượt đồng bộ; ghi vào file trong 1 transaction (người đọc thấy bản cũ hoặc bản mới)"""
+        with self._sync_lock:
+            t0 = time.perf_counter()
+            writes = self._writes
+            raw = self._local()
+            try:
+                local: Dict[str, Dict[int, bytes]] = {t: {} for t in TABLES}
+                for tbl, i, chk in raw.execute("SELECT Tbl, Id, Chk FROM _ReplicaRows"):
+                    local.setdefault(tbl, {})[i] = chk
+                have_links: Set[Tuple[int, int]] = set(raw.execute("SELECT PestId, DrugId FROM PestDrugs"))
+
+                upserts, deletes, links = self._fetch_remote(full, local)
+
+                changes: Dict[str, Dict[str, int]] = {}
+                now = time.time()
+                with raw:
+                    for tbl, cols in TABLES.items():
+                        gone = [(i,) for i in deletes[tbl]]
+                        raw.executemany(f"DELETE FROM {tbl} WHERE Id = ?", gone)
+                        raw.executemany(f"DELETE FROM _ReplicaRows WHERE Tbl = '{tbl}' AND Id = ?", gone)
+                        rows = upserts[tbl]
+                        raw.executemany(
+                            f"INSERT OR REPLACE INTO {tbl} (Id, {', '.join(cols)}) "
+                            f"VALUES ({queries._placeholders(len(cols) + 1)})",
+                            [r for r, _ in rows],
+                        )
+                        raw.executemany(
+                            f"INSERT OR REPLACE INTO _ReplicaRows (Tbl, Id, Chk) VALUES ('{tbl}', ?, ?)",
+                            [(r[0], chk) for r, chk in rows],
+                        )
+                        changes[tbl] = {"upserted": len(rows), "deleted": len(gone)}
+                    removed = list(have_links - links)
+                    added = list(links - have_links)
+                    raw.executemany("DELETE FROM PestDrugs WHERE PestId = ? AND DrugId = ?", removed)
+                    raw.executemany("INSERT INTO PestDrugs (PestId, DrugId) VALUES (?, ?)", added)
+                    changes["PestDrugs"] = {"upserted": len(added), "deleted": len(removed)}
+                    raw.execute("INSERT OR REPLACE INTO _ReplicaMeta (K, V) VALUES ('last_sync', ?)", (repr(now),))
+            except Exception as e:
+                self.sync_errors += 1
+                self.last_error = str(e)
+                raise
+            finally:
+                raw.close()
+
+            self.syncs += 1
+            self.last_error = None
+            self.last_sync_at = now
+            self.last_sync_ms = (time.perf_counter() - t0) * 1000.0
+            self.last_changes = changes
+            was_serving = self.serving
+            self._serve()
+            if self._writes == writes:
+                # đã kéo hết các lần ghi trước lúc bắt đầu sync → đọc lại từ bản sao
+                queries.set_read_stale(False)
+
+        if not was_serving or any(c["upserted"] or c["deleted"] for c in changes.values()):
+            self._notify("replica")
+        return changes
+
+    def _safe_sync(self) -> None:
+        try:
+            self.sync()
+        except Exception as e:
+            print("[replica] sync failed:", e, flush=True)
+
+    # ---------- sự kiện ----------
+    def on_change(self, fn: Callable[[str], None]) -> Callable[[str], None]:
+        """gọi sau khi bản sao đổi (vd. CATALOG.invalidate)"""
+        self._listeners.append(fn)
+        return fn
+
+    def _notify(self, table: str) -> None:
+        for fn in list(self._listeners):
+            try:
+                fn(table)
+            except Exception as e:
+                print("[replica] listener failed:", e, flush=True)
+
+    def _on_write(self, table: str) -> None:
+        # không sync trong request (quét checksum qua WAN chậm): đánh dấu bản sao cũ để đọc
+        # tạm từ DB chính, bỏ cache catalog ngay, rồi đánh thức thread nền kéo về
+        self._writes += 1
+        queries.set_read_stale(True)
+        self._notify(table)
+        self._wake.set()
+
+    # ---------- chạy nền ----------
+    def _loop(self) -> None:
+        self._safe_sync()
+        while not self._stop.is_set():
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self._safe_sync()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="catalog-replica", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": True,
+            "path": self.path,
+            "serving": self.serving,
+            "stale": queries._READ_STALE.is_set(),
+            "interval_s": self.interval,
+            "age_s": (time.time() - self.last_sync_at) if self.last_sync_at else None,
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors,
+            "last_error": self.last_error,
+            "last_sync_ms": self.last_sync_ms,
+            "last_changes": self.last_changes,
+            "read_pool": queries.read_pool_stats(),
+        }
+
+
+REPLICA: Optional[CatalogReplica] = None
+if CATALOG_REPLICA_PATH:
+    REPLICA = CatalogReplica(CATALOG_REPLICA_PATH)
+    REPLICA.open()
+    queries.on_catalog_write(REPLICA._on_write)
+
+
+def replica_stats() -> Dict[str, object]:
+    return REPLICA.stats() if REPLICA is not None else {"enabled": False}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Đồng bộ bản sao catalog SQLite từ DB chính")
+    ap.add_argument("--path", default=CATALOG_REPLICA_PATH or "catalog_replica.sqlite3")
+    ap.add_argument("--full", action="store_true", help="chép lại toàn bộ thay vì chỉ dòng đổi")
+    args = ap.parse_args()
+    r = REPLICA if REPLICA is not None and REPLICA.path == args.path else CatalogReplica(args.path)
+    r.open()
+    t0 = time.perf_counter()
+    changes = r.sync(full=args.full)
+    print(f"[replica] {args.path} synced in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    for tbl, c in changes.items():
+        print(f"  {tbl:11s} +{c['upserted']} -{c['deleted']}")
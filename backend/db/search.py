@@ -0,0 +1,204 @@
+# backend/db/search.py
+import re
+import time
+import bisect
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# trường được tìm + trọng số (giống LIKE cũ: TenThuong / TenKhoaHoc / Code)
+FIELDS = (("TenThuong", 3.0), ("Code", 3.0), ("TenKhoaHoc", 2.0))
+
+# điểm theo kiểu khớp token
+_EXACT = 1.0
+_PREFIX = 0.7
+_FUZZY = 0.5
+_MIN_TRIGRAM_SIM = 0.4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: Optional[str]) -> str:
+    """bỏ dấu tiếng Việt + chữ thường: "Sâu đục thân" → "sau duc than" """
+    if not text:
+        return ""
+    s = text.lower().replace("đ", "d")
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(folded: str) -> List[str]:
+    return _TOKEN_RE.findall(folded)
+
+
+def _trigrams(token: str) -> Set[str]:
+    t = f"${token}$"
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class SearchIndex:
+    """
+    Index tìm kiếm trong RAM cho Pests:
+    - so khớp đã bỏ dấu (gõ "sau duc than" vẫn ra "sâu đục thân")
+    - token khớp đúng > khớp tiền tố (gõ dở) > gần đúng theo trigram (gõ sai)
+    - chuỗi con như LIKE '%q%' cũ vẫn khớp, có cộng điểm
+    - update() chỉ tách token lại cho bản ghi mới / đổi / bị xoá
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs: Dict[int, Dict[str, Any]] = {}               # Id -> pest
+        self._sig: Dict[int, Tuple] = {}                           # Id -> giá trị các trường
+        self._fields: Dict[int, List[Tuple[str, float]]] = {}      # Id -> [(trường đã fold, trọng số)]
+        self._doc_tokens: Dict[int, Dict[str, float]] = {}         # Id -> token -> trọng số
+        self._postings: Dict[str, Set[int]] = {}                   # token -> {Id}
+        self._tri: Dict[str, Set[str]] = {}                        # trigram -> {token}
+        self._vocab: List[str] = []                                # token đã sort (tìm tiền tố)
+
+        self.updates = 0
+        self.reindexed = 0
+        self.last_update_ms = 0.0
+
+    # ---------- cập nhật ----------
+    def _add_token(self, tok: str) -> None:
+        self._postings[tok] = set()
+        for g in _trigrams(tok):
+            self._tri.setdefault(g, set()).add(tok)
+
+    def _drop_token(self, tok: str) -> None:
+        del self._postings[tok]
+        for g in _trigrams(tok):
+            toks = self._tri.get(g)
+            if toks is not None:
+                toks.discard(tok)
+                if not toks:
+                    del self._tri[g]
+
+    def _remove(self, doc_id: int) -> bool:
+        vocab_changed = False
+        for tok in self._doc_tokens.pop(doc_id, {}):
+            docs = self._postings.get(tok)
+            if docs is None:
+                continue
+            docs.discard(doc_id)
+            if not docs:
+                self._drop_token(tok)
+                vocab_changed = True
+        self._fields.pop(doc_id, None)
+        self._sig.pop(doc_id, None)
+        self._docs.pop(doc_id, None)
+        return vocab_changed
+
+    def _add(self, doc_id: int, pest: Dict[str, Any], sig: Tuple) -> bool:
+        vocab_changed = False
+        fields = []
+        weights: Dict[str, float] = {}
+        for (name, w), value in zip(FIELDS, sig):
+            toks = tokenize(fold(value))
+            fields.append((" ".join(toks), w))
+            for tok in toks:
+                weights[tok] = max(weights.get(tok, 0.0), w)
+        for tok in weights:
+            if tok not in self._postings:
+                self._add_token(tok)
+                vocab_changed = True
+            self._postings[tok].add(doc_id)
+        self._doc_tokens[doc_id] = weights
+        self._fields[doc_id] = fields
+        self._sig[doc_id] = sig
+        self._docs[doc_id] = pest
+        return vocab_changed
+
+    def update(self, pests: List[Dict[str, Any]]) -> Dict[str, int]:
+        """đồng bộ index với danh sách pests hiện tại (theo Id)"""
+        t0 = time.perf_counter()
+        with self._lock:
+            seen = set()
+            added = changed = 0
+            vocab_changed = False
+            for p in pests:
+                doc_id = int(p["Id"])
+                seen.add(doc_id)
+                sig = tuple(p.get(name) for name, _ in FIELDS)
+                old = self._sig.get(doc_id)
+                if old == sig:
+                    self._docs[doc_id] = p          # dict mới của snapshot mới, token giữ nguyên
+                    continue
+                if old is None:
+                    added += 1
+                else:
+                    changed += 1
+                    vocab_changed |= self._remove(doc_id)
+                vocab_changed |= self._add(doc_id, p, sig)
+            removed = [d for d in self._docs if d not in seen]
+            for d in removed:
+                vocab_changed |= self._remove(d)
+            if vocab_changed:
+                self._vocab = sorted(self._postings)
+            self.updates += 1
+            self.reindexed += added + changed
+            self.last_update_ms = (time.perf_counter() - t0) * 1000.0
+        return {"added": added, "changed": changed, "removed": len(removed)}
+
+    # ---------- tìm ----------
+    def _expand(self, qt: str) -> Dict[str, float]:
+        """token trong index khớp với qt → hệ số điểm"""
+        out: Dict[str, float] = {}
+        if qt in self._postings:
+            out[qt] = _EXACT
+        i = bisect.bisect_left(self._vocab, qt)
+        while i < len(self._vocab) and self._vocab[i].startswith(qt):
+            out.setdefault(self._vocab[i], _PREFIX)
+            i += 1
+        if not out and len(qt) >= 3:
+            q3 = _trigrams(qt)
+            cands: Set[str] = set()
+            for g in q3:
+                cands |= self._tri.get(g, set())
+            for tok in cands:
+                t3 = _trigrams(tok)
+                sim = len(q3 & t3) / len(q3 | t3)
+                if sim >= _MIN_TRIGRAM_SIM:
+                    out[tok] = _FUZZY * sim
+        return out
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        fq = " ".join(tokenize(fold(query)))
+        if not fq:
+            return []
+        with self._lock:
+            scores: Optional[Dict[int, float]] = None
+            # mọi token của câu hỏi đều phải khớp (AND)
+            for qt in fq.split(" "):
+                cand: Dict[int, float] = {}
+                for tok, factor in self._expand(qt).items():
+                    for d in self._postings[tok]:
+                        s = factor * self._doc_tokens[d][tok]
+                        if s > cand.get(d, 0.0):
+                            cand[d] = s
+                scores = cand if scores is None else {d: scores[d] + s for d, s in cand.items() if d in scores}
+                if not scores:
+                    break
+            scores = scores or {}
+            # khớp chuỗi con (như LIKE cũ, đã bỏ dấu); đầu chuỗi được thêm điểm
+            for d, fields in self._fields.items():
+                for f, w in fields:
+                    pos = f.find(fq)
+                    if pos >= 0:
+                        scores[d] = scores.get(d, 0.0) + w * (2.0 if pos == 0 else 1.0)
+                        break
+            ranked = sorted(scores.items(), key=lambda kv: (-kv[1], self._fields[kv[0]][0][0]))
+            if limit is not None:
+                ranked = ranked[:limit]
+            return [self._docs[d] for d, _ in ranked]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "docs": len(self._docs),
+                "tokens": len(self._postings),
+                "trigrams": len(self._tri),
+                "updates": self.updates,
+                "reindexed_docs": self.reindexed,
+                "last_update_ms": self.last_update_ms,
+            }
@@ -0,0 +1,248 @@
+# backend/db/sqlite_standin.py
+"""
+SQLite thay cho SQL Server (benchmark, chạy thử không cần LocalDB).
+Bọc sqlite3 cho giống pyodbc: execute(sql, *params), và dịch vài cú pháp T-SQL
+mà db/queries.py dùng (dbo., TOP n, OUTPUT INSERTED.Id, MERGE PestDrugs, N'...',
+HASHBYTES/CONCAT/DATALENGTH của db/replica.py).
+"""
+import re
+import json
+import zlib
+import hashlib
+import random
+import sqlite3
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Sequence
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Pests (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Code TEXT NOT NULL UNIQUE,
+    TenThuong TEXT NOT NULL ON CONFLICT REPLACE DEFAULT '',
+    TenKhoaHoc TEXT,
+    MoTaNgan TEXT,
+    NhanBiet TEXT,
+    BienPhapIPM TEXT,
+    TacHai TEXT
+);
+CREATE TABLE IF NOT EXISTS PestPhotos (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    PestId INTEGER NOT NULL REFERENCES Pests(Id),
+    Url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Pests_TenThuong ON Pests(TenThuong, Id);
+CREATE INDEX IF NOT EXISTS IX_PestPhotos_PestId ON PestPhotos(PestId);
+CREATE TABLE IF NOT EXISTS Drugs (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Ten TEXT NOT NULL,
+    HoatChat TEXT,
+    Nhom TEXT,
+    Hang TEXT,
+    HuongDan TEXT,
+    GhiChu TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_Drugs_Ten ON Drugs(Ten, Id);
+CREATE TABLE IF NOT EXISTS PestDrugs (
+    PestId INTEGER NOT NULL REFERENCES Pests(Id),
+    DrugId INTEGER NOT NULL REFERENCES Drugs(Id),
+    PRIMARY KEY (PestId, DrugId)
+);
+CREATE TABLE IF NOT EXISTS Users (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Username TEXT NOT NULL UNIQUE,
+    PasswordHash TEXT NOT NULL,
+    IsAdmin INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_TOP_RE = re.compile(r"\bSELECT\s+TOP\s+(\d+)\s+", re.IGNORECASE)
+_OUTPUT_RE = re.compile(r"\s+OUTPUT\s+INSERTED\.(\w+)", re.IGNORECASE)
+_MERGE_RE = re.compile(r"^\s*MERGE\s+dbo\.PestDrugs\b", re.IGNORECASE)
+_NSTR_RE = re.compile(r"(?<![\w'])N'")
+# CONCAT của SQL Server cắt ở 4000/8000 ký tự nếu không có tham số nvarchar(max)
+LOB_EMPTY = "CAST(N'' AS nvarchar(max))"
+
+
+@lru_cache(maxsize=512)
+def translate(sql: str) -> str:
+    """T-SQL (phần db/queries.py dùng) → SQLite"""
+    if _MERGE_RE.match(sql):
+        # link_drug_to_pest: MERGE ... WHEN NOT MATCHED THEN INSERT
+        return "INSERT OR IGNORE INTO PestDrugs (PestId, DrugId) VALUES (?, ?)"
+    s = sql.replace("dbo.", "").replace(LOB_EMPTY, "''")
+    s = _NSTR_RE.sub("'", s)
+    limit = None
+    m = _TOP_RE.search(s)
+    if m:
+        limit = m.group(1)
+        s = _TOP_RE.sub("SELECT ", s, count=1)
+    returning = None
+    m = _OUTPUT_RE.search(s)
+    if m:
+        returning = m.group(1)
+        s = _OUTPUT_RE.sub("", s, count=1)
+    s = s.rstrip().rstrip(";")
+    if limit:
+        s += f" LIMIT {limit}"
+    if returning:
+        s += f" RETURNING {returning}"
+    return s
+
+
+class Cursor:
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+        self.fast_executemany = False      # để code viết cho pyodbc gán được
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def execute(self, sql: str, *params: Any) -> "Cursor":
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        self._cur.execute(translate(sql), params)
+        return self
+
+    def executemany(self, sql: str, seq: Iterable[Sequence[Any]]) -> "Cursor":
+        self._cur.executemany(translate(sql), seq)
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size: int):
+        return self._cur.fetchmany(size)
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class Connection:
+    def __init__(self, raw: sqlite3.Connection):
+        self._raw = raw
+
+    def cursor(self) -> Cursor:
+        return Cursor(self._raw.cursor())
+
+    def execute(self, sql: str, *params: Any) -> Cursor:
+        return self.cursor().execute(sql, *params)
+
+    def commit(self) -> None:
+        self._raw.commit()
+
+    def rollback(self) -> None:
+        self._raw.rollback()
+
+    def close(self) -> None:
+        self._raw.close()
+
+
+def binary_checksum(*values: Any) -> int:
+    """thay BINARY_CHECKSUM(...) của SQL Server"""
+    return zlib.crc32(repr(values).encode("utf-8")) - (1 << 31)
+
+
+def _concat(*values: Any) -> str:
+    # như CONCAT của SQL Server: NULL → ''
+    return "".join("" if v is None else str(v) for v in values)
+
+
+def _datalength(v: Any) -> Optional[int]:
+    # nvarchar: 2 byte / ký tự (UTF-16)
+    if v is None:
+        return None
+    return len(str(v).encode("utf-16-le")) if isinstance(v, str) else len(str(v))
+
+
+def _hashbytes(alg: str, v: Any) -> Optional[bytes]:
+    """HASHBYTES('SHA2_256', nvarchar) = sha256 trên UTF-16LE"""
+    if v is None:
+        return None
+    if str(alg).upper() != "SHA2_256":
+        raise ValueError(f"HASHBYTES {alg} not supported")
+    data = v if isinstance(v, bytes) else str(v).encode("utf-16-le")
+    return hashlib.sha256(data).digest()
+
+
+def connect(path: str) -> Connection:
+    raw = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    raw.create_function("BINARY_CHECKSUM", -1, binary_checksum, deterministic=True)
+    raw.create_function("CONCAT", -1, _concat, deterministic=True)
+    raw.create_function("DATALENGTH", 1, _datalength, deterministic=True)
+    raw.create_function("HASHBYTES", 2, _hashbytes, deterministic=True)
+    raw.execute("PRAGMA foreign_keys = ON")
+    raw.execute("PRAGMA journal_mode = WAL")
+    raw.execute("PRAGMA synchronous = NORMAL")
+    return Connection(raw)
+
+
+def create_schema(path: str) -> None:
+    raw = sqlite3.connect(path)
+    try:
+        raw.executescript(SCHEMA)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+# =========================
+#  DỮ LIỆU MẪU
+# =========================
+def load_codes(labels_path: str) -> List[str]:
+    """labels.json dạng list ["aphid", ...] hoặc dict {"aphid": 0, ...} / {"0": "aphid"}"""
+    with open(labels_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return [str(x) for x in data]
+    if all(str(k).isdigit() for k in data):
+        return [str(data[k]) for k in sorted(data, key=lambda k: int(k))]
+    return [str(k) for k, _ in sorted(data.items(), key=lambda kv: kv[1])]
+
+
+def seed(path: str, codes: Sequence[str], n_drugs: int = 200, links_per_pest: int = 4,
+         photos_per_pest: int = 3, admin_password_hash: Optional[str] = None, rng_seed: int = 0) -> None:
+    """
+    Tạo schema + dữ liệu giả lập cỡ thật: 1 sâu / mã trong labels.json,
+    n_drugs thuốc, mỗi sâu vài ảnh + vài thuốc. Cùng rng_seed → cùng dữ liệu.
+    """
+    create_schema(path)
+    rng = random.Random(rng_seed)
+    raw = sqlite3.connect(path)
+    try:
+        if raw.execute("SELECT COUNT(*) FROM Pests").fetchone()[0]:
+            return
+        nhan_biet = json.dumps(["Lá bị cong, vàng", "Có vết đục trên thân", "Xuất hiện phân đùn"],
+                               ensure_ascii=False)
+        ipm = json.dumps(["Vệ sinh vườn", "Tỉa cành thông thoáng", "Dùng bẫy và thiên địch"],
+                         ensure_ascii=False)
+        raw.executemany(
+            "INSERT INTO Pests (Code, TenThuong, TenKhoaHoc, MoTaNgan, NhanBiet, BienPhapIPM, TacHai) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(c, c.replace("_", " ").capitalize(), f"Species {c}", "Sâu hại sầu riêng " * 8,
+              nhan_biet, ipm, "Gây hại lá, thân, quả. " * 10) for c in codes],
+        )
+        pest_ids = [r[0] for r in raw.execute("SELECT Id FROM Pests ORDER BY Id")]
+        raw.executemany(
+            "INSERT INTO PestPhotos (PestId, Url) VALUES (?, ?)",
+            [(pid, f"/static/{code}_{i}.jpg")
+             for pid, code in zip(pest_ids, codes) for i in range(photos_per_pest)],
+        )
+        raw.executemany(
+            "INSERT INTO Drugs (Ten, HoatChat, Nhom, Hang, HuongDan, GhiChu) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f"Thuốc {i:05d}", f"Hoạt chất {i % 37}", f"Nhóm {i % 5}", f"Hãng {i % 11}",
+              "Pha 20 ml / bình 16 lít, phun ướt đều tán lá. " * 4, None) for i in range(n_drugs)],
+        )
+        drug_ids = [r[0] for r in raw.execute("SELECT Id FROM Drugs")]
+        links = {(pid, did) for pid in pest_ids
+                 for did in rng.sample(drug_ids, min(links_per_pest, len(drug_ids)))}
+        raw.executemany("INSERT INTO PestDrugs (PestId, DrugId) VALUES (?, ?)", sorted(links))
+        if admin_password_hash:
+            raw.execute("INSERT INTO Users (Username, PasswordHash, IsAdmin) VALUES ('admin', ?, 1)",
+                        (admin_password_hash,))
+        raw.commit()
+    finally:
+        raw.close()
@@ -0,0 +1,166 @@
+import json
+import gzip
+import hashlib
+import threading
+import datetime as _dt
+from decimal import Decimal
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+
+try:                                    # brotli là tuỳ chọn: không có thì chỉ gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+# body nhỏ hơn ngưỡng này thì nén không đáng
+MIN_COMPRESS_BYTES = 512
+
+
+class Rendered(NamedTuple):
+    body: bytes
+    etag: str                      # không có dấu ngoặc kép
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+
+
+def _json_default(o: Any):
+    # giống jsonable_encoder của FastAPI cho các kiểu pyodbc hay trả về
+    if isinstance(o, (_dt.datetime, _dt.date, _dt.time)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, (bytes, bytearray)):
+        return o.decode("utf-8", "replace")
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def json_bytes(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"),
+                      default=_json_default).encode("utf-8")
+
+
+def ndjson_chunks(batches: Iterable[List[Any]]) -> Iterator[bytes]:
+    """mỗi batch dòng → 1 chunk NDJSON (1 object / dòng)"""
+    for rows in batches:
+        yield b"".join(json_bytes(r) + b"\n" for r in rows)
+
+
+def render(obj: Any, gzip_level: int = 9, br_quality: int = 11) -> Rendered:
+    body = json_bytes(obj)
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    gz = br = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        gz = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        if brotli is not None:
+            br = brotli.compress(body, quality=br_quality)
+    return Rendered(body, etag, gz, br)
+
+
+def _accepts(header: str, coding: str) -> bool:
+    for part in header.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0].lower() != coding:
+            continue
+        for f in fields[1:]:
+            if f.lower().startswith("q="):
+                try:
+                    return float(f[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        # "abc", "abc-gzip", "abc-br" cùng 1 nội dung
+        if tag == etag or tag.rsplit("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def respond(request: Request, r: Rendered) -> Response:
+    """chọn bản nén theo Accept-Encoding; If-None-Match khớp → 304 không body"""
+    accept = request.headers.get("accept-encoding", "")
+    if r.br is not None and _accepts(accept, "br"):
+        body, coding = r.br, "br"
+    elif r.gzip is not None and _accepts(accept, "gzip"):
+        body, coding = r.gzip, "gzip"
+    else:
+        body, coding = r.body, None
+
+    headers = {
+        # mỗi bản nén có ETag riêng (strong ETag gắn với đúng byte gửi đi)
+        "ETag": f'"{r.etag}-{coding}"' if coding else f'"{r.etag}"',
+        "Vary": "Accept-Encoding",
+        # client được giữ bản sao nhưng phải hỏi lại (If-None-Match) mỗi lần
+        "Cache-Control": "no-cache",
+    }
+    inm = request.headers.get("if-none-match")
+    if inm and _etag_matches(inm, r.etag):
+        return Response(status_code=304, headers=headers)
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class RenderedCache:
+    """
+    Bytes JSON (+ gzip/br) đã render sẵn, khoá theo (endpoint, tham số) và gắn với
+    version catalog: version đổi → render lại ở request kế tiếp.
+    Mức nén mặc định tối đa (render 1 lần, phục vụ nhiều lần); key ít lặp lại thì hạ xuống.
+    """
+
+    def __init__(self, version: Callable[[], Hashable], max_items: int = 512,
+                 gzip_level: int = 9, br_quality: int = 11):
+        self._version = version
+        self.max_items = max_items
+        self.gzip_level = gzip_level
+        self.br_quality = br_quality
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, Tuple[Hashable, Rendered]]" = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> Rendered:
+        version = self._version()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == version:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+        r = render(build(), self.gzip_level, self.br_quality)
+        with self._lock:
+            self.renders += 1
+            self._items[key] = (version, r)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return r
+
+    def respond(self, request: Request, key: Hashable, build: Callable[[], Any]) -> Response:
+        resp = respond(request, self.get(key, build))
+        if resp.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+        return resp
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "hits": self.hits,
+                "renders": self.renders,
+                "not_modified": self.not_modified,
+                "brotli": brotli is not None,
+            }
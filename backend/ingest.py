@@ -0,0 +1,133 @@
+import os
+import json
+from io import BytesIO
+from typing import Iterable, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# =========================
+#  CẤU HÌNH
+# =========================
+# dung lượng upload tối đa cho /classify (byte)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+_CHUNK = 1 << 20
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"upload > {limit} bytes")
+        self.limit = limit
+
+
+# =========================
+#  GIỚI HẠN UPLOAD KHI ĐANG STREAM
+# =========================
+class UploadLimitMiddleware:
+    """
+    ASGI middleware: đếm byte body ngay khi nhận, vượt max_bytes thì trả 413
+    mà không đợi multipart parser ghi hết file ra đĩa.
+    Content-Length khai báo quá lớn → 413 ngay, không đọc body.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, paths: Iterable[str] = ("/classify",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = tuple(paths)
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"error": "upload_too_large", "limit": self.max_bytes}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode("ascii"))]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        for k, v in scope.get("headers", []):
+            if k == b"content-length":
+                try:
+                    if int(v) > self.max_bytes:
+                        await self._reject(send)
+                        return
+                except ValueError:
+                    pass
+
+        seen = 0
+        started = False
+        too_large = False      # form parser của FastAPI bọc UploadTooLarge thành 400 -> đổi lại ở send
+
+        async def limited_receive():
+            nonlocal seen, too_large
+            msg = await receive()
+            if msg["type"] == "http.request":
+                seen += len(msg.get("body", b""))
+                if seen > self.max_bytes:
+                    too_large = True
+                    raise UploadTooLarge(self.max_bytes)
+            return msg
+
+        async def tracked_send(msg):
+            nonlocal started
+            if too_large:
+                # bỏ response của app (400 "error parsing the body"), trả 413 thay vào
+                if msg["type"] == "http.response.start" and not started:
+                    started = True
+                    await self._reject(send)
+                return
+            if msg["type"] == "http.response.start":
+                started = True
+            await send(msg)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            if not started:
+                await self._reject(send)
+
+
+async def read_upload(file, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """đọc UploadFile theo chunk, quá limit → UploadTooLarge"""
+    parts = []
+    total = 0
+    while True:
+        chunk = await file.read(_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > limit:
+            raise UploadTooLarge(limit)
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+# =========================
+#  GIẢI MÃ ẢNH CHO MODEL
+# =========================
+def open_for_model(src: Union[bytes, str], size: int) -> Image.Image:
+    """
+    Mở ảnh ở độ phân giải vừa đủ cho model size×size:
+    - JPEG: draft() để libjpeg giải mã thẳng ở 1/2, 1/4, 1/8 (ảnh 12–48 MP → ~1/8 số pixel)
+    - định dạng khác: reduce() theo hệ số nguyên trước khi resize
+    - xoay theo EXIF Orientation (ảnh chụp dọc từ điện thoại)
+    """
+    img = Image.open(BytesIO(src) if isinstance(src, (bytes, bytearray)) else src)
+    if img.format == "JPEG":
+        img.draft("RGB", (size, size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")
+    w, h = img.size
+    factor = min(w // size, h // size)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.convert("RGB")
+
+
+def decode_for_model(src: Union[bytes, str], size: int) -> np.ndarray:
+    """bytes/đường dẫn → (size,size,3) uint8, tính 1 lần và dùng chung cho static + CNN"""
+    img = open_for_model(src, size).resize((size, size))
+    return np.asarray(img, dtype=np.uint8)
@@ -0,0 +1,242 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# =========================
+#  METRICS (định dạng text của Prometheus, không cần prometheus_client)
+# =========================
+# bucket thời gian (giây): 1 ms .. 10 s
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+def _esc(v: object) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[object], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        head = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(head + list(self._samples()))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: object, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for lv, v in items:
+            yield f"{self.name}{_labels(self.labelnames, lv)} {_fmt(v)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [đếm theo bucket (không cộng dồn) ..., +Inf], tổng, số lần
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels: object) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    @contextmanager
+    def time(self, *labels: object):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(lv, list(s[0]), s[1], s[2]) for lv, s in self._series.items()]
+        for lv, counts, total, n in items:
+            acc = 0
+            for b, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _fmt(b)
+                yield f"{self.name}_bucket{_labels(self.labelnames, lv, le)} {acc}"
+            yield f"{self.name}_sum{_labels(self.labelnames, lv)} {_fmt(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, lv)} {n}"
+
+
+class Gauge(_Metric):
+    """giá trị đọc lúc scrape: fn() → [(label values, value)]"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Iterable[Tuple[Tuple, float]]]] = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def _samples(self):
+        if self.fn is None:
+            return
+        try:
+            items = list(self.fn())
+        except Exception:
+            return
+        for lv, v in items:
+            yield f"{self.name}{_labels(self.labelnames, lv)} {_fmt(v)}"
+
+
+class CounterFunc(Gauge):
+    """counter đọc lúc scrape từ bộ đếm sẵn có (vd. stats() của cache)"""
+    kind = "counter"
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in _REGISTRY) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =========================
+#  METRICS CỦA /classify
+# =========================
+STAGE_SECONDS = Histogram(
+    "saurieng_stage_seconds",
+    "Thời gian từng stage của /classify (upload_read, cache, decode, infer, preprocess, embed, "
+    "static_sim, cnn, fuse, db)",
+    ("stage",),
+)
+BATCH_SIZE = Histogram(
+    "saurieng_classify_batch_size", "Số ảnh mỗi lượt forward", (),
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+ERRORS = Counter("saurieng_errors_total", "Số lỗi theo stage", ("stage",))
+VERSION_CHANGES = Counter("saurieng_model_version_changes_total",
+                          "Số lần model_version (static index / CNN) đổi")
+HTTP_SECONDS = Histogram(
+    "saurieng_http_request_duration_seconds", "Thời gian xử lý request theo endpoint",
+    ("method", "route", "status"),
+)
+
+# process con (ML_WORKERS) không được scrape: gom số đo lại, gửi về process API
+_capture = threading.local()
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    buf = getattr(_capture, "buf", None)
+    if buf is not None:
+        buf.append((stage, seconds))
+    else:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+@contextmanager
+def capture():
+    """gom các observe_stage trong khối vào 1 list (dùng trong process con)"""
+    _capture.buf = buf = []
+    try:
+        yield buf
+    finally:
+        _capture.buf = None
+
+
+def replay(observations: Iterable[Tuple[str, float]]) -> None:
+    for name, seconds in observations:
+        STAGE_SECONDS.observe(seconds, name)
+
+
+# =========================
+#  MIDDLEWARE ĐO THEO ENDPOINT
+# =========================
+def _match_route(scope):
+    """
+    request bị middleware bên trong chặn trước khi tới router (vd. 413 của UploadLimitMiddleware)
+    không có scope["route"] → tự khớp path với router của app
+    """
+    from starlette.routing import Match
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", ()):
+        try:
+            match, _ = route.matches(scope)
+        except Exception:
+            continue
+        if match == Match.FULL:
+            return route
+    return None
+
+
+class MetricsMiddleware:
+    """ASGI thuần: đo tới khi gửi xong body, nhãn route = path template (vd. /pests/{code})"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def tracked_send(msg):
+            if msg["type"] == "http.response.start":
+                status[0] = msg["status"]
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            route = scope.get("route") or _match_route(scope)
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.observe(time.perf_counter() - t0, scope.get("method", ""), path, status[0])
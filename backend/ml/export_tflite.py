@@ -0,0 +1,111 @@
+# backend/ml/export_tflite.py
+# Xuất feature extractor + CNN sang TFLite (float / dynamic-range / full-int8)
+# Chạy trong thư mục backend:
+#   python -m ml.export_tflite                       # tất cả biến thể
+#   python -m ml.export_tflite --quant int8 --calib "static/*.jpg,static/*/*.jpg"
+# Sau đó chạy API với:  ML_BACKEND=tflite ML_TFLITE_QUANT=int8
+import os, glob, json, argparse
+import numpy as np
+
+os.environ["ML_BACKEND"] = "keras"       # export luôn đi từ model Keras gốc
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import ml_infer
+import ml_registry
+from PIL import Image
+
+QUANTS = ("float", "dynamic", "int8")
+
+
+def _calib_paths(pattern: str, limit: int):
+    paths = set()
+    for pat in pattern.split(","):
+        if pat.strip():
+            paths.update(glob.glob(pat.strip()))
+    paths = sorted(paths)[:limit]
+    if not paths:
+        raise SystemExit(f"❌ Không có ảnh calibrate khớp {pattern}")
+    return paths
+
+
+def _convert(model, quant: str, rep_fn):
+    tf = ml_infer._tf()
+    conv = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quant in ("dynamic", "int8"):
+        conv.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quant == "int8":
+        # full-int8: mọi op int8, input/output vẫn float để runtime không phải đổi
+        conv.representative_dataset = rep_fn
+        conv.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return conv.convert()
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    print(f"✅ {path} ({len(data) / 1e6:.1f} MB)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--quant", choices=QUANTS + ("all",), default="all")
+    ap.add_argument("--calib", default=ml_infer.STATIC_GLOB, help="glob ảnh calibrate int8")
+    ap.add_argument("--calib-limit", type=int, default=200)
+    # backbone ImageNet dùng chung mọi phiên bản CNN → luôn ở ML_TFLITE_DIR (ml_infer đọc feat_* ở đó)
+    ap.add_argument("--out", default=ml_infer.TFLITE_DIR, help="thư mục feat_*.tflite")
+    # có kho phiên bản: cnn_* / cnn_head.npz / cnn_input.json vào <bản CURRENT>/tflite để đi kèm model
+    ap.add_argument("--cnn-out", default=None,
+                    help="thư mục cnn_*.tflite (mặc định: tflite/ của phiên bản CURRENT, kho trống thì --out)")
+    ap.add_argument("--input-range", choices=("auto", "1", "255"), default="auto",
+                    help="CNN nhận ảnh 0..1 hay 0..255 (auto: theo manifest, không có thì đoán như ml_infer)")
+    args = ap.parse_args()
+    cnn_out = args.cnn_out or (str(ml_infer._cnn_source()["tflite_dir"])
+                               if ml_registry.current_version() else args.out)
+
+    quants = QUANTS if args.quant == "all" else (args.quant,)
+    paths = _calib_paths(args.calib, args.calib_limit)
+
+    # --- feature extractor: input đã preprocess_input (giống _prep_image) ---
+    ml_infer._load_backbone()
+
+    def rep_feat():
+        for p in paths:
+            yield [ml_infer._prep_image(p).astype(np.float32)]
+
+    for q in quants:
+        _write(os.path.join(args.out, f"feat_{q}.tflite"), _convert(ml_infer._feat_model, q, rep_feat))
+
+    # --- CNN (nếu có) ---
+    model_path = ml_infer._cnn_source()["model_path"]
+    if not os.path.isfile(model_path):
+        print("ℹ️  Không có", model_path, "-> bỏ qua CNN")
+        return
+    cnn = ml_infer._tf().keras.models.load_model(model_path)
+    head = ml_infer._extract_head(cnn)
+    scale = {"auto": ml_infer._cnn_source()["input_scale"], "1": 1.0 / 255.0, "255": 1.0}[args.input_range]
+    if scale is None:
+        scale = ml_infer.cnn_input_scale(cnn, head)
+    print(f"ℹ️  CNN input_scale = {scale:g}")
+
+    def rep_cnn():
+        # cùng quy ước input với ml_infer._cnn_predict_arrays: pixel 0..255 * input_scale
+        for p in paths:
+            img = Image.open(p).convert("RGB").resize((ml_infer.IMG_SIZE, ml_infer.IMG_SIZE))
+            yield [np.expand_dims(np.array(img, dtype=np.float32) * scale, 0)]
+
+    for q in quants:
+        _write(os.path.join(cnn_out, f"cnn_{q}.tflite"), _convert(cnn, q, rep_cnn))
+    # runtime tflite không đoán được từ cấu trúc model → ghi lại cạnh file
+    with open(os.path.join(cnn_out, ml_infer._TFLITE_INPUT), "w", encoding="utf-8") as f:
+        json.dump({"input_scale": scale}, f)
+    print("✅", os.path.join(cnn_out, ml_infer._TFLITE_INPUT))
+
+    # Dense cuối để runtime tflite dùng chung backbone (xem ML_SHARED_BACKBONE)
+    if head is not None and ml_infer._head_mismatch(cnn, head, scale) <= 1e-3:
+        np.savez(os.path.join(cnn_out, "cnn_head.npz"), W=head[0], b=head[1])
+        print("✅", os.path.join(cnn_out, "cnn_head.npz"))
+
+
+if __name__ == "__main__":
+    main()
@@ -22,7 +22,9 @@ def _load():
             raise RuntimeError("Model/labels not found.")
         _model = tf.keras.models.load_model(MODEL_PATH)
         with open(LABELS_PATH, "r", encoding="utf-8") as f:
-            _idx_to_code = {int(k): v for k, v in json.load(f).items()}
+            data = json.load(f)
+        # labels.json: {"0": code} (train.py) hoặc list (bản trong models/registry)
+        _idx_to_code = dict(enumerate(data)) if isinstance(data, list) else {int(k): v for k, v in data.items()}
 
 def available() -> bool:
     return MODEL_PATH.exists() and LABELS_PATH.exists()
@@ -0,0 +1,128 @@
+# backend/ml/tflite_report.py
+# So sánh backend Keras (float32) với các bản TFLite đã export:
+# latency / RSS / độ khớp top-k của so khớp static và CNN.
+# Chạy trong thư mục backend (sau ml.export_tflite):
+#   python -m ml.tflite_report --images "static/*.jpg,static/*/*.jpg" --topk 3
+import os, sys, glob, json, time, argparse, resource
+import multiprocessing as mp
+import numpy as np
+
+VARIANTS = [("keras", ""), ("tflite", "float"), ("tflite", "dynamic"), ("tflite", "int8")]
+
+
+def _rss_mb() -> float:
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+
+def _run_variant(backend: str, quant: str, paths, topk: int, repeat: int):
+    """chạy trong process riêng để RSS/latency của từng backend không lẫn nhau"""
+    os.environ["ML_BACKEND"] = backend
+    if quant:
+        os.environ["ML_TFLITE_QUANT"] = quant
+    os.environ["STATIC_INDEX_CACHE"] = ""       # không dùng chung cache embedding giữa các backend
+    import ml_infer
+    from PIL import Image
+
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    ml_infer._load_backbone()
+    ml_infer._load_cnn_if_any()
+    load_s = time.perf_counter() - t0
+
+    # index = toàn bộ ảnh; query = crop giữa 80% (để không khớp tầm thường với chính nó)
+    index = ml_infer._embed(np.vstack([ml_infer._prep_image(p) for p in paths]))
+    queries = []
+    for p in paths:
+        im = Image.open(p).convert("RGB")
+        w, h = im.size
+        queries.append(im.crop((w // 10, h // 10, w - w // 10, h - h // 10)))
+    qx = np.vstack([ml_infer._prep_image(im) for im in queries])
+
+    lat = []
+    for _ in range(repeat):
+        for i in range(len(qx)):
+            t = time.perf_counter()
+            ml_infer._features(qx[i:i + 1])
+            lat.append((time.perf_counter() - t) * 1000.0)
+    feats = ml_infer._features(qx)
+    static_top = np.argsort(-(ml_infer._l2n(feats) @ index.T), axis=1)[:, :topk]
+
+    cnn_top = None
+    if ml_infer.CNN_HEAD is not None:
+        cnn_top = [[r["code"] for r in row]
+                   for row in ml_infer._probs_to_topk(ml_infer._head_probs(ml_infer.CNN_HEAD, feats), topk)]
+    elif ml_infer.CNN_MODEL is not None:
+        cnn_top = [[r["code"] for r in row] for row in ml_infer._cnn_predict_batch(queries, topk=topk)]
+
+    lat = np.array(lat)
+    return {
+        "backend": backend if not quant else f"{backend}/{quant}",
+        "load_s": round(load_s, 3),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_model_mb": round(_rss_mb() - rss0, 1),
+        "lat_ms_p50": round(float(np.percentile(lat, 50)), 2),
+        "lat_ms_p95": round(float(np.percentile(lat, 95)), 2),
+        "lat_ms_mean": round(float(lat.mean()), 2),
+        "static_topk": static_top.tolist(),
+        "cnn_topk": cnn_top,
+    }
+
+
+def _agreement(ref, other, topk: int):
+    """top-1 khớp (%) và trung bình phần giao top-k (%) so với Keras"""
+    if ref is None or other is None:
+        return None
+    top1 = np.mean([a[0] == b[0] for a, b in zip(ref, other) if a and b]) * 100
+    overlap = np.mean([len(set(a) & set(b)) / max(1, min(topk, len(a))) for a, b in zip(ref, other)]) * 100
+    return {"top1_pct": round(float(top1), 1), "topk_overlap_pct": round(float(overlap), 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", default="static/*.jpg,static/*/*.jpg")
+    ap.add_argument("--topk", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", help="ghi kết quả ra file json")
+    args = ap.parse_args()
+
+    paths = set()
+    for pat in args.images.split(","):
+        if pat.strip():
+            paths.update(glob.glob(pat.strip()))
+    paths = sorted(paths)
+    if not paths:
+        raise SystemExit("❌ Không có ảnh nào khớp --images")
+
+    ctx = mp.get_context("spawn")
+    results = []
+    for backend, quant in VARIANTS:
+        if backend == "tflite":
+            from ml_infer import TFLITE_DIR
+            if not os.path.isfile(os.path.join(TFLITE_DIR, f"feat_{quant}.tflite")):
+                print(f"ℹ️  bỏ qua {backend}/{quant}: chưa export")
+                continue
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(_run_variant, (backend, quant, paths, args.topk, args.repeat)))
+
+    ref = results[0]
+    print(f"{'backend':<16}{'load s':>8}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'static top1/topk %':>22}{'cnn top1/topk %':>20}")
+    for r in results:
+        st = _agreement(ref["static_topk"], r["static_topk"], args.topk)
+        cn = _agreement(ref["cnn_topk"], r["cnn_topk"], args.topk)
+        r["static_agreement"], r["cnn_agreement"] = st, cn
+        fmt = lambda a: f"{a['top1_pct']:.1f}/{a['topk_overlap_pct']:.1f}" if a else "-"
+        print(f"{r['backend']:<16}{r['load_s']:>8}{r['rss_mb']:>9}{r['lat_ms_p50']:>9}{r['lat_ms_p95']:>9}"
+              f"{fmt(st):>22}{fmt(cn):>20}")
+
+    if args.json:
+        for r in results:
+            r.pop("static_topk"), r.pop("cnn_topk")
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 # backend/ml/train.py
-import json, os
+# Train đầu phân loại trên MobileNetV2 (backbone đóng băng).
+# Đọc ảnh bằng tf.data: decode JPEG song song, augment theo batch, cache ảnh đã resize, prefetch.
+# Chạy ở thư mục gốc repo:
+#   python backend/ml/train.py
+#   python backend/ml/train.py --cache mem              # cache ảnh đã decode + resize trong RAM
+#   python backend/ml/train.py --cache .cache/tfdata    # cache ra đĩa, lần chạy sau không decode lại (ảnh đổi → cache mới)
+#   python backend/ml/train.py --head-only --views 5    # chạy backbone 1 lần, lưu feature, chỉ train lớp Dense
+#   python backend/ml/train.py --publish --activate     # đưa model vào kho phiên bản (backend/models/registry)
+#                                                       # rồi POST /admin/models/<version>/activate nếu API đang chạy
+import json, os, sys, glob, time, hashlib, argparse
 from pathlib import Path
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models
 from tensorflow.keras.applications import mobilenet_v2
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 
 # ==== cấu hình cơ bản ====
 IMG_SIZE = (224, 224)
@@ -12,9 +21,134 @@ BATCH_SIZE = 16
 EPOCHS = 10
 DATA_DIR = Path("data")                  # chứa train/ và val/
 OUT_DIR = Path("backend/ml")             # lưu model.h5 + labels.json
+SHUFFLE_BUFFER = 2048                    # số ảnh (224x224 uint8 ≈ 150 KB) trong buffer xáo khi có cache
+FEATURE_DIR = Path(".cache/features")    # --head-only: feature backbone (float16, memmap)
+HEAD_EPOCHS = 50
+HEAD_BATCH = 256
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# kho phiên bản của API (ml_registry); chạy từ gốc repo nên không dùng đường dẫn tương đối của backend
+REGISTRY_DIR = Path(os.environ.get("ML_REGISTRY_DIR") or BACKEND_DIR / "models" / "registry")
 
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+IMG_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+AUTOTUNE = tf.data.AUTOTUNE
 
+
+# ==== dữ liệu ====
+def list_images(split_dir: Path, class_names=None):
+    """(paths, labels, class_names): mỗi thư mục con = 1 lớp, thứ tự abc như flow_from_directory"""
+    if class_names is None:
+        class_names = sorted(d.name for d in split_dir.iterdir() if d.is_dir())
+    paths, labels = [], []
+    for idx, name in enumerate(class_names):
+        d = split_dir / name
+        if not d.is_dir():
+            continue
+        for p in sorted(d.rglob("*")):
+            if p.suffix.lower() in IMG_EXTS:
+                paths.append(str(p))
+                labels.append(idx)
+    return paths, labels, class_names
+
+
+def _load(path, label):
+    raw = tf.io.read_file(path)
+    img = tf.io.decode_image(raw, channels=3, expand_animations=False)
+    img = tf.image.resize(img, IMG_SIZE)
+    # giữ uint8 cho cache nhỏ (1/4 so với float32)
+    return tf.cast(tf.clip_by_value(tf.round(img), 0, 255), tf.uint8), label
+
+
+def augmenter() -> tf.keras.Sequential:
+    # tương đương ImageDataGenerator(rotation 12°, shift 5%, zoom 10%, flip ngang) nhưng chạy cả batch 1 lượt
+    return tf.keras.Sequential([
+        layers.RandomFlip("horizontal"),
+        layers.RandomRotation(12 / 360, fill_mode="nearest"),
+        layers.RandomTranslation(0.05, 0.05, fill_mode="nearest"),
+        layers.RandomZoom(0.1, fill_mode="nearest"),
+    ], name="augment")
+
+
+def make_dataset(paths, labels, num_classes: int, batch_size: int = BATCH_SIZE,
+                 training: bool = False, cache=None, augment=None) -> tf.data.Dataset:
+    """
+    cache: None = không cache, "" = RAM, "path/prefix" = file trên đĩa.
+    Ảnh trả ra float32 0..255 (model tự preprocess_input), nhãn one-hot; augment=None → không augment.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if training and cache is None:
+        # không cache: xáo danh sách file (rẻ) rồi mới decode
+        ds = ds.shuffle(len(paths), reshuffle_each_iteration=True)
+    ds = ds.map(_load, num_parallel_calls=AUTOTUNE, deterministic=not training)
+    if cache is not None:
+        ds = ds.cache(cache)
+        if training:
+            ds = ds.shuffle(min(len(paths), SHUFFLE_BUFFER), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size, num_parallel_calls=AUTOTUNE)
+
+    def to_model(x, y):
+        x = tf.cast(x, tf.float32)
+        if augment is not None:
+            x = augment(x, training=True)
+        return x, tf.one_hot(y, num_classes)
+
+    ds = ds.map(to_model, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def _files_key(paths, tag: str) -> str:
+    """sha1 của tag + (đường dẫn, size, mtime) từng ảnh: ảnh đổi → key đổi"""
+    h = hashlib.sha1(tag.encode())
+    for p in paths:
+        st = os.stat(p)
+        h.update(f"{p}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def _cache_arg(cache: str, split: str, paths, labels):
+    """
+    cache đĩa: <thư mục>/<split>-<key>, key theo IMG_SIZE + nhãn + (đường dẫn, size, mtime) từng ảnh
+    như _feature_key → thêm/sửa ảnh hay đổi lớp thì cache mới, không đọc nhầm ảnh cũ.
+    Dọn lockfile do lần chạy bị ngắt để lại (tf.data báo "concurrently running job"),
+    cache dở dang (chưa có .index) và cache của key cũ. Không chạy 2 lần train cùng thư mục cache.
+    """
+    if not cache:
+        return None
+    if cache == "mem":
+        return ""
+    os.makedirs(cache, exist_ok=True)
+    key = _files_key(paths, f"{IMG_SIZE}|{','.join(map(str, labels))}")[:16]
+    prefix = os.path.join(cache, f"{split}-{key}")
+    complete = os.path.exists(prefix + ".index")
+    for f in glob.glob(os.path.join(glob.escape(cache), f"{glob.escape(split)}-*")):
+        mine = os.path.basename(f).startswith(os.path.basename(prefix))
+        if not mine or f.endswith(".lockfile") or not complete:
+            os.remove(f)
+            print(f"[train] xoá cache cũ {f}", flush=True)
+    return prefix
+
+
+class Throughput(tf.keras.callbacks.Callback):
+    """ảnh/giây phần train của mỗi epoch (không tính validation), ghi thêm vào history"""
+
+    def __init__(self, num_images: int):
+        super().__init__()
+        self.num_images = num_images
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._t0 = self._t_last = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._t_last = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        dt = max(self._t_last - self._t0, 1e-9)
+        ips = self.num_images / dt
+        print(f"[train] epoch {epoch + 1}: {ips:.1f} images/sec ({self.num_images} ảnh, {dt:.1f} s)", flush=True)
+        if logs is not None:
+            logs["images_per_sec"] = ips
+
+
+# ==== model ====
 def build_model(num_classes: int):
     base = mobilenet_v2.MobileNetV2(include_top=False, input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3), weights="imagenet")
     base.trainable = False  # fine-tune sau nếu cần
@@ -29,50 +163,171 @@ def build_model(num_classes: int):
     model.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
     return model
 
+
+# ==== --head-only: feature backbone tính 1 lần ====
+def feature_extractor(model) -> tf.keras.Model:
+    """ảnh 0..255 → vector sau GlobalAveragePooling2D, dùng chung backbone với model đầy đủ"""
+    gap = next(l for l in model.layers if isinstance(l, layers.GlobalAveragePooling2D))
+    return models.Model(model.input, gap.output)
+
+
+def _feature_key(paths, views: int) -> str:
+    return _files_key(paths, f"{IMG_SIZE}|{views}|mobilenetv2-imagenet")
+
+
+def extract_features(extractor, paths, labels, prefix: Path, views: int = 1, augment=None,
+                     batch_size: int = 64):
+    """
+    Chạy backbone qua mọi ảnh (views lượt: lượt 0 ảnh gốc, các lượt sau có augment),
+    ghi feature float16 ra <prefix>.f16 (memmap) + nhãn <prefix>.labels.npy.
+    Ảnh không đổi (đường dẫn, size, mtime) → dùng lại file cũ, không chạy backbone.
+    """
+    meta_path = prefix.with_suffix(".json")
+    feat_path = prefix.with_suffix(".f16")
+    label_path = prefix.with_suffix(".labels.npy")
+    key = _feature_key(paths, views)
+    if meta_path.exists() and feat_path.exists() and label_path.exists():
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("key") == key:
+            print(f"[train] dùng lại feature {feat_path} ({meta['n']} x {meta['dim']})", flush=True)
+            x = np.memmap(feat_path, dtype=np.float16, mode="r", shape=(meta["n"], meta["dim"]))
+            return x, np.load(label_path)
+
+    prefix.parent.mkdir(parents=True, exist_ok=True)
+    dim = int(extractor.output_shape[-1])
+    n = len(paths) * views
+    tmp = feat_path.with_suffix(".f16.tmp")
+    mm = np.memmap(tmp, dtype=np.float16, mode="w+", shape=(n, dim))
+    t0 = time.perf_counter()
+    pos = 0
+    for v in range(views):
+        ds = make_dataset(paths, labels, 1, batch_size, augment=augment if v > 0 else None)
+        for x, _ in ds:
+            f = extractor(x, training=False).numpy()
+            mm[pos:pos + len(f)] = f
+            pos += len(f)
+    mm.flush()
+    del mm
+    os.replace(tmp, feat_path)
+    y = np.tile(np.asarray(labels, dtype=np.int32), views)
+    np.save(label_path, y)
+    meta_path.write_text(json.dumps({"key": key, "n": n, "dim": dim, "views": views}), encoding="utf-8")
+    dt = time.perf_counter() - t0
+    print(f"[train] feature {feat_path}: {n} x {dim}, {n / max(dt, 1e-9):.1f} images/sec ({dt:.1f} s)", flush=True)
+    return np.memmap(feat_path, dtype=np.float16, mode="r", shape=(n, dim)), y
+
+
+def build_head(dim: int, num_classes: int):
+    # giống phần sau GlobalAveragePooling2D của build_model
+    inputs = layers.Input(shape=(dim,))
+    x = layers.Dropout(0.2)(inputs)
+    outputs = layers.Dense(num_classes, activation="softmax")(x)
+    head = models.Model(inputs, outputs)
+    head.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
+    return head
+
+
+def train_head_only(args, class_names, train_paths, train_labels, val_paths, val_labels):
+    num_classes = len(class_names)
+    if not val_paths:
+        raise SystemExit("❌ --head-only cần ảnh trong data/val")
+    model = build_model(num_classes)
+    extractor = feature_extractor(model)
+    feat_dir = Path(args.features_dir)
+
+    x_tr, y_tr = extract_features(extractor, train_paths, train_labels, feat_dir / "train",
+                                  views=1 if args.no_augment else max(1, args.views),
+                                  augment=None if args.no_augment else augmenter(),
+                                  batch_size=args.batch)
+    x_va, y_va = extract_features(extractor, val_paths, val_labels, feat_dir / "val", batch_size=args.batch)
+
+    head = build_head(x_tr.shape[1], num_classes)
+    es = tf.keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=5, restore_best_weights=True)
+    t0 = time.perf_counter()
+    head.fit(np.asarray(x_tr, dtype=np.float32), tf.one_hot(y_tr, num_classes),
+             validation_data=(np.asarray(x_va, dtype=np.float32), tf.one_hot(y_va, num_classes)),
+             epochs=args.head_epochs, batch_size=args.head_batch, shuffle=True, callbacks=[es], verbose=2)
+    print(f"[train] head trained in {time.perf_counter() - t0:.1f} s", flush=True)
+
+    # ghép lại thành model đầy đủ (ảnh → xác suất) như chế độ thường
+    model.layers[-1].set_weights(head.layers[-1].get_weights())
+    return model
+
+
 def main():
-    train_dir = DATA_DIR / "train"
-    val_dir = DATA_DIR / "val"
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default=str(DATA_DIR), help="thư mục chứa train/ và val/")
+    ap.add_argument("--out", default=str(OUT_DIR))
+    ap.add_argument("--epochs", type=int, default=EPOCHS)
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE)
+    ap.add_argument("--cache", default="", help="'mem' hoặc thư mục cache ảnh đã resize (rỗng: không cache)")
+    ap.add_argument("--no-augment", action="store_true")
+    ap.add_argument("--head-only", action="store_true",
+                    help="chạy backbone 1 lần lấy feature (memmap) rồi chỉ train lớp Dense")
+    ap.add_argument("--views", type=int, default=1, help="--head-only: số lượt feature / ảnh train (lượt >1 có augment)")
+    ap.add_argument("--features-dir", default=str(FEATURE_DIR))
+    ap.add_argument("--head-epochs", type=int, default=HEAD_EPOCHS)
+    ap.add_argument("--head-batch", type=int, default=HEAD_BATCH)
+    ap.add_argument("--publish", action="store_true", help="chép model + labels vào kho phiên bản của API")
+    ap.add_argument("--activate", action="store_true", help="--publish: đặt làm CURRENT (API load khi khởi động)")
+    ap.add_argument("--registry", default=str(REGISTRY_DIR))
+    ap.add_argument("--notes", default="")
+    args = ap.parse_args()
+
+    data_dir, out_dir = Path(args.data), Path(args.out)
+    train_dir = data_dir / "train"
+    val_dir = data_dir / "val"
     if not train_dir.exists() or not val_dir.exists():
         raise SystemExit("❌ Không tìm thấy data/train và data/val")
+    out_dir.mkdir(parents=True, exist_ok=True)
 
-    # gen dữ liệu + augment cơ bản
-    train_gen = ImageDataGenerator(
-        rotation_range=12, width_shift_range=0.05, height_shift_range=0.05,
-        zoom_range=0.1, horizontal_flip=True
-    )
-    val_gen = ImageDataGenerator()
-
-    train_flow = train_gen.flow_from_directory(
-        str(train_dir), target_size=IMG_SIZE, batch_size=BATCH_SIZE,
-        class_mode="categorical", shuffle=True
-    )
-    val_flow = val_gen.flow_from_directory(
-        str(val_dir), target_size=IMG_SIZE, batch_size=BATCH_SIZE,
-        class_mode="categorical", shuffle=False
-    )
-
-    num_classes = train_flow.num_classes
-    class_indices = train_flow.class_indices  # {'helopeltis':0, 'thrips':1,...}
-    # đảo mapping -> lưu ra labels.json: index -> code
-    idx_to_code = {int(v): k for k, v in class_indices.items()}
+    train_paths, train_labels, class_names = list_images(train_dir)
+    val_paths, val_labels, _ = list_images(val_dir, class_names)
+    if not train_paths:
+        raise SystemExit(f"❌ Không có ảnh trong {train_dir}")
+    num_classes = len(class_names)
+    print(f"[train] {len(train_paths)} ảnh train, {len(val_paths)} ảnh val, {num_classes} lớp", flush=True)
 
-    model = build_model(num_classes)
-    model.summary()
+    # index -> code, lưu ra labels.json
+    idx_to_code = {i: name for i, name in enumerate(class_names)}
+
+    if args.head_only:
+        model = train_head_only(args, class_names, train_paths, train_labels, val_paths, val_labels)
+    else:
+        train_ds = make_dataset(train_paths, train_labels, num_classes, args.batch, training=True,
+                                cache=_cache_arg(args.cache, "train", train_paths, train_labels),
+                                augment=None if args.no_augment else augmenter())
+        val_ds = make_dataset(val_paths, val_labels, num_classes, args.batch,
+                              cache=_cache_arg(args.cache, "val", val_paths, val_labels))
 
-    ckpt = tf.keras.callbacks.ModelCheckpoint(
-        filepath=str(OUT_DIR / "model.h5"),
-        monitor="val_accuracy", save_best_only=True, verbose=1
-    )
-    es = tf.keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=3, restore_best_weights=True)
+        model = build_model(num_classes)
+        model.summary()
 
-    model.fit(train_flow, validation_data=val_flow, epochs=EPOCHS, callbacks=[ckpt, es])
+        ckpt = tf.keras.callbacks.ModelCheckpoint(
+            filepath=str(out_dir / "model.h5"),
+            monitor="val_accuracy", save_best_only=True, verbose=1
+        )
+        es = tf.keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=3, restore_best_weights=True)
+
+        model.fit(train_ds, validation_data=val_ds, epochs=args.epochs,
+                  callbacks=[Throughput(len(train_paths)), ckpt, es])
 
     # luôn lưu thêm 1 bản cuối
-    model.save(OUT_DIR / "model.h5")
-    with open(OUT_DIR / "labels.json", "w", encoding="utf-8") as f:
+    model.save(out_dir / "model.h5")
+    with open(out_dir / "labels.json", "w", encoding="utf-8") as f:
         json.dump(idx_to_code, f, ensure_ascii=False, indent=2)
 
-    print("✅ Done. Saved:", OUT_DIR / "model.h5", "and", OUT_DIR / "labels.json")
+    print("✅ Done. Saved:", out_dir / "model.h5", "and", out_dir / "labels.json")
+
+    if args.publish:
+        sys.path.insert(0, str(BACKEND_DIR))
+        import ml_registry
+        # model train.py có preprocess_input bên trong → nhận pixel 0..255
+        m = ml_registry.publish(str(out_dir / "model.h5"), str(out_dir / "labels.json"), input_scale=1.0,
+                                notes=args.notes or f"ml/train.py {len(train_paths)} ảnh", activate=args.activate,
+                                root=args.registry)
+        print(f"✅ Registry: {m['version']}" + (" -> CURRENT" if args.activate else
+              f" (đổi model đang chạy: POST /admin/models/{m['version']}/activate)"))
 
 if __name__ == "__main__":
     # GPU optional; nếu chỉ CPU thì Keras vẫn chạy được
@@ -0,0 +1,169 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import metrics
+from pools import Saturated
+
+# =========================
+#  CẤU HÌNH
+# =========================
+# số ảnh tối đa trong 1 lượt forward
+MAX_BATCH = int(os.environ.get("CLASSIFY_MAX_BATCH", "16"))
+# thời gian tối đa chờ gom thêm request (ms) sau khi request đầu tiên tới
+MAX_WAIT_MS = float(os.environ.get("CLASSIFY_MAX_WAIT_MS", "10"))
+# số ảnh tối đa được chờ trong hàng đợi; vượt quá → Saturated (503)
+MAX_QUEUE = int(os.environ.get("CLASSIFY_MAX_QUEUE", "128"))
+
+
+class _Job:
+    __slots__ = ("item", "topk", "future", "t_enqueue")
+
+    def __init__(self, item: Any, topk: int):
+        self.item = item
+        self.topk = topk
+        self.future: Future = Future()
+        self.t_enqueue = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Gom các request /classify đồng thời thành batch:
+    - chờ tối đa max_wait_ms kể từ request đầu tiên, hoặc tới khi đủ max_batch
+    - gọi run_batch(items, topks) đúng 1 lần cho cả batch
+    - mỗi caller nhận lại kết quả của riêng mình qua Future
+    - concurrency > 1: cho phép nhiều batch chạy song song (vd. pool nhiều process);
+      khi mọi slot bận thì batch kế tiếp tiếp tục gom thêm request
+    """
+
+    def __init__(self,
+                 run_batch: Callable[[Sequence[Any], Sequence[int]], List[Any]],
+                 max_batch: int = MAX_BATCH,
+                 max_wait_ms: float = MAX_WAIT_MS,
+                 max_queue: int = MAX_QUEUE,
+                 concurrency: int = 1,
+                 name: str = "classify"):
+        self.run_batch = run_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(self.max_batch, int(max_queue))
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._runner = (ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"batch-{name}")
+                        if self.concurrency > 1 else None)
+
+        self._q: "queue.Queue[_Job]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # thống kê
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._size_hist: Dict[int, int] = {}
+
+    # ---------- API ----------
+    def submit(self, item: Any, topk: int = 3) -> Future:
+        """đưa 1 ảnh vào hàng đợi, trả Future → list [{code, prob}]; đầy thì raise Saturated"""
+        if self._q.qsize() >= self.max_queue:
+            with self._lock:
+                self._rejected += 1
+            raise Saturated(self.name, retry_after=2)
+        self._ensure_thread()
+        job = _Job(item, topk)
+        self._q.put(job)
+        return job.future
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            batches = self._batches
+            items = self._items
+            return {
+                "name": self.name,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "concurrency": self.concurrency,
+                "queue_depth": self._q.qsize(),
+                "max_queue": self.max_queue,
+                "rejected": self._rejected,
+                "batches": batches,
+                "items": items,
+                "errors": self._errors,
+                "avg_batch_size": (items / batches) if batches else 0.0,
+                "avg_queue_wait_ms": (self._wait_total / items * 1000.0) if items else 0.0,
+                "batch_size_hist": {str(k): v for k, v in sorted(self._size_hist.items())},
+            }
+
+    # ---------- nội bộ ----------
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                t = threading.Thread(target=self._loop, name=f"batcher-{self.name}", daemon=True)
+                t.start()
+                self._thread = t
+
+    def _collect(self) -> List[_Job]:
+        first = self._q.get()
+        batch = [first]
+        deadline = first.t_enqueue + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout <= 0:
+                    # hết giờ chờ: vẫn vét những gì đã có sẵn trong queue
+                    batch.append(self._q.get_nowait())
+                else:
+                    batch.append(self._q.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            # chờ có slot rảnh rồi mới gom → lúc tải cao batch tự lớn lên
+            self._slots.acquire()
+            batch = self._collect()
+            if self._runner is None:
+                self._run(batch)
+            else:
+                self._runner.submit(self._run, batch)
+
+    def _run(self, batch: List[_Job]) -> None:
+        t_start = time.perf_counter()
+        try:
+            results = list(self.run_batch([j.item for j in batch], [j.topk for j in batch]))
+            if len(results) != len(batch):
+                # zip sẽ bỏ rơi Future thừa → caller chờ mãi; coi cả batch là lỗi
+                raise RuntimeError(f"{self.name}: run_batch returned {len(results)} results "
+                                   f"for {len(batch)} items")
+        except Exception as e:
+            metrics.ERRORS.inc(self.name, amount=len(batch))
+            with self._lock:
+                self._errors += len(batch)
+            for j in batch:
+                j.future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        with self._lock:
+            n = len(batch)
+            self._batches += 1
+            self._items += n
+            self._size_hist[n] = self._size_hist.get(n, 0) + 1
+            self._wait_total += sum(t_start - j.t_enqueue for j in batch)
+        metrics.BATCH_SIZE.observe(n)
+        metrics.observe_stage("infer_batch", time.perf_counter() - t_start)
+        for j in batch:
+            metrics.observe_stage("queue_wait", t_start - j.t_enqueue)
+
+        for j, r in zip(batch, results):
+            j.future.set_result(r)
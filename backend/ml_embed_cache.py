@@ -0,0 +1,95 @@
+import os
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def file_digest(path: str, chunk: int = 1 << 20) -> str:
+    """sha1 nội dung file (không phụ thuộc tên/mtime)"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding trên đĩa, đánh địa chỉ theo nội dung:
+        (sha1 file, fingerprint) -> vector (D,)
+    fingerprint gồm IMG_SIZE + trọng số backbone + phiên bản tiền xử lý,
+    nên đổi model/tiền xử lý thì cache cũ tự bị bỏ qua.
+    Lưu 1 file .npz: fingerprint, keys (M,), vecs (M,D).
+    """
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._vecs: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as z:
+                if str(z["fingerprint"]) != self.fingerprint:
+                    print("[ml_infer] embed cache: fingerprint khác -> bỏ cache cũ", flush=True)
+                    self._dirty = True
+                    return
+                keys = z["keys"]
+                vecs = z["vecs"]
+            self._vecs = {str(k): vecs[i] for i, k in enumerate(keys)}
+        except Exception as e:
+            print("[ml_infer] embed cache: đọc lỗi, bỏ qua:", e, flush=True)
+            self._vecs = {}
+
+    def __len__(self) -> int:
+        return len(self._vecs)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        return self._vecs.get(key)
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        return [k for k in keys if k not in self._vecs]
+
+    def put_many(self, keys: List[str], vecs: np.ndarray) -> None:
+        with self._lock:
+            for k, v in zip(keys, vecs):
+                self._vecs[k] = np.asarray(v, dtype=np.float32)
+            if keys:
+                self._dirty = True
+
+    def retain(self, keys: Iterable[str]) -> None:
+        """chỉ giữ các key còn dùng (file đã xoá thì rơi khỏi cache)"""
+        keep = set(keys)
+        with self._lock:
+            drop = [k for k in self._vecs if k not in keep]
+            for k in drop:
+                del self._vecs[k]
+            if drop:
+                self._dirty = True
+
+    def save(self) -> None:
+        """ghi atomically: file tạm rồi os.replace"""
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            keys = sorted(self._vecs)
+            vecs = (np.stack([self._vecs[k] for k in keys]).astype(np.float32)
+                    if keys else np.zeros((0, 0), dtype=np.float32))
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, fingerprint=np.array(self.fingerprint), keys=np.array(keys), vecs=vecs)
+            os.replace(tmp, self.path)
+            self._dirty = False
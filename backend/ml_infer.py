@@ -1,181 +1,852 @@
 import os
 import glob
-from typing import List, Dict, Optional
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Callable, List, Dict, NamedTuple, Optional, Sequence, Tuple, Union
 import numpy as np
 from PIL import Image
 
-import tensorflow as tf
-from tensorflow.keras.applications import mobilenet_v2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+# tensorflow chỉ import khi load model (xem _tf()) để API mở cổng ngay
+
+from ml_embed_cache import EmbeddingCache, file_digest
+import ml_registry
+from ingest import decode_for_model
+import metrics
 
 # =========================
 #  CẤU HÌNH
 # =========================
-# nơi bạn để model CNN (nếu có)
+# nơi bạn để model CNN (nếu có); có kho phiên bản (ml_registry) thì dùng models/registry/CURRENT
 MODEL_PATH = os.path.join("models", "mobilenetv2_durian.h5")
 LABELS_PATH = os.path.join("models", "labels.json")
 
-# nơi bạn để ảnh mẫu để so khớp trực tiếp
-STATIC_GLOB = os.environ.get("STATIC_INDEX_GLOB", "static/*.jpg")
+# nơi bạn để ảnh mẫu để so khớp trực tiếp (nhiều pattern cách nhau bởi dấu phẩy)
+#   static/sau_rom.jpg        -> nhãn 'sau_rom' (1 ảnh / sâu, kiểu cũ)
+#   static/sau_rom/*.jpg      -> nhãn 'sau_rom' (nhiều ảnh thực địa / sâu)
+STATIC_DIR = os.environ.get("STATIC_INDEX_DIR", "static")
+STATIC_GLOB = os.environ.get("STATIC_INDEX_GLOB", "static/*.jpg,static/*/*.jpg")
 
 IMG_SIZE = int(os.environ.get("STATIC_INDEX_IMG_SIZE", "224"))
 # nhiệt độ cho softmax của static: càng nhỏ càng nhọn
 STATIC_TEMP = float(os.environ.get("STATIC_INDEX_T", "0.05"))
+# gộp điểm nhiều ảnh cùng lớp: max | mean | knn
+STATIC_AGG = os.environ.get("STATIC_INDEX_AGG", "max").lower()
+# số láng giềng cho chế độ knn
+STATIC_KNN_K = int(os.environ.get("STATIC_INDEX_KNN_K", "10"))
+
+# cache embedding của ảnh static trên đĩa ("" = tắt)
+EMBED_CACHE_PATH = os.environ.get("STATIC_INDEX_CACHE", os.path.join("models", "static_embed_cache.npz"))
+# đổi cách tiền xử lý (_prep_image) thì tăng số này để cache cũ tự hết hiệu lực
+PREP_VERSION = "mobilenet_v2.preprocess_input/draft+exif+resize-bicubic/v2"
+# dùng chung 1 lượt backbone cho static + đầu phân loại CNN: auto | on | off
+#   auto: chỉ bật khi CNN là MobileNetV2 đóng băng + Dense (như ml/train.py)
+#         và kết quả khớp với model đầy đủ trên 1 ảnh thử
+SHARED_BACKBONE = os.environ.get("ML_SHARED_BACKBONE", "auto").lower()
+# backend chạy model: keras (float32) | tflite (xem ml/export_tflite.py)
+ML_BACKEND = os.environ.get("ML_BACKEND", "keras").lower()
+TFLITE_DIR = os.environ.get("ML_TFLITE_DIR", os.path.join("models", "tflite"))
+# biến thể tflite: float | dynamic | int8
+TFLITE_QUANT = os.environ.get("ML_TFLITE_QUANT", "dynamic").lower()
+TFLITE_THREADS = int(os.environ.get("ML_TFLITE_THREADS", "0")) or None
+# số ảnh embed mỗi lượt khi build index (giới hạn RAM)
+EMBED_CHUNK = int(os.environ.get("STATIC_INDEX_CHUNK", "32"))
 
 # =========================
 #  FEATURE EXTRACTOR CHO STATIC
 # =========================
-_base = mobilenet_v2.MobileNetV2(
-    include_top=False,
-    pooling="avg",
-    weights="imagenet"
-)
-_feat_model = tf.keras.Model(_base.input, _base.output)
+_tf_mod = None
+_base = None
+_feat_model = None
+MODEL_FINGERPRINT: Optional[str] = None
+_BACKBONE_LOCK = threading.Lock()
+
+def _tf():
+    """import tensorflow lần đầu khi cần (mất vài giây)"""
+    global _tf_mod
+    if _tf_mod is None:
+        import tensorflow as tf
+        _tf_mod = tf
+    return _tf_mod
+
+def preprocess_input(x: np.ndarray) -> np.ndarray:
+    """giống mobilenet_v2.preprocess_input: [0,255] -> [-1,1], không cần import TF"""
+    return x / 127.5 - 1.0
+
+def _load_backbone() -> None:
+    """build MobileNetV2 (ImageNet) làm feature extractor; gọi nhiều lần chỉ load 1 lần"""
+    global _base, _feat_model, MODEL_FINGERPRINT
+    if _feat_model is not None:
+        return
+    with _BACKBONE_LOCK:
+        if _feat_model is not None:
+            return
+        if ML_BACKEND == "tflite":
+            _load_backbone_tflite()
+            return
+        tf = _tf()
+        base = tf.keras.applications.mobilenet_v2.MobileNetV2(
+            include_top=False,
+            pooling="avg",
+            weights="imagenet"
+        )
+        _base = base
+        model = tf.keras.Model(base.input, base.output)
+        MODEL_FINGERPRINT = _model_fingerprint(model)
+        _feat_model = model
+
+def tflite_path(kind: str, quant: str = "") -> str:
+    """models/tflite/feat_dynamic.tflite, models/tflite/cnn_int8.tflite, ..."""
+    return os.path.join(TFLITE_DIR, f"{kind}_{quant or TFLITE_QUANT}.tflite")
+
+def _load_backbone_tflite() -> None:
+    global _feat_model, MODEL_FINGERPRINT
+    from ml_tflite import TFLiteModel
+    path = tflite_path("feat")
+    model = TFLiteModel(path, num_threads=TFLITE_THREADS)
+    h = hashlib.sha1(f"{PREP_VERSION}|{IMG_SIZE}|tflite".encode("utf-8"))
+    h.update(file_digest(path).encode("ascii"))
+    MODEL_FINGERPRINT = h.hexdigest()
+    _feat_model = model
+    print(f"[ml_infer] backbone: tflite {path}", flush=True)
+
+def to_array(pil_img: Image.Image) -> np.ndarray:
+    """ảnh PIL -> (IMG_SIZE,IMG_SIZE,3) uint8, chưa preprocess (input chung cho static + CNN)"""
+    img = pil_img.convert("RGB").resize((IMG_SIZE, IMG_SIZE))
+    return np.asarray(img, dtype=np.uint8)
 
 def _prep_image(pil_or_path) -> np.ndarray:
     """đưa ảnh về (1,224,224,3) + preprocess mobilenetv2"""
     if isinstance(pil_or_path, Image.Image):
-        img = pil_or_path.convert("RGB")
+        arr = to_array(pil_or_path)
     else:
-        img = Image.open(pil_or_path).convert("RGB")
-    img = img.resize((IMG_SIZE, IMG_SIZE))
-    arr = np.array(img, dtype=np.float32)
+        # cùng đường giải mã với ảnh upload (draft JPEG + xoay EXIF)
+        arr = decode_for_model(pil_or_path, IMG_SIZE)
+    arr = arr.astype(np.float32)
     arr = np.expand_dims(arr, 0)
     arr = preprocess_input(arr)
     return arr
 
+def _features(arr4d: np.ndarray) -> np.ndarray:
+    """(B,224,224,3) đã preprocess -> (B,1280) pooled features (chưa normalize)"""
+    _load_backbone()
+    if ML_BACKEND == "tflite":
+        return _feat_model.predict(arr4d)
+    return _feat_model(arr4d, training=False).numpy()
+
+def _l2n(vec: np.ndarray) -> np.ndarray:
+    return vec / (np.linalg.norm(vec, axis=1, keepdims=True) + 1e-10)
+
 def _embed(arr4d: np.ndarray) -> np.ndarray:
     """trả về vector L2-normalize"""
-    vec = _feat_model(arr4d, training=False).numpy()
-    vec /= (np.linalg.norm(vec, axis=1, keepdims=True) + 1e-10)
-    return vec
+    return _l2n(_features(arr4d))
+
+def _model_fingerprint(model) -> str:
+    """hash trọng số backbone + IMG_SIZE + phiên bản tiền xử lý"""
+    h = hashlib.sha1()
+    h.update(f"{PREP_VERSION}|{IMG_SIZE}|{_base.name}".encode("utf-8"))
+    for w in model.weights:
+        h.update(np.ascontiguousarray(w.numpy()).tobytes())
+    return h.hexdigest()
 
 # =========================
 #  INDEX STATIC (IN-MEMORY)
 # =========================
-STATIC_INDEX: Optional[np.ndarray] = None   # (M,1280)
-STATIC_LABELS: List[str] = []               # ['sau_rom', 'sau_duc_la', ...]
-STATIC_FILES: List[str] = []                # ['static/sau_rom.jpg', ...]
+class StaticSnapshot(NamedTuple):
+    """
+    1 phiên bản index bất biến. /classify đọc _SNAPSHOT đúng 1 lần/batch,
+    reindex build bản mới rồi thay cả object 1 lượt (gán tham chiếu là atomic)
+    → không bao giờ thấy index/labels/files lệch nhau.
+    """
+    version: int
+    index: Optional[np.ndarray]          # (M,1280)
+    labels: List[str]                    # nhãn từng dòng: ['bo_tri', 'bo_tri', 'sau_rom', ...]
+    files: List[str]                     # ['static/bo_tri/1.jpg', ...]
+    digests: List[str]                   # sha1 nội dung từng file
+    stats: List[Tuple[int, int]]         # (size, mtime_ns) để phát hiện file đổi
+    # các dòng được sắp theo lớp → mỗi lớp là 1 đoạn liên tiếp [starts[c], starts[c]+counts[c])
+    classes: List[str]                   # ['bo_tri', 'sau_rom', ...]
+    class_ids: np.ndarray                # (M,) chỉ số lớp của từng dòng
+    class_starts: np.ndarray             # (C,)
+    class_counts: np.ndarray             # (C,)
+    index_id: str = "empty"              # hash nội dung (file + nhãn) → đổi khi index thực sự đổi
+
+_EMPTY_I = np.zeros((0,), dtype=np.int64)
+_SNAPSHOT = StaticSnapshot(0, None, [], [], [], [], [], _EMPTY_I, _EMPTY_I, _EMPTY_I)
+_BUILD_LOCK = threading.Lock()           # mỗi lúc chỉ 1 lượt build
+_EMBED_CACHE: Optional[EmbeddingCache] = None
+
+def current_snapshot() -> StaticSnapshot:
+    return _SNAPSHOT
+
+def _embed_cache() -> EmbeddingCache:
+    global _EMBED_CACHE
+    _load_backbone()
+    if _EMBED_CACHE is None:
+        _EMBED_CACHE = EmbeddingCache(EMBED_CACHE_PATH, MODEL_FINGERPRINT)
+    return _EMBED_CACHE
+
+def _embed_files(paths: List[str],
+                 progress: Optional[Callable[[int], None]] = None) -> np.ndarray:
+    """embed theo từng chunk để không giữ cả (M,224,224,3) trong RAM"""
+    out = []
+    for i in range(0, len(paths), EMBED_CHUNK):
+        batch = np.vstack([_prep_image(p) for p in paths[i:i + EMBED_CHUNK]])
+        out.append(_embed(batch))
+        if progress:
+            progress(min(i + EMBED_CHUNK, len(paths)))
+    return np.vstack(out)
+
+def _static_paths() -> List[str]:
+    found = set()
+    for pat in STATIC_GLOB.split(","):
+        pat = pat.strip()
+        if pat:
+            found.update(glob.glob(pat))
+    return sorted(found)
+
+def _label_for(path: str) -> str:
+    """static/<code>/x.jpg -> <code>; static/<code>.jpg -> <code>"""
+    rel = os.path.relpath(path, STATIC_DIR)
+    parts = rel.replace("\\", "/").split("/")
+    if len(parts) > 1 and parts[0] != "..":
+        return parts[0]
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _file_stat(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return (int(st.st_size), int(st.st_mtime_ns))
+
+def build_static_index(progress: Optional[Callable[..., None]] = None) -> Dict[str, object]:
+    """
+    Quét lại STATIC_GLOB, so với snapshot hiện tại và chỉ embed phần thay đổi:
+    - file giữ nguyên (size, mtime) → dùng lại vector cũ, không đọc lại
+    - file mới/đổi → hash nội dung → lấy từ cache đĩa, không có mới embed
+    - file đã xoá → rơi khỏi index
+    Xong thì publish snapshot mới 1 lượt.
+    progress(**fields) được gọi để báo tiến độ (tuỳ chọn).
+    """
+    global _SNAPSHOT
+    report = progress or (lambda **kw: None)
+
+    with _BUILD_LOCK:
+        old = _SNAPSHOT
+        report(phase="scan")
+        # sắp theo (nhãn, đường dẫn) để ảnh cùng lớp nằm liền nhau
+        paths = sorted(_static_paths(), key=lambda p: (_label_for(p), p))
+        labels = [_label_for(p) for p in paths]
+
+        old_pos = {f: i for i, f in enumerate(old.files)}
+        cache = _embed_cache()
+        digests: List[str] = []
+        stats: List[Tuple[int, int]] = []
+        vecs: List[Optional[np.ndarray]] = []
+        unchanged = changed = added = 0
+        for p in paths:
+            st = _file_stat(p)
+            i = old_pos.get(p)
+            if i is not None and old.stats[i] == st and old.index is not None:
+                digests.append(old.digests[i])
+                vecs.append(old.index[i])
+                unchanged += 1
+            else:
+                d = file_digest(p)
+                digests.append(d)
+                vecs.append(cache.get(d))
+                if i is None:
+                    added += 1
+                else:
+                    changed += 1
+            stats.append(st)
+        removed = len(set(old.files) - set(paths))
 
-def build_static_index() -> None:
-    """Quét lại static/*.jpg và build index"""
-    global STATIC_INDEX, STATIC_LABELS, STATIC_FILES
+        # chỉ embed những nội dung chưa có vector
+        todo: Dict[str, str] = {}
+        for p, d, v in zip(paths, digests, vecs):
+            if v is None and d not in todo:
+                todo[d] = p
+        report(phase="embed", total=len(todo), done=0)
+        if todo:
+            new_vecs = _embed_files(list(todo.values()),
+                                    progress=lambda n: report(done=n))
+            cache.put_many(list(todo.keys()), new_vecs)
+            fresh = dict(zip(todo.keys(), new_vecs))
+            vecs = [v if v is not None else fresh[d] for v, d in zip(vecs, digests)]
 
-    paths = sorted(glob.glob(STATIC_GLOB))
+        report(phase="publish")
+        classes, class_ids, class_counts = np.unique(
+            np.array(labels), return_inverse=True, return_counts=True
+        ) if labels else ([], _EMPTY_I, _EMPTY_I)
+        class_counts = np.asarray(class_counts, dtype=np.int64)
+        snap = StaticSnapshot(
+            version=old.version + 1,
+            index=np.stack(vecs).astype(np.float32) if vecs else None,
+            labels=labels,
+            files=paths,
+            digests=digests,
+            stats=stats,
+            classes=[str(c) for c in classes],
+            class_ids=np.asarray(class_ids, dtype=np.int64).ravel(),
+            class_starts=np.concatenate([[0], np.cumsum(class_counts)[:-1]]).astype(np.int64)
+            if len(class_counts) else _EMPTY_I,
+            class_counts=class_counts,
+            index_id=hashlib.sha1(
+                "|".join(f"{l}:{d}" for l, d in zip(labels, digests)).encode("utf-8")
+                + (MODEL_FINGERPRINT or "").encode("ascii")
+            ).hexdigest()[:16] if paths else "empty",
+        )
+        _SNAPSHOT = snap
+
+        # file đã xoá -> rơi khỏi cache
+        cache.retain(digests)
+        try:
+            cache.save()
+        except Exception as e:
+            print("[ml_infer] embed cache: ghi lỗi:", e, flush=True)
+
+    summary = {
+        "version": snap.version,
+        "model_version": model_version(),
+        "count": len(paths),
+        "classes": len(snap.classes),
+        "embedded": len(todo),
+        "unchanged": unchanged,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+    }
     if not paths:
-        STATIC_INDEX = None
-        STATIC_LABELS = []
-        STATIC_FILES = []
         print("[ml_infer] static index: 0 file (không tìm thấy ảnh trong static)", flush=True)
-        return
+    else:
+        print(f"[ml_infer] built index v{snap.version}: {len(snap.classes)} classes, {len(paths)} files "
+              f"({len(todo)} embedded, +{added} ~{changed} -{removed})", flush=True)
+    return summary
 
-    # đọc tất cả ảnh → embed 1 lượt
-    batch = np.vstack([_prep_image(p) for p in paths])   # (M,224,224,3)
-    STATIC_INDEX = _embed(batch)                         # (M,1280)
+# =========================
+#  JOB CHẠY NỀN (reindex, đổi model)
+# =========================
+_JOBS: Dict[str, Dict[str, object]] = {}
+_JOBS_LOCK = threading.Lock()
+_MAX_JOBS_KEPT = 20
 
-    STATIC_FILES = paths
-    STATIC_LABELS = [
-        os.path.splitext(os.path.basename(p))[0] for p in paths
-    ]
-    print(f"[ml_infer] built index: {len(STATIC_LABELS)} classes", flush=True)
+def _run_job(job: Dict[str, object], runner: Callable[..., Dict[str, object]]) -> None:
+    def progress(**kw):
+        with _JOBS_LOCK:
+            job.update(kw)
+    try:
+        summary = runner(progress=progress)
+        with _JOBS_LOCK:
+            job.update(summary)
+            job["state"] = "done"
+    except Exception as e:
+        with _JOBS_LOCK:
+            job["state"] = "failed"
+            job["error"] = str(e)
+        print(f"[ml_infer] {job['kind']} failed:", e, flush=True)
+    finally:
+        with _JOBS_LOCK:
+            job["finished_at"] = time.time()
 
-# build ngay lúc import
-build_static_index()
+def _start_job(kind: str, runner: Callable[..., Dict[str, object]], **extra) -> Dict[str, object]:
+    """chạy runner ở thread nền; cùng loại đang chạy thì trả lại job đó (không chạy chồng)"""
+    with _JOBS_LOCK:
+        for j in _JOBS.values():
+            if j["kind"] == kind and j["state"] == "running":
+                return dict(j)
+        job: Dict[str, object] = {
+            "job_id": uuid.uuid4().hex[:12],
+            "kind": kind,
+            "state": "running",
+            "phase": "queued",
+            "total": 0,
+            "done": 0,
+            "started_at": time.time(),
+            "finished_at": None,
+            **extra,
+        }
+        _JOBS[job["job_id"]] = job
+        # bỏ bớt job cũ đã xong
+        while len(_JOBS) > _MAX_JOBS_KEPT:
+            oldest = next(k for k, v in _JOBS.items() if v["state"] != "running")
+            del _JOBS[oldest]
+    threading.Thread(target=_run_job, args=(job, runner),
+                     name=f"{kind}-{job['job_id']}", daemon=True).start()
+    return dict(job)
 
-def reindex_static() -> Dict[str, object]:
-    build_static_index()
-    return {
-        "count": len(STATIC_LABELS),
-        "labels": STATIC_LABELS,
-        "files": STATIC_FILES,
-    }
+def reindex_static(runner: Optional[Callable[..., Dict[str, object]]] = None) -> Dict[str, object]:
+    """
+    Bắt đầu reindex nền, trả ngay thông tin job.
+    Nếu đang có job chạy thì trả lại job đó (không chạy chồng).
+    runner mặc định là build_static_index (pool nhiều process truyền hàm riêng).
+    """
+    return _start_job("reindex", runner or build_static_index)
+
+def job_status(job_id: str) -> Optional[Dict[str, object]]:
+    with _JOBS_LOCK:
+        j = _JOBS.get(job_id)
+        return dict(j) if j else None
+
+reindex_status = job_status
+
+def model_version() -> str:
+    """định danh (index static, CNN) đang phục vụ; đổi khi kết quả classify có thể đổi"""
+    return f"{_SNAPSHOT.index_id}/{_CNN.version}"
 
 def index_info() -> Dict[str, object]:
+    snap = _SNAPSHOT
     return {
-        "count": len(STATIC_LABELS),
-        "labels": STATIC_LABELS,
+        "version": snap.version,
+        "count": len(snap.classes),
+        "labels": snap.classes,
+        "images": len(snap.files),
+        "per_class": {c: int(n) for c, n in zip(snap.classes, snap.class_counts)},
+        "aggregation": STATIC_AGG,
     }
 
 # =========================
 #  CNN (TÙY CHỌN)
 # =========================
+# model lấy từ kho phiên bản (ml_registry, models/registry/CURRENT);
+# kho trống → file cũ MODEL_PATH + LABELS_PATH
+class CnnBundle(NamedTuple):
+    """
+    1 model CNN đã load + warm, bất biến. /classify đọc _CNN đúng 1 lần/batch;
+    đổi model = build bundle mới ở nền rồi gán lại tham chiếu (atomic).
+    """
+    version: str                                   # tên phiên bản kho / hash file ("none" = không có CNN)
+    model: object                                  # model đầy đủ (None khi dùng chung backbone)
+    head: Optional[Tuple[np.ndarray, np.ndarray]]  # Dense cuối (W,b) ở chế độ dùng chung backbone
+    labels: List[str]
+    input_scale: float                             # pixel 0..255 nhân hệ số này trước khi vào model
+    source: str                                    # file đã load
+    registry_version: Optional[str]
+    loaded_at: float
+
+_NO_CNN = CnnBundle("none", None, None, [], 1.0 / 255.0, "", None, 0.0)
+_CNN = _NO_CNN
+_CNN_PREV: Optional[CnnBundle] = None      # giữ bản trước trong RAM → rollback tức thì
+_CNN_STAGED: Optional[CnnBundle] = None    # đã load + warm, chờ commit
+_SWAP_LOCK = threading.Lock()
+
+# tên cũ (ml/tflite_report.py, ...): luôn trỏ theo _CNN
 CNN_MODEL = None
 CNN_LABELS: List[str] = []
+# chế độ dùng chung backbone: chỉ giữ Dense cuối (W,b), bỏ model đầy đủ khỏi RAM
+CNN_HEAD: Optional[Tuple[np.ndarray, np.ndarray]] = None
+# phiên bản model đang phục vụ ("none" = không có CNN)
+CNN_VERSION = "none"
+
+_CNN_CHECKED = False
+_CNN_LOCK = threading.Lock()
+
+def _install(bundle: CnnBundle) -> None:
+    global _CNN, CNN_MODEL, CNN_LABELS, CNN_HEAD, CNN_VERSION
+    _CNN = bundle
+    CNN_MODEL, CNN_LABELS, CNN_HEAD, CNN_VERSION = bundle.model, bundle.labels, bundle.head, bundle.version
 
 def _load_cnn_if_any():
-    """có file .h5 và labels.json thì load; không có thì bỏ qua"""
-    global CNN_MODEL, CNN_LABELS
-    if CNN_MODEL is not None:
+    """lần đầu: load phiên bản CURRENT (hoặc file cũ); không có thì bỏ qua (chỉ thử 1 lần)"""
+    if _CNN_CHECKED:
         return
-    if not os.path.isfile(MODEL_PATH) or not os.path.isfile(LABELS_PATH):
+    with _CNN_LOCK:
+        if not _CNN_CHECKED:
+            _load_cnn()
+
+def _cnn_source(version: Optional[str] = None) -> Dict[str, object]:
+    """đường dẫn model/labels của phiên bản (None = CURRENT, kho trống → file cũ)"""
+    mv = ml_registry.resolve(version)
+    if mv is None:
+        return {"model_path": MODEL_PATH, "labels_path": LABELS_PATH, "tflite_dir": TFLITE_DIR,
+                "input_scale": None, "registry_version": None}
+    return {"model_path": mv.model_path, "labels_path": mv.labels_path,
+            "tflite_dir": os.path.join(mv.path, "tflite"), "input_scale": mv.input_scale,
+            "registry_version": mv.version}
+
+def _cnn_model_path(src: Optional[Dict[str, object]] = None) -> str:
+    src = src or _cnn_source()
+    if ML_BACKEND == "tflite":
+        return os.path.join(str(src["tflite_dir"]), f"cnn_{TFLITE_QUANT}.tflite")
+    return str(src["model_path"])
+
+def _cnn_files_exist() -> bool:
+    try:
+        src = _cnn_source()
+    except (KeyError, ValueError):
+        return True          # CURRENT trỏ tới bản hỏng: coi như lỗi, không phải vắng
+    return os.path.isfile(_cnn_model_path(src)) and os.path.isfile(str(src["labels_path"]))
+
+def _build_cnn(version: Optional[str] = None) -> CnnBundle:
+    """load model thành bundle mới (chưa phục vụ); lỗi → exception, không có file → _NO_CNN"""
+    src = _cnn_source(version)
+    labels_path = str(src["labels_path"])
+    reg = src["registry_version"]
+    if ML_BACKEND == "tflite":
+        # export đã tách sẵn Dense cuối (nếu CNN đúng dạng train.py) → dùng chung backbone
+        head_path = os.path.join(str(src["tflite_dir"]), "cnn_head.npz")
+        if SHARED_BACKBONE != "off" and os.path.isfile(head_path) and os.path.isfile(labels_path):
+            with np.load(head_path) as z:
+                head = (z["W"].astype(np.float32), z["b"].astype(np.float32))
+            print(f"[ml_infer] loaded CNN head: {head_path} (shared backbone)", flush=True)
+            return CnnBundle(reg or file_digest(head_path)[:16], None, head, ml_registry.load_labels(labels_path),
+                             1.0, head_path, reg, time.time())
+    model_path = _cnn_model_path(src)
+    if not os.path.isfile(model_path) or not os.path.isfile(labels_path):
+        if version is not None:
+            raise FileNotFoundError(f"{model_path} / {labels_path}")
         print("[ml_infer] no CNN model found -> chỉ dùng static", flush=True)
-        CNN_MODEL = None
-        CNN_LABELS = []
-        return
+        return _NO_CNN
+    scale = src["input_scale"]
+    if ML_BACKEND == "tflite":
+        from ml_tflite import TFLiteModel
+        model = TFLiteModel(model_path, num_threads=TFLITE_THREADS)
+        head = None
+        if scale is None:
+            # không còn cấu trúc Keras để đoán: dùng hệ số export_tflite đã ghi cạnh file
+            scale = _read_tflite_scale(str(src["tflite_dir"]))
+    else:
+        model = _tf().keras.models.load_model(model_path)
+        head = _extract_head(model)
+        if scale is None:
+            scale = cnn_input_scale(model, head)
+    labels = ml_registry.load_labels(labels_path)
+    if scale is None:
+        scale = 1.0 / 255.0
+    bundle = CnnBundle(reg or file_digest(model_path)[:16], model, None, labels, float(scale),
+                       model_path, reg, time.time())
+    print(f"[ml_infer] loaded CNN model: {model_path} ({len(labels)} classes)", flush=True)
+    return _try_share_backbone(bundle, head)
+
+def cnn_input_scale(model, head: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> float:
+    """
+    Model chưa ghi input_scale trong manifest: dạng ml/train.py (tự preprocess_input) nhận 0..255,
+    model cũ nhận 0..1. Dùng chung cho lúc load và lúc calibrate int8 (ml/export_tflite.py).
+    """
+    if head is None:
+        head = _extract_head(model)
+    return 1.0 if head is not None else 1.0 / 255.0
+
+_TFLITE_INPUT = "cnn_input.json"
+
+def _read_tflite_scale(tflite_dir: str) -> Optional[float]:
+    try:
+        with open(os.path.join(tflite_dir, _TFLITE_INPUT), "r", encoding="utf-8") as f:
+            return float(json.load(f)["input_scale"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _load_cnn():
+    # gọi khi giữ _CNN_LOCK; chỉ đánh dấu đã thử sau khi _CNN đã gán xong,
+    # request tới giữa lúc load sẽ chờ lock thay vì chạy với _NO_CNN
+    global _CNN_CHECKED
     try:
-        CNN_MODEL = tf.keras.models.load_model(MODEL_PATH)
-        with open(LABELS_PATH, "r", encoding="utf-8") as f:
-            import json
-            CNN_LABELS = json.load(f)
-        print(f"[ml_infer] loaded CNN model: {MODEL_PATH} ({len(CNN_LABELS)} classes)", flush=True)
+        _install(_build_cnn())
     except Exception as e:
         print("[ml_infer] load CNN failed:", e, flush=True)
-        CNN_MODEL = None
-        CNN_LABELS = []
+        _install(_NO_CNN)
+    _CNN_CHECKED = True
+
+def _extract_head(model) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Model dạng ml/train.py: Input → preprocess → MobileNetV2 (include_top=False)
+    → GlobalAveragePooling2D → Dropout → Dense(softmax).
+    Trả (W,b) của Dense cuối nếu đúng cấu trúc, ngược lại None.
+    """
+    tf = _tf()
+    layers = list(model.layers)
+    pos = [i for i, l in enumerate(layers)
+           if isinstance(l, tf.keras.Model) and "mobilenetv2" in l.name.lower()]
+    if len(pos) != 1:
+        return None
+    tail = layers[pos[0] + 1:]
+    if not tail or not isinstance(tail[-1], tf.keras.layers.Dense):
+        return None
+    ok_mid = (tf.keras.layers.GlobalAveragePooling2D, tf.keras.layers.Dropout)
+    if not all(isinstance(l, ok_mid) for l in tail[:-1]):
+        return None
+    W, b = tail[-1].get_weights()
+    return np.asarray(W, dtype=np.float32), np.asarray(b, dtype=np.float32)
+
+def _try_share_backbone(bundle: CnnBundle, head: Optional[Tuple[np.ndarray, np.ndarray]]) -> CnnBundle:
+    """bật chế độ dùng chung backbone nếu được: bundle chỉ giữ head, bỏ model đầy đủ"""
+    if SHARED_BACKBONE == "off" or bundle.model is None or ML_BACKEND != "keras":
+        return bundle
+    if head is None:
+        print("[ml_infer] shared backbone: CNN không phải MobileNetV2+Dense -> chạy riêng", flush=True)
+        return bundle
+    if SHARED_BACKBONE == "auto":
+        diff = _head_mismatch(bundle.model, head, bundle.input_scale)
+        if diff > 1e-3:
+            print(f"[ml_infer] shared backbone: lệch {diff:.4g} so với CNN đầy đủ -> chạy riêng", flush=True)
+            return bundle
+    print("[ml_infer] shared backbone: ON (1 lượt MobileNetV2 cho static + CNN)", flush=True)
+    return bundle._replace(model=None, head=head)
+
+def _head_mismatch(model, head: Tuple[np.ndarray, np.ndarray], input_scale: float = 1.0) -> float:
+    """so model đầy đủ (input 0..255 * input_scale) với backbone chung + head"""
+    rng = np.random.default_rng(0)
+    probe = rng.uniform(0, 255, size=(1, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+    full = np.asarray(model.predict(probe * input_scale, verbose=0), dtype=np.float64)
+    shared = _head_probs(head, _features(preprocess_input(probe)))
+    return float(np.abs(full - shared).max())
+
+def _head_probs(head: Tuple[np.ndarray, np.ndarray], feats: np.ndarray) -> np.ndarray:
+    W, b = head
+    return _softmax_rows(feats.astype(np.float64) @ W + b)
+
+def _probs_to_topk(probs: np.ndarray, topk: int,
+                   labels: Optional[List[str]] = None) -> List[List[Dict[str, float]]]:
+    labels = CNN_LABELS if labels is None else labels
+    top = _topk_indices(probs, topk)
+    out = []
+    for b in range(len(probs)):
+        out.append([
+            {"code": labels[i], "prob": float(probs[b, i])}
+            for i in top[b] if i < len(labels)
+        ])
+    return out
+
+def _cnn_predict_arrays(arrs: np.ndarray, topk: int = 3,
+                        cnn: Optional[CnnBundle] = None) -> List[List[Dict[str, float]]]:
+    """(B,S,S,3) 0..255 -> list (theo ảnh) các [{code, prob}] từ CNN; nếu không có CNN → [[], ...]"""
+    _load_cnn_if_any()
+    cnn = cnn or _CNN
+    if cnn.model is None or not cnn.labels:
+        return [[] for _ in range(len(arrs))]
+    if arrs.shape[1:3] != (224, 224):
+        arrs = np.stack([
+            np.asarray(Image.fromarray(np.asarray(a, dtype=np.uint8)).resize((224, 224)))
+            for a in arrs
+        ])
+    x = np.asarray(arrs, dtype=np.float32) * cnn.input_scale
+    preds = cnn.model.predict(x, batch_size=len(x), verbose=0)    # (B,C)
+    # softmax nếu model chưa softmax
+    return _probs_to_topk(_softmax_rows(np.asarray(preds, dtype=np.float64)), topk, cnn.labels)
+
+def _cnn_predict_batch(pil_imgs: Sequence[Image.Image], topk: int = 3) -> List[List[Dict[str, float]]]:
+    """trả list (theo ảnh) các [{code, prob}] từ CNN; nếu không có CNN → [[], ...]"""
+    return _cnn_predict_arrays(np.stack([to_array(im) for im in pil_imgs]), topk=topk)
 
 def _cnn_predict(pil_img: Image.Image, topk: int = 3) -> List[Dict[str, float]]:
     """trả list [{code, prob}] từ CNN; nếu không có CNN → []"""
+    return _cnn_predict_batch([pil_img], topk=topk)[0]
+
+# =========================
+#  ĐỔI MODEL KHÔNG DOWNTIME
+# =========================
+def _bundle_info(b: Optional[CnnBundle]) -> Optional[Dict[str, object]]:
+    if b is None:
+        return None
+    return {
+        "version": b.version,
+        "registry_version": b.registry_version,
+        "source": b.source,
+        "classes": len(b.labels),
+        "shared_backbone": b.head is not None,
+        "input_scale": b.input_scale,
+        "loaded_at": b.loaded_at or None,
+    }
+
+def cnn_info() -> Dict[str, object]:
+    return {
+        "active": _bundle_info(_CNN),
+        "previous": _bundle_info(_CNN_PREV),
+        "staged": _bundle_info(_CNN_STAGED),
+        "model_version": model_version(),
+    }
+
+def _warm_bundle(b: CnnBundle) -> None:
+    # forward thử để TF dựng graph trước khi nhận traffic (không làm chậm request đầu tiên)
+    if b.model is not None:
+        _cnn_predict_arrays(np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8), topk=1, cnn=b)
+    elif b.head is not None:
+        _load_backbone()
+        _head_probs(b.head, _features(np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)))
+
+def prepare_cnn(version: Optional[str] = None) -> Dict[str, object]:
+    """load + warm phiên bản (None = CURRENT) vào chỗ chờ; traffic vẫn dùng bản cũ"""
+    global _CNN_STAGED
     _load_cnn_if_any()
-    if CNN_MODEL is None or not CNN_LABELS:
-        return []
-    arr = pil_img.resize((224, 224)).convert("RGB")
-    x = np.array(arr, dtype=np.float32)
-    x = np.expand_dims(x, 0) / 255.0
-    preds = CNN_MODEL.predict(x, verbose=0)[0]    # (C,)
-    # softmax nếu model chưa softmax
-    if preds.ndim == 1:
-        # chuẩn hoá
-        ex = np.exp(preds - preds.max())
-        probs = ex / (ex.sum() + 1e-12)
-    else:
-        probs = preds
-    order = np.argsort(-probs)[:topk]
-    out = []
-    for i in order:
-        if i < len(CNN_LABELS):
-            out.append({"code": CNN_LABELS[i], "prob": float(probs[i])})
-    return out
+    b = _build_cnn(version)
+    _warm_bundle(b)
+    with _SWAP_LOCK:
+        _CNN_STAGED = b
+    return _bundle_info(b)
+
+def commit_cnn() -> Dict[str, object]:
+    """chuyển traffic sang bản đã prepare (gán 1 tham chiếu); bản cũ giữ lại để rollback"""
+    global _CNN_PREV, _CNN_STAGED
+    with _SWAP_LOCK:
+        if _CNN_STAGED is None:
+            raise RuntimeError("no staged model, call prepare_cnn first")
+        _CNN_PREV = _CNN
+        _install(_CNN_STAGED)
+        _CNN_STAGED = None
+    print(f"[ml_infer] CNN switched to {CNN_VERSION}", flush=True)
+    return cnn_info()
+
+def rollback_cnn(persist: bool = True) -> Dict[str, object]:
+    """quay lại bản trước (vẫn còn trong RAM, không load lại)"""
+    global _CNN_PREV
+    with _SWAP_LOCK:
+        if _CNN_PREV is None:
+            raise RuntimeError("no previous model to roll back to")
+        prev = _CNN_PREV
+        _CNN_PREV = _CNN
+        _install(prev)
+    print(f"[ml_infer] CNN rolled back to {CNN_VERSION}", flush=True)
+    if persist and prev.registry_version:
+        ml_registry.set_current(prev.registry_version)
+    return cnn_info()
+
+def activate_cnn(version: str, progress: Optional[Callable[..., None]] = None) -> Dict[str, object]:
+    """load + warm ở nền → đổi traffic → ghi CURRENT (restart vẫn dùng bản này)"""
+    report = progress or (lambda **kw: None)
+    report(phase="load", version=version)
+    prepare_cnn(version)
+    report(phase="switch")
+    info = commit_cnn()
+    ml_registry.set_current(version)
+    return info
+
+def switch_model(version: str, runner: Optional[Callable[..., Dict[str, object]]] = None) -> Dict[str, object]:
+    """bắt đầu đổi model ở nền, trả ngay thông tin job (xem job_status)"""
+    ml_registry.get_version(version)       # KeyError nếu không có trong kho
+    run = runner or activate_cnn
+    return _start_job("model", lambda progress: run(version, progress=progress), version=version)
+
+# =========================
+#  WARM-UP & READINESS
+# =========================
+# state: pending | loading | ready | absent | failed
+_COMPONENTS: Dict[str, Dict[str, object]] = {
+    name: {"state": "pending", "seconds": None, "error": None}
+    for name in ("backbone", "static_index", "cnn", "warmup")
+}
+_WARMUP_THREAD: Optional[threading.Thread] = None
+_WARMUP_LOCK = threading.Lock()
+
+def _run_component(name: str, fn: Callable[[], Optional[str]]) -> bool:
+    """chạy fn, ghi state + thời gian; fn trả 'absent' nếu thành phần không có"""
+    comp = _COMPONENTS[name]
+    comp.update(state="loading", error=None)
+    t0 = time.perf_counter()
+    try:
+        res = fn()
+        comp["state"] = res or "ready"
+        return True
+    except Exception as e:
+        comp.update(state="failed", error=str(e))
+        print(f"[ml_infer] warm-up {name} failed:", e, flush=True)
+        return False
+    finally:
+        comp["seconds"] = round(time.perf_counter() - t0, 3)
+
+def _warm_cnn() -> Optional[str]:
+    _load_cnn_if_any()
+    if _CNN.version != "none":
+        return None
+    if not _cnn_files_exist():
+        return "absent"
+    raise RuntimeError("load CNN failed")
+
+def _warm_forward() -> None:
+    # 1 lượt forward giả để TF dựng graph/kernels trước khi nhận traffic thật
+    classify_batch([Image.new("RGB", (IMG_SIZE, IMG_SIZE))], topk=1)
+
+def warm_up() -> None:
+    """load backbone → build static index → load CNN → forward thử; chạy tuần tự"""
+    if not _run_component("backbone", _load_backbone):
+        return
+    _run_component("static_index", lambda: build_static_index() and None)
+    _run_component("cnn", _warm_cnn)
+    _run_component("warmup", _warm_forward)
+    print(f"[ml_infer] ready={is_ready()}", flush=True)
+
+def start_warmup() -> None:
+    """chạy warm_up ở thread nền (gọi nhiều lần chỉ chạy 1 lần)"""
+    global _WARMUP_THREAD
+    with _WARMUP_LOCK:
+        if _WARMUP_THREAD is not None:
+            return
+        _WARMUP_THREAD = threading.Thread(target=warm_up, name="ml-warmup", daemon=True)
+        _WARMUP_THREAD.start()
+
+def is_ready() -> bool:
+    """backbone + index + warmup xong; CNN được phép vắng/lỗi (khi đó chỉ dùng static)"""
+    st = {k: v["state"] for k, v in _COMPONENTS.items()}
+    return (st["backbone"] == "ready"
+            and st["static_index"] == "ready"
+            and st["cnn"] in ("ready", "absent", "failed")
+            and st["warmup"] == "ready")
+
+def readiness() -> Dict[str, object]:
+    return {
+        "ready": is_ready(),
+        "components": {k: dict(v) for k, v in _COMPONENTS.items()},
+        "index_version": _SNAPSHOT.version,
+        "model_version": model_version(),
+        "shared_backbone": _CNN.head is not None,
+        "cnn_version": _CNN.registry_version or _CNN.version,
+        "backend": ML_BACKEND if ML_BACKEND != "tflite" else f"tflite/{TFLITE_QUANT}",
+    }
 
 # =========================
 #  HÀM CHÍNH GỌI TỪ /classify
 # =========================
-def classify_image(pil_img: Image.Image, topk: int = 3) -> List[Dict[str, float]]:
-    """
-    1. nếu có static index → so khớp static
-    2. gọi thêm CNN (nếu có) → merge
-    3. chuẩn hoá lại để tổng = 1
-    """
-    results: List[Dict[str, float]] = []
-
-    # 1) STATIC
-    if STATIC_INDEX is not None and len(STATIC_LABELS) > 0:
-        q = _embed(_prep_image(pil_img))[0]             # (1280,)
-        sims = (STATIC_INDEX @ q[:, None]).ravel()      # (M,)
-        z = sims / STATIC_TEMP
-        z -= z.max()
-        p = np.exp(z); p /= (p.sum() + 1e-12)
-        order = np.argsort(-p)[:topk]
-        for i in order:
-            results.append({
-                "code": STATIC_LABELS[i],
-                "prob": float(p[i])
-            })
-
-    # 2) CNN
-    cnn_res = _cnn_predict(pil_img, topk=topk)
-    # gộp 2 list theo code: nếu trùng code thì lấy max(prob)
+def _topk_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """(B,N) -> (B,k) chỉ số điểm cao nhất, đã sắp giảm dần (argpartition, không sort cả hàng)"""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+def _softmax_rows(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    p = np.exp(z)
+    p /= (p.sum(axis=1, keepdims=True) + 1e-12)
+    return p
+
+def _class_scores(snap: StaticSnapshot, sims: np.ndarray) -> np.ndarray:
+    """(B,M) độ tương đồng từng ảnh mẫu -> (B,C) xác suất theo lớp, tính 1 lượt cho cả batch"""
+    if STATIC_AGG == "knn":
+        # bỏ phiếu k láng giềng gần nhất, trọng số exp(sim/T)
+        k = max(1, min(STATIC_KNN_K, sims.shape[1]))
+        nn = np.argpartition(-sims, k - 1, axis=1)[:, :k]                  # (B,k)
+        nn_sims = np.take_along_axis(sims, nn, axis=1)
+        w = np.exp((nn_sims - nn_sims.max(axis=1, keepdims=True)) / STATIC_TEMP)
+        votes = np.zeros((sims.shape[0], len(snap.classes)), dtype=np.float64)
+        rows = np.repeat(np.arange(sims.shape[0]), k)
+        np.add.at(votes, (rows, snap.class_ids[nn].ravel()), w.ravel())
+        votes /= (votes.sum(axis=1, keepdims=True) + 1e-12)
+        return votes
+    if STATIC_AGG == "mean":
+        agg = np.add.reduceat(sims, snap.class_starts, axis=1) / snap.class_counts
+    else:
+        agg = np.maximum.reduceat(sims, snap.class_starts, axis=1)
+    return _softmax_rows(agg / STATIC_TEMP)
+
+def _static_probs(snap: StaticSnapshot, feats: np.ndarray) -> Optional[np.ndarray]:
+    """(B,1280) features -> (B,C) xác suất theo lớp static; không có index → None"""
+    if snap.index is None or len(snap.classes) == 0:
+        return None
+    q = _l2n(feats)                                     # (B,1280)
+    sims = q @ snap.index.T                             # (B,M)
+    return _class_scores(snap, sims)
+
+def _fuse(static_res: List[Dict[str, float]],
+          cnn_res: List[Dict[str, float]],
+          topk: int) -> List[Dict[str, float]]:
+    """gộp 2 list theo code: nếu trùng code thì lấy max(prob), chuẩn hoá lại để tổng = 1"""
     merged: Dict[str, float] = {}
-    for r in results:
+    for r in static_res:
         merged[r["code"]] = max(merged.get(r["code"], 0.0), r["prob"])
     for r in cnn_res:
         merged[r["code"]] = max(merged.get(r["code"], 0.0), r["prob"])
@@ -198,3 +869,68 @@ def classify_image(pil_img: Image.Image, topk: int = 3) -> List[Dict[str, float]
             "prob": float(probs[idx])
         })
     return final
+
+def classify_arrays(arrs: np.ndarray,
+                    topk: Union[int, Sequence[int]] = 3) -> List[List[Dict[str, float]]]:
+    """
+    (B,IMG_SIZE,IMG_SIZE,3) pixel 0..255 (xem to_array) -> top-k theo từng ảnh.
+    1 lượt forward static + 1 lượt CNN cho cả batch, mỗi ảnh nhận top-k riêng.
+    Ở chế độ dùng chung backbone, CNN chỉ là 1 phép nhân ma trận trên features.
+    topk: 1 số chung hoặc list theo từng ảnh.
+    """
+    n = len(arrs)
+    if n == 0:
+        return []
+    topks = [int(topk)] * n if isinstance(topk, int) else [int(k) for k in topk]
+    kmax = max(topks)
+
+    # 1) STATIC (đọc snapshot 1 lần cho cả batch)
+    snap = _SNAPSHOT
+    _load_cnn_if_any()
+    cnn = _CNN
+    head = cnn.head
+    feats = None
+    if snap.index is not None or head is not None:
+        with metrics.stage("preprocess"):
+            x = preprocess_input(np.asarray(arrs, dtype=np.float32))
+        with metrics.stage("embed"):
+            feats = _features(x)
+    static_res: List[List[Dict[str, float]]] = [[] for _ in range(n)]
+    with metrics.stage("static_sim"):
+        p = _static_probs(snap, feats) if feats is not None else None
+        if p is not None:
+            top = _topk_indices(p, kmax)
+            for b in range(n):
+                static_res[b] = [
+                    {"code": snap.classes[i], "prob": float(p[b, i])}
+                    for i in top[b, :topks[b]]
+                ]
+
+    # 2) CNN (dùng lại cùng mảng input)
+    with metrics.stage("cnn"):
+        if head is not None and cnn.labels:
+            cnn_res = _probs_to_topk(_head_probs(head, feats), kmax, cnn.labels)
+        else:
+            cnn_res = _cnn_predict_arrays(arrs, topk=kmax, cnn=cnn)
+
+    # 3) gộp
+    with metrics.stage("fuse"):
+        return [
+            _fuse(static_res[b], cnn_res[b][:topks[b]], topks[b])
+            for b in range(n)
+        ]
+
+def classify_batch(pil_imgs: Sequence[Image.Image],
+                   topk: Union[int, Sequence[int]] = 3) -> List[List[Dict[str, float]]]:
+    """Giống classify_image nhưng cho nhiều ảnh một lúc (xem classify_arrays)"""
+    if len(pil_imgs) == 0:
+        return []
+    return classify_arrays(np.stack([to_array(im) for im in pil_imgs]), topk=topk)
+
+def classify_image(pil_img: Image.Image, topk: int = 3) -> List[Dict[str, float]]:
+    """
+    1. nếu có static index → so khớp static
+    2. gọi thêm CNN (nếu có) → merge
+    3. chuẩn hoá lại để tổng = 1
+    """
+    return classify_batch([pil_img], topk=topk)[0]
@@ -0,0 +1,248 @@
+"""
+Kho model CNN theo phiên bản (không import TF).
+
+    models/registry/
+      CURRENT                      # tên phiên bản đang phục vụ
+      history.json                 # các lần kích hoạt (để rollback sau restart)
+      v20261018-0930-1a2b3c4d/
+        model.h5
+        labels.json                # luôn dạng list ["aphid", ...]
+        manifest.json              # version, sha1, số lớp, input_scale, ...
+        tflite/                    # (tuỳ chọn) cnn_<quant>.tflite, cnn_head.npz
+
+Đưa model vào kho (chạy trong backend/):
+    python -m ml_registry add ml/model.h5 ml/labels.json --activate
+    python -m ml_registry add-legacy           # models/mobilenetv2_durian.h5 + models/labels.json
+    python -m ml_registry list
+    python -m ml_registry activate <version>   # đổi CURRENT (API đang chạy: POST /admin/models/<version>/activate)
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from ml_embed_cache import file_digest
+
+# =========================
+#  CẤU HÌNH
+# =========================
+ML_REGISTRY_DIR = os.environ.get("ML_REGISTRY_DIR", os.path.join("models", "registry"))
+_CURRENT = "CURRENT"
+_HISTORY = "history.json"
+_MANIFEST = "manifest.json"
+_HISTORY_KEPT = 50
+
+
+class ModelVersion(NamedTuple):
+    version: str
+    path: str                        # thư mục phiên bản
+    model_path: str
+    labels_path: str
+    input_scale: Optional[float]     # None: tự đoán khi load (xem ml_infer)
+    manifest: Dict[str, Any]
+
+
+# =========================
+#  NHÃN
+# =========================
+def normalize_labels(data: Any) -> List[str]:
+    """
+    labels.json các kiểu → list theo chỉ số lớp:
+      ["aphid", ...]            (models/labels.json)
+      {"0": "aphid", ...}       (ml/train.py: index -> code)
+      {"aphid": 0, ...}         (class_indices của Keras)
+    """
+    if isinstance(data, list):
+        return [str(x) for x in data]
+    if not isinstance(data, dict):
+        raise ValueError("labels.json must be a list or an object")
+    if all(str(k).lstrip("-").isdigit() for k in data):
+        pairs = sorted((int(k), str(v)) for k, v in data.items())
+    elif all(isinstance(v, int) for v in data.values()):
+        pairs = sorted((int(v), str(k)) for k, v in data.items())
+    else:
+        raise ValueError("labels.json object must map index->code or code->index")
+    idx = [i for i, _ in pairs]
+    if idx != list(range(len(pairs))):
+        raise ValueError(f"label indices must be 0..{len(pairs) - 1}")
+    return [c for _, c in pairs]
+
+
+def load_labels(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return normalize_labels(json.load(f))
+
+
+# =========================
+#  ĐỌC KHO
+# =========================
+def _dir(version: str, root: str) -> str:
+    if not version or os.sep in version or "/" in version or version.startswith("."):
+        raise ValueError(f"invalid version name: {version!r}")
+    return os.path.join(root, version)
+
+
+def _read_json(path: str, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def get_version(version: str, root: str = ML_REGISTRY_DIR) -> ModelVersion:
+    """KeyError nếu không có phiên bản"""
+    d = _dir(version, root)
+    manifest = _read_json(os.path.join(d, _MANIFEST), None)
+    if manifest is None:
+        raise KeyError(version)
+    return ModelVersion(
+        version=version,
+        path=d,
+        model_path=os.path.join(d, manifest.get("model_file", "model.h5")),
+        labels_path=os.path.join(d, manifest.get("labels_file", "labels.json")),
+        input_scale=manifest.get("input_scale"),
+        manifest=manifest,
+    )
+
+
+def current_version(root: str = ML_REGISTRY_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(root, _CURRENT), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve(version: Optional[str] = None, root: str = ML_REGISTRY_DIR) -> Optional[ModelVersion]:
+    """version=None → CURRENT; kho trống / chưa có CURRENT → None (dùng file model cũ)"""
+    if version is None:
+        version = current_version(root)
+        if version is None:
+            return None
+    return get_version(version, root)
+
+
+def list_versions(root: str = ML_REGISTRY_DIR) -> List[Dict[str, Any]]:
+    if not os.path.isdir(root):
+        return []
+    cur = current_version(root)
+    out = []
+    for name in os.listdir(root):
+        m = _read_json(os.path.join(root, name, _MANIFEST), None)
+        if m is not None:
+            out.append({**m, "current": name == cur})
+    return sorted(out, key=lambda m: m.get("created_at", 0))
+
+
+def history(root: str = ML_REGISTRY_DIR) -> List[Dict[str, Any]]:
+    return _read_json(os.path.join(root, _HISTORY), [])
+
+
+# =========================
+#  GHI KHO
+# =========================
+def set_current(version: str, root: str = ML_REGISTRY_DIR) -> None:
+    """đổi CURRENT (ghi file tạm rồi rename) + ghi lịch sử"""
+    get_version(version, root)
+    os.makedirs(root, exist_ok=True)
+    if current_version(root) == version:
+        return
+    _write_atomic(os.path.join(root, _CURRENT), version + "\n")
+    hist = history(root)
+    hist.append({"version": version, "at": time.time()})
+    _write_atomic(os.path.join(root, _HISTORY), json.dumps(hist[-_HISTORY_KEPT:], indent=2))
+
+
+def publish(model_path: str, labels_path: str, version: Optional[str] = None,
+            input_scale: Optional[float] = None, tflite_dir: Optional[str] = None,
+            notes: str = "", activate: bool = False, root: str = ML_REGISTRY_DIR) -> Dict[str, Any]:
+    """chép model + labels (chuẩn hoá về list) vào thư mục phiên bản mới, ghi manifest"""
+    labels = load_labels(labels_path)
+    digest = file_digest(model_path)
+    if version is None:
+        version = time.strftime("v%Y%m%d-%H%M%S") + "-" + digest[:8]
+    final = _dir(version, root)
+    if os.path.exists(final):
+        raise FileExistsError(f"version {version} already exists")
+    os.makedirs(root, exist_ok=True)
+
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    model_file = "model" + os.path.splitext(model_path)[1]
+    shutil.copy2(model_path, os.path.join(tmp, model_file))
+    with open(os.path.join(tmp, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+    if tflite_dir and os.path.isdir(tflite_dir):
+        shutil.copytree(tflite_dir, os.path.join(tmp, "tflite"))
+    manifest = {
+        "version": version,
+        "created_at": time.time(),
+        "model_file": model_file,
+        "labels_file": "labels.json",
+        "sha1": digest,
+        "size": os.path.getsize(model_path),
+        "num_classes": len(labels),
+        "input_scale": input_scale,
+        "source": os.path.abspath(model_path),
+        "notes": notes,
+    }
+    with open(os.path.join(tmp, _MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, final)
+    if activate:
+        set_current(version, root)
+    return manifest
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Kho model CNN theo phiên bản")
+    ap.add_argument("--root", default=ML_REGISTRY_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    a = sub.add_parser("add")
+    a.add_argument("model")
+    a.add_argument("labels")
+    a.add_argument("--version")
+    a.add_argument("--input-range", choices=("auto", "1", "255"), default="auto",
+                   help="model nhận ảnh 0..1 hay 0..255 (auto: đoán theo cấu trúc model khi load)")
+    a.add_argument("--tflite-dir", help="kèm các file cnn_*.tflite / cnn_head.npz")
+    a.add_argument("--notes", default="")
+    a.add_argument("--activate", action="store_true")
+    leg = sub.add_parser("add-legacy", help="đưa models/mobilenetv2_durian.h5 + models/labels.json vào kho")
+    leg.add_argument("--activate", action="store_true")
+    act = sub.add_parser("activate")
+    act.add_argument("version")
+    args = ap.parse_args()
+
+    if args.cmd == "list":
+        for m in list_versions(args.root):
+            mark = "*" if m["current"] else " "
+            print(f"{mark} {m['version']:32s} {m['num_classes']:3d} classes  {m['sha1'][:12]}  {m.get('notes', '')}")
+    elif args.cmd == "add":
+        scale = {"auto": None, "1": 1.0 / 255.0, "255": 1.0}[args.input_range]
+        m = publish(args.model, args.labels, args.version, scale, args.tflite_dir, args.notes,
+                    args.activate, args.root)
+        print(f"✅ {m['version']} ({m['num_classes']} classes)" + (" -> CURRENT" if args.activate else ""))
+    elif args.cmd == "add-legacy":
+        m = publish(os.path.join("models", "mobilenetv2_durian.h5"), os.path.join("models", "labels.json"),
+                    tflite_dir=os.path.join("models", "tflite"),
+                    notes="legacy models/mobilenetv2_durian.h5", activate=args.activate, root=args.root)
+        print(f"✅ {m['version']} ({m['num_classes']} classes)" + (" -> CURRENT" if args.activate else ""))
+    elif args.cmd == "activate":
+        set_current(args.version, args.root)
+        print(f"✅ CURRENT = {args.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Optional
+
+import numpy as np
+
+
+def _interpreter_cls():
+    """ưu tiên tflite_runtime (nhẹ, không cần cả TF); không có thì dùng tf.lite"""
+    try:
+        from tflite_runtime.interpreter import Interpreter  # type: ignore
+        return Interpreter
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """
+    Bọc tf.lite Interpreter cho 1 input / 1 output:
+    - tự resize batch theo input
+    - tự quantize/dequantize nếu input/output là int8/uint8
+    - khoá khi invoke (Interpreter không thread-safe)
+    API giống Keras ở chỗ cần dùng: predict(x) -> np.ndarray
+    """
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        self.path = path
+        self._it = _interpreter_cls()(model_path=path, num_threads=num_threads)
+        self._it.allocate_tensors()
+        self._in = self._it.get_input_details()[0]
+        self._out = self._it.get_output_details()[0]
+        self._batch = int(self._in["shape"][0])
+        self._lock = threading.Lock()
+
+    @property
+    def input_dtype(self):
+        return self._in["dtype"]
+
+    def _quant_in(self, x: np.ndarray) -> np.ndarray:
+        dt = self._in["dtype"]
+        if dt in (np.int8, np.uint8):
+            scale, zero = self._in["quantization"]
+            info = np.iinfo(dt)
+            x = np.clip(np.round(x / scale + zero), info.min, info.max)
+        return x.astype(dt)
+
+    def _dequant_out(self, y: np.ndarray) -> np.ndarray:
+        if self._out["dtype"] in (np.int8, np.uint8):
+            scale, zero = self._out["quantization"]
+            return (y.astype(np.float32) - zero) * scale
+        return y.astype(np.float32)
+
+    def predict(self, x: np.ndarray, **_: Any) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if x.shape[0] != self._batch:
+                self._it.resize_tensor_input(self._in["index"], list(x.shape))
+                self._it.allocate_tensors()
+                self._in = self._it.get_input_details()[0]
+                self._out = self._it.get_output_details()[0]
+                self._batch = x.shape[0]
+            self._it.set_tensor(self._in["index"], self._quant_in(x))
+            self._it.invoke()
+            y = self._it.get_tensor(self._out["index"])
+        return self._dequant_out(y)
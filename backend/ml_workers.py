@@ -0,0 +1,335 @@
+import os
+import queue
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+import metrics
+from pools import Saturated
+
+# =========================
+#  CẤU HÌNH
+# =========================
+# số process suy luận (0 = chạy ngay trong process API như cũ)
+ML_WORKERS = int(os.environ.get("ML_WORKERS", "0"))
+# số luồng TF mỗi process (mặc định chia đều số core)
+ML_WORKER_THREADS = int(os.environ.get("ML_WORKER_THREADS", "0"))
+# chờ worker rảnh tối đa (giây), quá thì trả 503 như hàng đợi đầy
+ML_WORKER_WAIT_S = float(os.environ.get("ML_WORKER_WAIT_S", "30"))
+# reindex / load model trên 1 worker được chạy lâu hơn (giây)
+ML_WORKER_ADMIN_WAIT_S = float(os.environ.get("ML_WORKER_ADMIN_WAIT_S", "1800"))
+
+# các hàm ml_infer được phép gọi từ process API
+_CALLABLE = {"index_info", "readiness", "build_static_index",
+             "prepare_cnn", "commit_cnn", "rollback_cnn", "cnn_info"}
+
+
+def _worker_main(idx: int, shm_name: str, shape: tuple, conn, threads: int) -> None:
+    """
+    Process con: tự load model + index, rồi nhận lệnh qua Pipe.
+    Ảnh input đọc thẳng từ shared memory (không pickle tensor).
+    """
+    if threads:
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+        os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(threads))
+        os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+        os.environ.setdefault("ML_TFLITE_THREADS", str(threads))
+    import ml_infer
+    import metrics
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        ml_infer.warm_up()
+        conn.send(("ready", ml_infer.readiness()))
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            try:
+                if msg[0] == "classify":
+                    _, n, topks = msg
+                    # số đo từng stage gửi kèm kết quả, process API ghi vào /metrics
+                    with metrics.capture() as obs:
+                        res = ml_infer.classify_arrays(buf[:n], topks)
+                    res = (res, obs)
+                elif msg[0] == "call" and msg[1] in _CALLABLE:
+                    res = getattr(ml_infer, msg[1])(*msg[2])
+                else:
+                    raise ValueError(f"unknown command {msg[:2]}")
+                conn.send(("ok", res))
+            except Exception as e:
+                conn.send(("err", f"{type(e).__name__}: {e}"))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del buf
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, idx: int, ctx, shape: tuple, threads: int):
+        self.idx = idx
+        self.shape = shape
+        nbytes = int(np.prod(shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.buf = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(
+            target=_worker_main, args=(idx, self.shm.name, shape, child, threads),
+            name=f"ml-worker-{idx}", daemon=True,
+        )
+        self.proc.start()
+        child.close()
+        self.ready = False
+        self.dead = False                  # Pipe đứt, đang được thay
+        self.info: Dict[str, Any] = {}
+
+    def wait_ready(self) -> None:
+        kind, info = self.conn.recv()
+        self.info = info
+        self.ready = kind == "ready" and bool(info.get("ready"))
+
+    def request(self, msg, timeout: float = ML_WORKER_WAIT_S) -> Any:
+        self.conn.send(msg)
+        # worker treo → TimeoutError (OSError): pool coi như chết và thay worker khác
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"worker {self.idx}: no reply after {timeout:g}s")
+        kind, res = self.conn.recv()
+        if kind == "err":
+            raise RuntimeError(f"worker {self.idx}: {res}")
+        return res
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.proc.join(timeout=5)
+        if self.proc.is_alive():
+            self.proc.terminate()
+        del self.buf
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferencePool:
+    """
+    N process, mỗi process giữ 1 bản model + static index.
+    Process API chỉ decode ảnh → mảng uint8 (S,S,3), chép vào shared memory của
+    worker rảnh rồi gửi (n, topks) qua Pipe; kết quả trả về chỉ là list nhỏ.
+    Dùng làm run_batch cho MicroBatcher (concurrency = số worker).
+    """
+
+    def __init__(self, n: int, max_batch: int, img_size: int, threads: int = ML_WORKER_THREADS):
+        self.n = max(1, int(n))
+        self.max_batch = max_batch
+        self.shape = (max_batch, img_size, img_size, 3)
+        if not threads:
+            threads = max(1, (os.cpu_count() or self.n) // self.n)
+        self.threads = threads
+        self._ctx = mp.get_context("spawn")      # TF không an toàn với fork
+        self._workers: List[_Worker] = []
+        self._free: "queue.Queue[_Worker]" = queue.Queue()
+        self._started = threading.Event()
+        self._error: Optional[str] = None
+        # reindex / đổi model / rollback chạy lần lượt: 2 job cùng rút worker khỏi _free có thể
+        # giữ đúng worker mà job kia đang chờ → kẹt cả 2 (và cả /classify)
+        self._admin_lock = threading.Lock()
+        self._respawn_lock = threading.Lock()
+        self.model_version = "pending"
+
+    # ---------- vòng đời ----------
+    def start(self) -> None:
+        """
+        Worker đầu tiên warm trước (ghi cache embedding ra đĩa),
+        các worker sau khởi động song song và đọc lại cache → không embed lại.
+        """
+        try:
+            first = _Worker(0, self._ctx, self.shape, self.threads)
+            first.wait_ready()
+            rest = [_Worker(i, self._ctx, self.shape, self.threads) for i in range(1, self.n)]
+            for w in rest:
+                w.wait_ready()
+            self._workers = [first] + rest
+            for w in self._workers:
+                self._free.put(w)
+            self.model_version = str(first.info.get("model_version", "unknown"))
+            print(f"[ml_workers] {self.n} worker(s) ready, {self.threads} thread(s) each", flush=True)
+        except Exception as e:
+            self._error = str(e)
+            print("[ml_workers] start failed:", e, flush=True)
+        finally:
+            self._started.set()
+
+    def start_background(self) -> None:
+        threading.Thread(target=self.start, name="ml-workers-start", daemon=True).start()
+
+    def close(self) -> None:
+        for w in self._workers:
+            w.close()
+        self._workers = []
+
+    # ---------- gọi ----------
+    def _take(self) -> _Worker:
+        # chưa start xong / start lỗi → _free rỗng, không chờ vô hạn
+        if not self._started.is_set() or self._error:
+            raise Saturated("infer")
+        try:
+            return self._free.get(timeout=ML_WORKER_WAIT_S)
+        except queue.Empty:
+            raise Saturated("infer")
+
+    def _run_on(self, w: _Worker, fn: Callable[[_Worker], Any]) -> Any:
+        """chạy fn trên worker đã lấy ra khỏi _free rồi trả lại"""
+        try:
+            res = fn(w)
+        except (EOFError, OSError) as e:
+            # process chết (Pipe đứt): không trả lại _free, thay bằng worker mới
+            self._retire(w)
+            raise RuntimeError(f"worker {w.idx} died: {type(e).__name__}: {e}") from e
+        except BaseException:
+            self._free.put(w)
+            raise
+        self._free.put(w)
+        return res
+
+    def _with_worker(self, fn: Callable[[_Worker], Any]) -> Any:
+        return self._run_on(self._take(), fn)
+
+    def _retire(self, w: _Worker) -> None:
+        with self._respawn_lock:
+            if w.dead or w not in self._workers:
+                return
+            w.dead = True
+        print(f"[ml_workers] worker {w.idx} died, respawning", flush=True)
+        threading.Thread(target=self._respawn, args=(w,), name=f"ml-worker-{w.idx}-respawn",
+                         daemon=True).start()
+
+    def _respawn(self, old: _Worker) -> None:
+        try:
+            if old.proc.is_alive():
+                old.proc.kill()          # treo (quá timeout): không chờ nó tự thoát
+            old.close()
+        except Exception:
+            pass
+        try:
+            new = _Worker(old.idx, self._ctx, self.shape, self.threads)
+            new.wait_ready()
+        except Exception as e:
+            print(f"[ml_workers] respawn worker {old.idx} failed:", e, flush=True)
+            with self._respawn_lock:
+                self._workers = [w for w in self._workers if w is not old]
+            return
+        with self._respawn_lock:
+            self._workers = [new if w is old else w for w in self._workers]
+        self._free.put(new)
+        print(f"[ml_workers] worker {old.idx} respawned (pid {new.proc.pid})", flush=True)
+
+    def run_batch(self, arrs: Sequence[np.ndarray], topks: Sequence[int]) -> List[Any]:
+        n = len(arrs)
+        if n > self.max_batch:
+            raise ValueError(f"batch {n} > max_batch {self.max_batch}")
+
+        def go(w: _Worker):
+            for i, a in enumerate(arrs):
+                w.buf[i] = a
+            res, obs = w.request(("classify", n, list(topks)))
+            metrics.replay(obs)
+            return res
+        return self._with_worker(go)
+
+    def call(self, fname: str, *args: Any) -> Any:
+        """gọi 1 hàm ml_infer trên 1 worker bất kỳ"""
+        return self._with_worker(lambda w: w.request(("call", fname, args)))
+
+    def _call_on(self, w: _Worker, fname: str, *args: Any) -> Any:
+        """giữ riêng worker w (các worker khác vẫn phục vụ) rồi gọi 1 hàm ml_infer trên nó; cần _admin_lock"""
+        taken = []
+        try:
+            while True:
+                if w.dead or w not in self._workers:
+                    raise RuntimeError(f"worker {w.idx} is gone")
+                cand = self._take()
+                if cand is w:
+                    break
+                taken.append(cand)
+        finally:
+            for c in taken:
+                self._free.put(c)
+        return self._run_on(w, lambda x: x.request(("call", fname, args), timeout=ML_WORKER_ADMIN_WAIT_S))
+
+    def reindex_all(self, progress: Optional[Callable[..., None]] = None) -> Dict[str, object]:
+        report = progress or (lambda **kw: None)
+        report(phase="embed", total=len(self._workers), done=0)
+        results = []
+        with self._admin_lock:
+            for i, w in enumerate(list(self._workers)):
+                results.append(self._call_on(w, "build_static_index"))
+                report(done=i + 1)
+        summary = dict(results[0]) if results else {}
+        summary["workers"] = len(results)
+        if results:
+            self.model_version = str(results[-1].get("model_version", self.model_version))
+        return summary
+
+    def activate_all(self, version: str, progress: Optional[Callable[..., None]] = None) -> Dict[str, object]:
+        """
+        2 pha: lần lượt từng worker load + warm bản mới (bớt 1 worker phục vụ trong lúc load),
+        xong hết mới chuyển traffic trên mọi worker (chỉ đổi tham chiếu, vài ms / worker).
+        Load lỗi ở bất kỳ worker nào → chưa worker nào đổi.
+        """
+        import ml_registry
+        report = progress or (lambda **kw: None)
+        with self._admin_lock:
+            workers = list(self._workers)
+            report(phase="load", total=len(workers), done=0)
+            for i, w in enumerate(workers):
+                self._call_on(w, "prepare_cnn", version)
+                report(done=i + 1)
+            report(phase="switch")
+            info: Dict[str, Any] = {}
+            for w in workers:
+                info = self._call_on(w, "commit_cnn")
+            self.model_version = str(info.get("model_version", self.model_version))
+            ml_registry.set_current(version)
+        return {**info, "workers": len(workers)}
+
+    def rollback_all(self) -> Dict[str, object]:
+        import ml_registry
+        info: Dict[str, Any] = {}
+        with self._admin_lock:
+            for w in list(self._workers):
+                info = self._call_on(w, "rollback_cnn", False)
+            self.model_version = str(info.get("model_version", self.model_version))
+            version = (info.get("active") or {}).get("registry_version")
+            if version:
+                ml_registry.set_current(version)
+        return {**info, "workers": len(self._workers)}
+
+    # ---------- trạng thái ----------
+    def _ready_workers(self) -> int:
+        return sum(1 for w in self._workers if w.ready and not w.dead and w.proc.is_alive())
+
+    def is_ready(self) -> bool:
+        # còn ít nhất 1 worker phục vụ được thì vẫn nhận request (worker chết đang được thay)
+        return self._ready_workers() > 0
+
+    def readiness(self) -> Dict[str, object]:
+        return {
+            "ready": self.is_ready(),
+            "ready_workers": self._ready_workers(),
+            "degraded": self._ready_workers() < self.n,
+            "workers": [
+                {"idx": w.idx, "pid": w.proc.pid, "alive": w.proc.is_alive(), "ready": w.ready,
+                 "components": w.info.get("components")}
+                for w in self._workers
+            ],
+            "starting": not self._started.is_set(),
+            "error": self._error,
+            "model_version": self.model_version,
+            "free": self._free.qsize(),
+        }
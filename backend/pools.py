@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class Saturated(Exception):
+    """hàng đợi đã đầy → API trả 503 + Retry-After"""
+
+    def __init__(self, stage: str, retry_after: int = 1):
+        super().__init__(f"{stage} saturated")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor có giới hạn số việc đang chờ + chạy (admission):
+    - quá max_pending thì raise Saturated ngay, không xếp hàng vô hạn
+    - đo thời gian chờ trong queue và thời gian chạy của từng stage
+    Dùng từ handler async: await pool.run(fn, *args)
+    """
+
+    def __init__(self, name: str, workers: int, max_pending: int, retry_after: int = 1):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.max_pending = max(self.workers, int(max_pending))
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"pool-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # thống kê
+        self._done = 0
+        self._rejected = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise Saturated(self.name, self.retry_after)
+            self._pending += 1
+
+    def _release(self, wait: float, run: float, ok: bool) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._done += 1
+            if not ok:
+                self._errors += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._run_total += run
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self._admit()
+        t_submit = time.perf_counter()
+
+        def task():
+            t_start = time.perf_counter()
+            ok = False
+            try:
+                res = fn(*args)
+                ok = True
+                return res
+            finally:
+                self._release(t_start - t_submit, time.perf_counter() - t_start, ok)
+
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(self._pool, task)
+        except RuntimeError:
+            # executor đã shutdown → task không được nhận nên chưa release
+            # (RuntimeError do chính fn raise đã release trong task)
+            with self._lock:
+                self._pending -= 1
+            raise
+        return await fut
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            done = self._done
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "done": done,
+                "rejected": self._rejected,
+                "errors": self._errors,
+                "avg_queue_wait_ms": (self._wait_total / done * 1000.0) if done else 0.0,
+                "max_queue_wait_ms": self._wait_max * 1000.0,
+                "avg_run_ms": (self._run_total / done * 1000.0) if done else 0.0,
+            }
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+_CPUS = os.cpu_count() or 2
+
+# giải mã ảnh (PIL) – CPU-bound
+DECODE_POOL = BoundedExecutor(
+    "decode",
+    workers=_env_int("DECODE_WORKERS", min(4, _CPUS)),
+    max_pending=_env_int("DECODE_MAX_PENDING", 64),
+)
+# pyodbc – blocking I/O
+DB_POOL = BoundedExecutor(
+    "db",
+    workers=_env_int("DB_WORKERS", 8),
+    max_pending=_env_int("DB_MAX_PENDING", 128),
+)
@@ -0,0 +1,149 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# =========================
+#  CẤU HÌNH
+# =========================
+PRED_CACHE_SIZE = int(os.environ.get("PRED_CACHE_SIZE", "2048"))        # 0 = tắt
+PRED_CACHE_TTL = float(os.environ.get("PRED_CACHE_TTL", "3600"))        # giây
+# khớp ảnh nén lại (dHash 64 bit): khoảng cách Hamming tối đa; -1 = tắt
+PRED_CACHE_PHASH_MAXDIST = int(os.environ.get("PRED_CACHE_PHASH_MAXDIST", "-1"))
+
+
+def content_key(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def dhash(arr: np.ndarray) -> int:
+    """difference hash 64 bit từ mảng RGB (H,W,3): xám → 9x8 → so sánh điểm kề nhau"""
+    from PIL import Image
+    gray = Image.fromarray(np.asarray(arr, dtype=np.uint8)).convert("L").resize((9, 8))
+    g = np.asarray(gray, dtype=np.int16)
+    bits = (g[:, 1:] > g[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class PredictionCache:
+    """
+    LRU + TTL cho kết quả classify, khoá theo sha256 nội dung upload.
+    Tuỳ chọn: khớp gần đúng theo dHash (ảnh chuyển tiếp bị nén lại).
+    Mọi entry gắn với model_version; version đổi (reindex / đổi CNN) → xoá sạch.
+    Chỉ get/get_similar (đọc version lúc request bắt đầu) mới chuyển sang version mới;
+    put mang version cũ (request bắt đầu trước khi đổi model) bị bỏ, không xoá cache.
+    """
+
+    def __init__(self, size: int = PRED_CACHE_SIZE, ttl: float = PRED_CACHE_TTL,
+                 phash_maxdist: int = PRED_CACHE_PHASH_MAXDIST):
+        self.size = max(0, int(size))
+        self.ttl = float(ttl)
+        self.phash_maxdist = int(phash_maxdist)
+        self._lock = threading.Lock()
+        # key -> (expires_at, phash, value)
+        self._items: "OrderedDict[str, Tuple[float, Optional[int], Any]]" = OrderedDict()
+        self._version: Optional[str] = None
+
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    @property
+    def phash_enabled(self) -> bool:
+        return self.enabled and self.phash_maxdist >= 0
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            if self._items:
+                self.invalidations += 1
+            self._items.clear()
+            self._version = version
+
+    def get(self, key: str, version: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            item = self._items.get(key)
+            if item is not None and item[0] > now:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[2]
+            if item is not None:
+                del self._items[key]
+            return None
+
+    def get_similar(self, ph: int, version: str) -> Optional[Any]:
+        """tìm entry có dHash cách ph ≤ phash_maxdist bit"""
+        if not self.phash_enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            best_key, best_d = None, self.phash_maxdist + 1
+            for k, (exp, h, _) in self._items.items():
+                if h is None or exp <= now:
+                    continue
+                d = bin(h ^ ph).count("1")
+                if d < best_d:
+                    best_key, best_d = k, d
+            if best_key is None:
+                return None
+            self._items.move_to_end(best_key)
+            self.phash_hits += 1
+            return self._items[best_key][2]
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, version: str, value: Any, ph: Optional[int] = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._version is None:
+                self._version = version
+            elif version != self._version:
+                self.stale_puts += 1
+                return
+            self._items[key] = (time.time() + self.ttl, ph, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            total = self.hits + self.phash_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._items),
+                "max_size": self.size,
+                "ttl_s": self.ttl,
+                "phash_maxdist": self.phash_maxdist,
+                "model_version": self._version,
+                "hits": self.hits,
+                "phash_hits": self.phash_hits,
+                "misses": self.misses,
+                "hit_rate": ((self.hits + self.phash_hits) / total) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
@@ -0,0 +1,180 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# =========================
+#  CẤU HÌNH
+# =========================
+# khoá ký token, bắt buộc ngoài môi trường dev: mọi uvicorn worker / lần restart phải dùng chung
+# APP_ENV=dev: không đặt thì sinh ngẫu nhiên mỗi process (restart → phải đăng nhập lại)
+AUTH_SECRET = os.environ.get("AUTH_SECRET", "")
+APP_ENV = os.environ.get("APP_ENV", "production").lower()
+AUTH_TOKEN_TTL = int(os.environ.get("AUTH_TOKEN_TTL", str(12 * 3600)))     # giây
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))              # giây
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "1024"))            # số user tối đa (LRU)
+# còn chấp nhận header X-User kiểu cũ (app chưa cập nhật)
+AUTH_ALLOW_X_USER = os.environ.get("AUTH_ALLOW_X_USER", "1") == "1"
+
+if not AUTH_SECRET:
+    if APP_ENV != "dev":
+        raise RuntimeError("AUTH_SECRET is not set (required unless APP_ENV=dev); "
+                           "tokens would not verify across workers or restarts")
+    print("[sessions] AUTH_SECRET not set, using a random per-process key (APP_ENV=dev)", flush=True)
+    AUTH_SECRET = secrets.token_urlsafe(32)
+_KEY = AUTH_SECRET.encode("utf-8")
+_PREFIX = "v1"
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _sign(msg: str) -> str:
+    return _b64(hmac.new(_KEY, msg.encode("ascii"), hashlib.sha256).digest())
+
+
+# =========================
+#  THU HỒI
+# =========================
+# lưu trong RAM của từng process: logout / revoke_user chỉ có hiệu lực ở process nhận request
+# (nhiều uvicorn worker hoặc sau restart thì token cũ lại dùng được tới khi hết hạn AUTH_TOKEN_TTL)
+_lock = threading.Lock()
+_revoked: Dict[str, float] = {}          # jti -> exp (hết hạn thì bỏ khỏi danh sách)
+_not_before: Dict[str, float] = {}       # username -> token cấp trước mốc này bị từ chối
+
+
+def revoke(claims: Dict[str, Any]) -> None:
+    """thu hồi 1 token (đăng xuất)"""
+    now = time.time()
+    with _lock:
+        _revoked[claims["jti"]] = float(claims["exp"])
+        for jti in [j for j, exp in _revoked.items() if exp < now]:
+            del _revoked[jti]
+
+
+def revoke_user(username: str) -> None:
+    """thu hồi mọi token đã cấp cho user (đổi quyền, khoá tài khoản)"""
+    with _lock:
+        _not_before[username] = time.time()
+    USERS.invalidate(username)
+
+
+# =========================
+#  TOKEN
+# =========================
+def issue_token(username: str, is_admin: bool, ttl: int = AUTH_TOKEN_TTL) -> Tuple[str, Dict[str, Any]]:
+    """token = v1.<payload>.<HMAC-SHA256>, payload mang sẵn username + quyền admin"""
+    now = time.time()
+    claims = {
+        "sub": username,
+        "adm": bool(is_admin),
+        "iat": now,
+        "exp": int(now + ttl),
+        "jti": secrets.token_urlsafe(12),
+    }
+    payload = _b64(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    msg = f"{_PREFIX}.{payload}"
+    return f"{msg}.{_sign(msg)}", claims
+
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    """kiểm tra chữ ký + hạn + thu hồi, không đụng DB; sai → None"""
+    # token hợp lệ luôn là ASCII (base64url); header lạ → 401 chứ không 500 ở encode/compare_digest
+    if not isinstance(token, str) or not token.isascii():
+        return None
+    try:
+        prefix, payload, sig = token.split(".")
+    except ValueError:
+        return None
+    if prefix != _PREFIX or not hmac.compare_digest(sig, _sign(f"{prefix}.{payload}")):
+        return None
+    try:
+        claims = json.loads(_unb64(payload))
+    except Exception:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    with _lock:
+        if claims.get("jti") in _revoked:
+            return None
+        if claims.get("iat", 0) < _not_before.get(claims.get("sub"), 0):
+            return None
+    return claims
+
+
+def bearer(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+
+# =========================
+#  CACHE TRA CỨU USER
+# =========================
+class UserCache:
+    """
+    TTL + LRU cache cho get_user (đường X-User cũ, /auth/login) để không SELECT mỗi request.
+    Username không tồn tại cũng được cache (chặn dò tên lặp lại) nhưng giới hạn size,
+    nên tên rác do client gửi không làm phình bộ nhớ.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, size: int = USER_CACHE_SIZE):
+        self.ttl = float(ttl)
+        self.size = max(1, int(size))
+        self._lock = threading.Lock()
+        # username -> (expires_at, user)
+        self._items: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, username: str, load: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(username)
+            if item is not None and item[0] > now:
+                self._items.move_to_end(username)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[username]
+            self.misses += 1
+        u = load(username)
+        with self._lock:
+            self._items[username] = (now + self.ttl, u)
+            self._items.move_to_end(username)
+            # bỏ entry hết hạn ở đầu (cũ nhất), rồi cắt theo LRU
+            while self._items:
+                oldest = next(iter(self._items.values()))
+                if oldest[0] > now and len(self._items) <= self.size:
+                    break
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return u
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        with self._lock:
+            if username is None:
+                self._items.clear()
+            else:
+                self._items.pop(username, None)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"size": len(self._items), "max_size": self.size, "ttl_s": self.ttl, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "revoked_tokens": len(_revoked)}
+
+
+USERS = UserCache()
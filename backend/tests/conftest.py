@@ -0,0 +1,6 @@
+import os
+import sys
+
+# chạy trong backend/: python -m pytest tests
+os.environ.setdefault("AUTH_SECRET", "test-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,18 @@
+import pytest
+
+from ml_batcher import MicroBatcher
+
+
+def test_results_are_matched_to_callers():
+    b = MicroBatcher(lambda items, topks: [i * 2 for i in items], max_batch=4, max_wait_ms=20)
+    futures = [b.submit(i) for i in range(6)]
+    assert [f.result(timeout=5) for f in futures] == [0, 2, 4, 6, 8, 10]
+
+
+def test_short_result_list_fails_every_future():
+    b = MicroBatcher(lambda items, topks: list(items)[:-1], max_batch=4, max_wait_ms=50)
+    futures = [b.submit(i) for i in range(3)]
+    for f in futures:
+        with pytest.raises(RuntimeError, match="returned"):
+            f.result(timeout=5)
+    assert b.stats()["errors"] == 3
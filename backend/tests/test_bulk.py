@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from db import queries
+from db.bulk import BulkFormatError, bulk_import, parse_rows
+from db.sqlite_standin import connect, create_schema
+
+
+@pytest.fixture(autouse=True)
+def sqlite_db(tmp_path):
+    path = str(tmp_path / "bulk.sqlite3")
+    create_schema(path)
+    queries.set_connect_factory(lambda: connect(path))
+    yield path
+    queries.set_connect_factory(queries._pyodbc_connect)
+
+
+def _import(data, **kw):
+    return bulk_import(parse_rows(json.dumps(data).encode("utf-8"), fmt="json"), **kw)
+
+
+def test_insert_and_upsert():
+    rep = _import([{"kind": "pest", "Code": "a", "TenThuong": "A"},
+                   {"kind": "drug", "Ten": "x"},
+                   {"kind": "link", "Code": "a", "DrugTen": "x"}])
+    assert rep["committed"] and not rep["errors"]
+    assert rep["pests"] == {"inserted": 1, "updated": 0}
+    assert rep["links"]["inserted"] == 1
+    rep = _import([{"kind": "pest", "Code": "a", "TenThuong": "B"}])
+    assert rep["pests"] == {"inserted": 0, "updated": 1}
+
+
+@pytest.mark.parametrize("row, msg", [
+    ({"kind": "pest", "Code": {"a": 1}}, "Code must be a string"),
+    ({"kind": "drug", "Ten": ["x"]}, "Ten must be a string"),
+    ({"kind": "photo", "Code": "a", "Url": {"u": 1}}, "Url must be a string"),
+    ({"kind": "link", "Code": "a", "DrugTen": {}}, "DrugTen must be a string"),
+    ({"kind": "pest", "Code": "a", "TenThuong": [1]}, "TenThuong must be a string or number"),
+])
+def test_non_scalar_values_are_row_errors(row, msg):
+    rep = _import([row])
+    assert not rep["committed"]
+    assert rep["errors"] == [{"row": 1, "kind": row["kind"], "error": msg}]
+
+
+def test_section_rows_numbered_per_section():
+    rep = _import({"pests": [{"Code": "a"}, {"Code": "a"}], "drugs": [{"Ten": "x"}, {}]})
+    assert [(e["section"], e["row"]) for e in rep["errors"]] == [("drugs", 2), ("pests", 2)]
+
+
+def test_unknown_section_rejected():
+    with pytest.raises(BulkFormatError):
+        parse_rows(b'{"bugs": []}', fmt="json")
+
+
+def test_db_error_reports_failing_row(sqlite_db):
+    import sqlite3
+    raw = sqlite3.connect(sqlite_db)
+    raw.execute("CREATE TRIGGER no_bad BEFORE INSERT ON Drugs WHEN NEW.Nhom = 'bad' "
+                "BEGIN SELECT RAISE(ABORT, 'Nhom rejected'); END")
+    raw.commit()
+    raw.close()
+    rep = _import({"drugs": [{"Ten": "x"}, {"Ten": "y", "Nhom": "bad"}, {"Ten": "z"}]})
+    assert not rep["committed"]
+    assert rep["fatal"] == {"section": "drugs", "row": 2, "kind": "drug", "error": "Nhom rejected"}
+    assert _import([{"kind": "drug", "Ten": "ok"}])["drugs"] == {"inserted": 1, "updated": 0}
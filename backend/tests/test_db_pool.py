@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from db.pool import ConnectionPool, PoolTimeout
+from db.sqlite_standin import connect
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "pool.sqlite3")
+
+
+def _pool(db_path, **kw) -> ConnectionPool:
+    opened = []
+
+    def factory():
+        cn = connect(db_path)
+        opened.append(cn)
+        return cn
+
+    pool = ConnectionPool(factory, **kw)
+    pool.opened = opened
+    return pool
+
+
+def test_fill_opens_min_size(db_path):
+    pool = _pool(db_path, min_size=3, max_size=5, reap_interval=0)
+    assert pool.fill() == 3
+    assert pool.fill() == 0
+    st = pool.stats()
+    assert (st["size"], st["idle"], st["created"]) == (3, 3, 3)
+    # request đầu dùng connection mở sẵn, không connect thêm
+    with pool.acquire() as cn:
+        cn.cursor().execute("SELECT 1")
+    assert pool.stats()["created"] == 3
+    pool.close()
+
+
+def test_release_reuses_connection(db_path):
+    pool = _pool(db_path, min_size=0, max_size=2, reap_interval=0)
+    with pool.acquire():
+        pass
+    with pool.acquire():
+        pass
+    st = pool.stats()
+    assert (st["created"], st["checkouts"], st["idle"]) == (1, 2, 1)
+    pool.close()
+
+
+def test_acquire_timeout(db_path):
+    pool = _pool(db_path, min_size=0, max_size=1, timeout=0.1, reap_interval=0)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    held.close()
+    with pool.acquire():
+        pass
+    pool.close()
+
+
+def test_waiter_gets_released_connection(db_path):
+    pool = _pool(db_path, min_size=0, max_size=1, timeout=5, reap_interval=0.01)
+    held = pool.acquire()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.acquire()))
+    t.start()
+    time.sleep(0.1)
+    held.close()
+    t.join(2)
+    assert got and pool.stats()["waits"] == 1
+    got[0].close()
+    pool.close()
+
+
+def test_idle_eviction_on_release_keeps_min_size(db_path):
+    pool = _pool(db_path, min_size=1, max_size=3, idle_timeout=0.05, reap_interval=0)
+    conns = [pool.acquire() for _ in range(3)]
+    for c in conns[:2]:
+        c.close()
+    time.sleep(0.1)
+    conns[2].close()          # release dọn 2 connection rảnh quá idle_timeout
+    st = pool.stats()
+    assert (st["size"], st["idle"], st["discarded"]) == (1, 1, 2)
+    pool.close()
+
+
+def test_reaper_evicts_on_quiet_pool(db_path):
+    pool = _pool(db_path, min_size=1, max_size=3, idle_timeout=0.05, reap_interval=0.02)
+    conns = [pool.acquire() for _ in range(3)]
+    for c in conns:
+        c.close()
+    time.sleep(0.3)           # không có acquire/release nào, thread nền vẫn đóng
+    assert pool.stats()["size"] == 1
+    pool.close()
+
+
+class _Broken:
+    """connection chết: mọi câu lệnh / rollback đều lỗi"""
+
+    def cursor(self):
+        raise RuntimeError("connection lost")
+
+    def rollback(self):
+        raise RuntimeError("connection lost")
+
+    def close(self):
+        pass
+
+
+def test_broken_connection_discarded_on_release():
+    pool = ConnectionPool(lambda: _Broken(), min_size=0, max_size=1, reap_interval=0)
+    pool.acquire().close()
+    st = pool.stats()
+    assert (st["size"], st["idle"], st["discarded"]) == (0, 0, 1)
+    pool.close()
+
+
+def test_broken_connection_discarded_on_health_check(db_path):
+    pool = _pool(db_path, min_size=0, max_size=1, check_interval=0, reap_interval=0)
+    with pool.acquire():
+        pass
+    pool.opened[0]._raw.close()   # connection đang rảnh trong pool bị đứt
+    with pool.acquire() as cn:
+        cn.cursor().execute("SELECT 1")
+    st = pool.stats()
+    assert (st["health_failures"], st["discarded"], st["created"]) == (1, 1, 2)
+    pool.close()
@@ -0,0 +1,55 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from ingest import UploadLimitMiddleware
+
+LIMIT = 1000
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+
+    @app.post("/classify")
+    def classify(file: UploadFile = File(...)):
+        return {"size": len(file.file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, max_bytes=LIMIT)
+    return TestClient(app)
+
+
+def _multipart(n: int) -> bytes:
+    return (b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"x.jpg\"\r\n"
+            b"Content-Type: image/jpeg\r\n\r\n" + b"x" * n + b"\r\n--b--\r\n")
+
+
+def _chunked(body: bytes, size: int = 256):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+HEADERS = {"content-type": "multipart/form-data; boundary=b"}
+
+
+def test_small_upload_passes():
+    r = _client().post("/classify", content=_multipart(100), headers=HEADERS)
+    assert r.status_code == 200
+    assert r.json() == {"size": 100}
+
+
+def test_content_length_over_limit_is_413():
+    r = _client().post("/classify", content=_multipart(5000), headers=HEADERS)
+    assert r.status_code == 413
+    assert r.json() == {"error": "upload_too_large", "limit": LIMIT}
+
+
+def test_chunked_over_limit_is_413():
+    # không có Content-Length: vượt giới hạn giữa lúc form parser đang đọc
+    r = _client().post("/classify", content=_chunked(_multipart(5000)), headers=HEADERS)
+    assert r.status_code == 413
+    assert r.json() == {"error": "upload_too_large", "limit": LIMIT}
+
+
+def test_chunked_under_limit_passes():
+    r = _client().post("/classify", content=_chunked(_multipart(300)), headers=HEADERS)
+    assert r.status_code == 200
+    assert r.json() == {"size": 300}
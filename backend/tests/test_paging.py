@@ -0,0 +1,52 @@
+import pytest
+
+from db import queries
+from db.pool import ConnectionPool
+from db.sqlite_standin import connect, create_schema
+
+
+@pytest.fixture(autouse=True)
+def sqlite_db(tmp_path):
+    path = str(tmp_path / "paging.sqlite3")
+    create_schema(path)
+    queries.set_connect_factory(lambda: connect(path))
+    yield path
+    queries.set_connect_factory(queries._pyodbc_connect)
+
+
+def _all_pages(page, limit):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = page(limit, cursor)
+        ids += [r["Id"] for r in rows]
+        if not cursor:
+            return ids
+
+
+def test_pest_pages_cover_ties_and_missing_names():
+    names = ["b", None, "a", "b", "", "b", "c", None]
+    for i, name in enumerate(names):
+        ok, _, err = queries.create_pest({"Code": f"p{i}", "TenThuong": name})
+        assert ok, err
+    ids = _all_pages(queries.page_pests, 2)
+    assert len(ids) == len(set(ids)) == len(names)
+    assert ids == [r["Id"] for b in queries.iter_pest_batches(3) for r in b]
+
+
+def test_keyset_seeks_on_raw_column(sqlite_db):
+    sql, params = queries._keyset_sql(queries._PEST_LIST_SELECT, "TenThuong", ("a", 1))
+    cur = connect(sqlite_db).cursor()
+    cur.execute("EXPLAIN QUERY PLAN " + sql, *params)
+    assert "SEARCH Pests USING INDEX IX_Pests_TenThuong" in str(cur.fetchall())
+
+
+def test_stream_uses_one_connection(sqlite_db, monkeypatch):
+    for i in range(7):
+        queries.create_pest({"Code": f"p{i}", "TenThuong": f"n{i % 3}"})
+        queries.add_pest_photo(f"p{i}", f"/img/{i}.jpg")
+    pool = ConnectionPool(lambda: connect(sqlite_db), min_size=0, max_size=1, timeout=0.2)
+    monkeypatch.setattr(queries, "_pool", lambda: pool)
+    batches = list(queries.iter_pest_batches(3))
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert all(len(p["Photos"]) == 1 for b in batches for p in b)
+    assert pool.stats()["created"] == 1
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from pools import BoundedExecutor, Saturated
+
+
+def _fail():
+    raise RuntimeError("boom")
+
+
+def test_runtime_error_from_fn_releases_once():
+    ex = BoundedExecutor("t", workers=1, max_pending=2)
+
+    async def go():
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                await ex.run(_fail)
+
+    asyncio.run(go())
+    assert ex._pending == 0
+
+
+def test_shutdown_executor_releases_admit():
+    ex = BoundedExecutor("t", workers=1, max_pending=1)
+    ex._pool.shutdown()
+
+    async def go():
+        with pytest.raises(RuntimeError):
+            await ex.run(lambda: 1)
+
+    asyncio.run(go())
+    assert ex._pending == 0
+
+
+def test_saturated_over_max_pending():
+    ex = BoundedExecutor("t", workers=1, max_pending=1)
+    ex._admit()
+    with pytest.raises(Saturated):
+        ex._admit()
@@ -0,0 +1,24 @@
+from db.replica import _row_hash
+from db.sqlite_standin import connect
+
+
+def _hashes(rows):
+    cn = connect(":memory:")
+    cur = cn.cursor()
+    cur.execute("CREATE TABLE T (Id INTEGER, A TEXT, B TEXT)")
+    for i, (a, b) in enumerate(rows):
+        cur.execute("INSERT INTO T VALUES (?, ?, ?)", i, a, b)
+    cur.execute(f"SELECT Id, {_row_hash(('A', 'B'))} FROM dbo.T")
+    return [bytes(h) for _, h in cur.fetchall()]
+
+
+def test_row_hash_distinguishes_null_split_and_long_text():
+    rows = [(None, "x"), ("", "x"), ("a:1", "b"), ("a", "1:b"),
+            ("y" * 9000 + "1", None), ("y" * 9000 + "2", None)]
+    hashes = _hashes(rows)
+    assert len(set(hashes)) == len(rows)
+    assert all(len(h) == 32 for h in hashes)
+
+
+def test_row_hash_is_stable():
+    assert _hashes([("a", "b")]) == _hashes([("a", "b")])
@@ -0,0 +1,46 @@
+import sessions
+
+
+def test_roundtrip():
+    token, claims = sessions.issue_token("alice", True)
+    got = sessions.verify_token(token)
+    assert got["sub"] == "alice" and got["adm"] is True and got["jti"] == claims["jti"]
+
+
+def test_non_ascii_token_rejected():
+    token, _ = sessions.issue_token("alice", False)
+    prefix, payload, sig = token.split(".")
+    assert sessions.verify_token(f"{prefix}.é{payload}.{sig}") is None
+    assert sessions.verify_token(f"{prefix}.{payload}.é") is None
+
+
+def test_tampered_token_rejected():
+    token, _ = sessions.issue_token("alice", False)
+    assert sessions.verify_token(token[:-2] + "xx") is None
+    assert sessions.verify_token("v1.a.b") is None
+    assert sessions.verify_token("garbage") is None
+
+
+def test_revoked_token_rejected():
+    token, claims = sessions.issue_token("alice", False)
+    sessions.revoke(claims)
+    assert sessions.verify_token(token) is None
+
+
+def test_user_cache_bounded():
+    cache = sessions.UserCache(ttl=60, size=3)
+    for i in range(10):
+        cache.get(f"nobody{i}", lambda u: None)
+    assert cache.stats()["size"] == 3
+    calls = []
+    cache.get("nobody9", lambda u: calls.append(u))
+    assert calls == []                       # vẫn còn trong cache (mới nhất)
+    cache.get("nobody0", lambda u: calls.append(u))
+    assert calls == ["nobody0"]              # đã bị đẩy ra
+
+
+def test_user_cache_drops_expired():
+    cache = sessions.UserCache(ttl=-1, size=100)
+    for i in range(5):
+        cache.get(f"u{i}", lambda u: {"Username": u})
+    assert cache.stats()["size"] <= 1